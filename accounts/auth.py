@@ -0,0 +1,75 @@
+# accounts/auth.py
+"""
+Password checks off the request thread.
+
+Hashing a password costs tens to hundreds of ms of CPU by design. The
+authentication backend here runs it on a pool of AUTH_HASH_WORKERS threads
+per process (hashlib, argon2-cffi and bcrypt release the GIL), so at most
+that many hashes run at once and the other threads of a threaded or ASGI
+server keep serving. Rehashing after a change of PASSWORD_HASHER or its cost
+happens on the pool too; the new hash is saved by the calling thread.
+AUTH_HASH_WORKERS=0 hashes inline.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model, hashers
+from django.contrib.auth.backends import ModelBackend
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def run_hashing(fn, *args):
+    """fn(*args) on the hashing pool, waiting for its result."""
+    if settings.AUTH_HASH_WORKERS <= 0:
+        return fn(*args)
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.AUTH_HASH_WORKERS, thread_name_prefix="hash"
+            )
+    return _executor.submit(fn, *args).result()
+
+
+def check_password(user, raw_password):
+    """`user.check_password(raw_password)`, hashing on the pool."""
+    rehashed = []
+
+    def verify():
+        return hashers.check_password(
+            raw_password,
+            user.password,
+            setter=lambda raw: rehashed.append(hashers.make_password(raw)),
+        )
+
+    correct = run_hashing(verify)
+    if rehashed:
+        user.password = rehashed[0]
+        # a hash upgrade is not a password change
+        user._password = None
+        user.save(update_fields=["password"])
+    return correct
+
+
+class PooledModelBackend(ModelBackend):
+    """ModelBackend with the password hashing done by run_hashing()."""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # hash once anyway, so unknown usernames take as long (Django #20760)
+            run_hashing(hashers.make_password, password)
+            return None
+        if check_password(user, password) and self.user_can_authenticate(user):
+            return user
+        return None
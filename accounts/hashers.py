@@ -0,0 +1,32 @@
+# accounts/hashers.py
+"""
+Argon2 and bcrypt password hashers whose cost comes from settings
+(ARGON2_TIME_COST / ARGON2_MEMORY_COST / ARGON2_PARALLELISM, BCRYPT_ROUNDS)
+instead of Django's class defaults. The algorithm names are Django's own, so
+hashes stay interchangeable with the stock hashers; a hash made with other
+parameters is rehashed on the next successful login (must_update()).
+"""
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return settings.ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        # KiB
+        return settings.ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.ARGON2_PARALLELISM
+
+
+class BCryptSHA256PasswordHasher(hashers.BCryptSHA256PasswordHasher):
+    @property
+    def rounds(self):
+        return settings.BCRYPT_ROUNDS
@@ -1,6 +1,9 @@
 # accounts/serializers.py
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 
 User = get_user_model()
 
@@ -31,3 +34,19 @@ class RegisterSerializer(serializers.ModelSerializer):
         user.set_password(password)
         user.save()
         return user
+
+
+class StatelessTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refresh without loading the user (AUTH_STATELESS_REFRESH): the refresh
+    token's signature and expiry are all that is checked. A user deactivated
+    or deleted since still gets access tokens until the refresh token expires,
+    but every request made with them is refused by JWTAuthentication, which
+    loads the user. Rotating refresh tokens keeps the stock behaviour.
+    """
+
+    def validate(self, attrs):
+        if not settings.AUTH_STATELESS_REFRESH or jwt_settings.ROTATE_REFRESH_TOKENS:
+            return super().validate(attrs)
+        refresh = self.token_class(attrs["refresh"])
+        return {"access": str(refresh.access_token)}
@@ -1,8 +1,16 @@
 # accounts/tests.py
+from unittest import mock
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.contrib.auth.hashers import make_password
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from heart_monitoring.query_assertions import QueryAssertionsMixin
+
+from . import auth
 
 User = get_user_model()
 
@@ -53,3 +61,83 @@ class AccountsAPITest(TestCase):
         resp = self.client.get(self.profile_url)
         self.assertEqual(resp.status_code, 200)
         self.assertEqual(resp.data["username"], "me")
+
+
+class AccountsQueryCountTest(QueryAssertionsMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_register_queries(self):
+        payload = {"username": "q", "email": "q@example.com", "password": "complexpw123"}
+        # unique username check + insert
+        with self.assertQueries(2, full_scan_tables=["accounts_customuser"]):
+            resp = self.client.post(reverse("account-register"), payload, format="json")
+        self.assertEqual(resp.status_code, 201)
+
+    def test_profile_queries(self):
+        user = User.objects.create_user(username="me", password="pw12345678")
+        token = RefreshToken.for_user(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        # only the JWT user lookup
+        with self.assertQueries(1, full_scan_tables=["accounts_customuser"]):
+            resp = self.client.get(reverse("account-me"))
+        self.assertEqual(resp.status_code, 200)
+
+    def test_refresh_queries(self):
+        user = User.objects.create_user(username="me", password="pw12345678")
+        refresh = str(RefreshToken.for_user(user))
+        # stateless: the user is not loaded
+        with self.assertQueries(0):
+            resp = self.client.post("/api/auth/token/refresh/", {"refresh": refresh})
+        self.assertEqual(resp.status_code, 200)
+
+
+class LoginTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.token_url = "/api/auth/token/"
+
+    @override_settings(
+        PASSWORD_HASHERS=[
+            "django.contrib.auth.hashers.ScryptPasswordHasher",
+            "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+        ]
+    )
+    def test_login_hashes_on_pool_and_rehashes(self):
+        user = User.objects.create(
+            username="old", password=make_password("pw12345678", hasher="pbkdf2_sha1")
+        )
+        with mock.patch.object(auth, "run_hashing", wraps=auth.run_hashing) as run_hashing:
+            resp = self.client.post(
+                self.token_url, {"username": "old", "password": "pw12345678"}, format="json"
+            )
+        self.assertEqual(resp.status_code, 200)
+        run_hashing.assert_called_once()
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith("scrypt$"))
+        # the new hash works, and is not rehashed again
+        resp = self.client.post(
+            self.token_url, {"username": "old", "password": "pw12345678"}, format="json"
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(User.objects.get(pk=user.pk).password, user.password)
+
+    def test_wrong_password_and_unknown_user(self):
+        User.objects.create_user(username="known", password="pw12345678")
+        for username, password in (("known", "wrong-password"), ("unknown", "pw12345678")):
+            resp = self.client.post(
+                self.token_url, {"username": username, "password": password}, format="json"
+            )
+            self.assertEqual(resp.status_code, 401)
+
+    def test_inactive_user_refreshes_but_cannot_use_tokens(self):
+        user = User.objects.create_user(username="gone", password="pw12345678")
+        refresh = str(RefreshToken.for_user(user))
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        resp = self.client.post("/api/auth/token/refresh/", {"refresh": refresh})
+        self.assertEqual(resp.status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {resp.data['access']}")
+        self.assertEqual(self.client.get("/api/accounts/me/").status_code, 401)
+        with override_settings(AUTH_STATELESS_REFRESH=False):
+            resp = self.client.post("/api/auth/token/refresh/", {"refresh": refresh})
+        self.assertEqual(resp.status_code, 401)
@@ -6,17 +6,27 @@ if [ "$DATABASE_URL" ]; then
   echo "DATABASE_URL set — will attempt migrations"
 fi
 
-# migrate
-echo "Running migrations..."
-python manage.py migrate --noinput
-
-# collectstatic
-echo "Collecting static files..."
-python manage.py collectstatic --noinput
-
 # create superuser if env vars provided (optional)
-if [ -n "$DJANGO_SUPERUSER_USERNAME" ] && [ -n "$DJANGO_SUPERUSER_PASSWORD" ]; then
-  python manage.py createsuperuser --noinput || echo "superuser exists or cannot create"
+create_superuser() {
+  if [ -n "$DJANGO_SUPERUSER_USERNAME" ] && [ -n "$DJANGO_SUPERUSER_PASSWORD" ]; then
+    python manage.py createsuperuser --noinput || echo "superuser exists or cannot create"
+  fi
+}
+
+# "serve": migrate / collectstatic when needed, then start the app server sized
+# from the container's CPUs and memory (see heart_monitoring/launcher.py).
+# SERVER_MODE=wsgi (gunicorn, preloaded, default) or asgi (uvicorn, async views at
+# /api/patients/async/...); WEB_WORKERS / WEB_THREADS override the sizing.
+if [ "$1" = "serve" ]; then
+  if [ -n "$DJANGO_SUPERUSER_USERNAME" ]; then
+    python -m heart_monitoring.launcher prepare
+    create_superuser
+    export SKIP_MIGRATE=1 SKIP_COLLECTSTATIC=1
+  fi
+  exec python -m heart_monitoring.launcher serve
 fi
 
+python -m heart_monitoring.launcher prepare
+create_superuser
+
 exec "$@"
@@ -0,0 +1,77 @@
+# heart_monitoring/docs.py
+"""
+API docs views that keep drf-spectacular out of serving processes: docs views
+imported on first request, and the precomputed schema file (API_DOCS=static).
+"""
+
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.module_loading import import_string
+from django.views.decorators.http import require_safe
+
+SCHEMA_MAX_AGE = 300
+
+_lock = threading.Lock()
+# (path, mtime) -> (body, etag) of the schema file last served
+_schema = {}
+
+
+def lazy_view(dotted_path, **initkwargs):
+    """View that imports the class-based view `dotted_path` on its first request."""
+    view = None
+
+    def dispatch(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            view = import_string(dotted_path).as_view(**initkwargs)
+        return view(request, *args, **kwargs)
+
+    # read-only docs views; DRF views are csrf exempt as well
+    dispatch.csrf_exempt = True
+    return dispatch
+
+
+def write_schema_file(path=None):
+    """Generate the OpenAPI schema into `path` (default OPENAPI_SCHEMA_FILE)."""
+    from django.core.management import call_command
+
+    path = path or settings.OPENAPI_SCHEMA_FILE
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    call_command("spectacular", file=path, validate=False)
+    return path
+
+
+def load_schema_file():
+    path = settings.OPENAPI_SCHEMA_FILE
+    with _lock:
+        if not os.path.exists(path):
+            # not precomputed (see launcher): generate once for this process
+            write_schema_file(path)
+        key = (path, os.stat(path).st_mtime_ns)
+        if key not in _schema:
+            with open(path, "rb") as f:
+                body = f.read()
+            _schema.clear()
+            _schema[key] = (body, f'"{hashlib.md5(body).hexdigest()}"')
+        return _schema[key]
+
+
+@require_safe
+def schema_file(request):
+    body, etag = load_schema_file()
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        content_type = (
+            "application/json"
+            if settings.OPENAPI_SCHEMA_FILE.endswith(".json")
+            else "application/vnd.oai.openapi"
+        )
+        response = HttpResponse(body, content_type=content_type)
+    response["ETag"] = etag
+    patch_cache_control(response, public=True, max_age=SCHEMA_MAX_AGE)
+    return response
@@ -0,0 +1,372 @@
+# heart_monitoring/launcher.py
+"""
+Production launcher used by entrypoint.sh:
+
+    python -m heart_monitoring.launcher serve      # prepare, then run the app server
+    python -m heart_monitoring.launcher prepare    # migrate / collectstatic only
+    python -m heart_monitoring.launcher plan       # print the computed server sizing
+
+- Workers/threads are sized from the CPUs and memory available to the
+  container (cgroup limits first, then the host); WEB_WORKERS / WEB_THREADS
+  override.
+- `migrate` only runs when the database has unapplied migrations and
+  `collectstatic` only when the checksum of the static sources differs from
+  the one recorded in STATIC_ROOT by the last run.
+- wsgi mode runs gunicorn in-process with `--preload`: the app is imported
+  once in the master, its database connections are closed before forking and
+  each worker opens its own.
+- With API_DOCS=static the OpenAPI schema file is generated if missing.
+- The recent-readings ring buffers (patients.recent) are warmed while loading
+  the app, i.e. once in the master with `--preload`.
+- The worker count is exported as WEB_PROCESSES: settings then default to a
+  cache shared by the workers and refuse per-process ones (see settings).
+- Startup time is reported per phase.
+"""
+
+import argparse
+import hashlib
+import math
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# memory a worker process is budgeted (RSS after serving traffic), in MB
+WORKER_MEMORY_MB = 150
+# share of the available memory the workers may use
+MEMORY_HEADROOM = 0.8
+STATIC_CHECKSUM_FILE = ".sources.sha256"
+
+
+class Phases:
+    """Wall time of each startup phase, printed as one line."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings = []
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        note = {}
+        try:
+            yield note
+        finally:
+            self.timings.append((name, time.perf_counter() - started, note.get("note")))
+
+    def report(self):
+        parts = [
+            f"{name}={seconds:.2f}s" + (f" ({note})" if note else "")
+            for name, seconds, note in self.timings
+        ]
+        total = time.perf_counter() - self.started
+        return f"startup: {' '.join(parts)} total={total:.2f}s"
+
+
+def read_first_line(path):
+    try:
+        with open(path) as f:
+            return f.readline().strip()
+    except OSError:
+        return None
+
+
+def available_cpus():
+    """CPUs this process may use: cgroup quota, else affinity mask, else count."""
+    quota = read_first_line("/sys/fs/cgroup/cpu.max")  # cgroup v2: "max 100000"
+    if quota and not quota.startswith("max"):
+        limit, period = quota.split()
+        return max(1, math.floor(int(limit) / int(period)))
+    limit = read_first_line("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")  # cgroup v1
+    period = read_first_line("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if limit and period and int(limit) > 0:
+        return max(1, math.floor(int(limit) / int(period)))
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def available_memory_mb():
+    """Memory limit of the container (cgroup), else MemAvailable; None if unknown."""
+    for path in (
+        "/sys/fs/cgroup/memory.max",
+        "/sys/fs/cgroup/memory/memory.limit_in_bytes",
+    ):
+        limit = read_first_line(path)
+        # v1 reports "no limit" as a huge number
+        if limit and limit.isdigit() and int(limit) < 1 << 60:
+            return int(limit) // (1 << 20)
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return None
+
+
+def size_workers(
+    cpus, memory_mb, worker_memory_mb=WORKER_MEMORY_MB, workers=None, threads=None
+):
+    """
+    Return (workers, threads).
+
+    Targets 2 * cpus + 1 concurrent requests. Processes are capped by memory;
+    when the cap bites, the missing concurrency is made up with threads, which
+    share one process's memory.
+    """
+    target = 2 * cpus + 1
+    if workers is None:
+        workers = target
+        if memory_mb is not None:
+            budget = int(memory_mb * MEMORY_HEADROOM) // worker_memory_mb
+            workers = min(workers, max(1, budget))
+    if threads is None:
+        threads = max(1, math.ceil(target / workers))
+    return workers, threads
+
+
+def optional_int(value):
+    return int(value) if value not in (None, "", "auto") else None
+
+
+def pending_migrations():
+    from django.db import connection
+    from django.db.migrations.executor import MigrationExecutor
+
+    executor = MigrationExecutor(connection)
+    return executor.migration_plan(executor.loader.graph.leaf_nodes())
+
+
+def static_sources_checksum():
+    """sha256 over the path and contents of every file collectstatic would copy."""
+    from django.contrib.staticfiles.finders import get_finders
+
+    digest = hashlib.sha256()
+    files = {}
+    for finder in get_finders():
+        for path, storage in finder.list([]):
+            # first finder wins, as in collectstatic
+            files.setdefault(path, storage)
+    for path in sorted(files):
+        digest.update(path.encode())
+        with files[path].open(path) as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def migrate(phases):
+    from django.core.management import call_command
+
+    with phases.phase("migrate") as note:
+        plan = pending_migrations()
+        if not plan:
+            note["note"] = "up to date"
+            return
+        call_command("migrate", interactive=False, verbosity=1)
+        note["note"] = f"{len(plan)} applied"
+
+
+def collectstatic(phases):
+    from django.conf import settings
+    from django.core.management import call_command
+
+    with phases.phase("collectstatic") as note:
+        marker = os.path.join(settings.STATIC_ROOT, STATIC_CHECKSUM_FILE)
+        checksum = static_sources_checksum()
+        if read_first_line(marker) == checksum:
+            note["note"] = "unchanged"
+            return
+        call_command("collectstatic", interactive=False, verbosity=0)
+        with open(marker, "w") as f:
+            f.write(checksum + "\n")
+        note["note"] = "collected"
+
+
+def schema(phases):
+    from django.conf import settings
+
+    if settings.API_DOCS != "static" or os.path.exists(settings.OPENAPI_SCHEMA_FILE):
+        return
+    from heart_monitoring.docs import write_schema_file
+
+    with phases.phase("schema") as note:
+        write_schema_file()
+        note["note"] = "generated"
+
+
+def prepare(options, phases):
+    import django
+
+    with phases.phase("setup"):
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", "heart_monitoring.settings")
+        django.setup()
+    if not options.skip_migrate:
+        migrate(phases)
+    if not options.skip_collectstatic:
+        collectstatic(phases)
+    schema(phases)
+
+
+def warm(phases):
+    from django.conf import settings
+
+    if not settings.RECENT_READINGS_ENABLED:
+        return
+    from patients.recent import recent_readings
+
+    with phases.phase("warm") as note:
+        note["note"] = f"{recent_readings.warm()} patients"
+
+
+def close_connections():
+    from django.db import connections
+
+    connections.close_all()
+
+
+def discard_inherited_connections(server, worker):
+    # gunicorn post_fork hook: forget (don't close) any handle inherited from
+    # the master, closing would terminate the master's session too
+    from django.db import connections
+
+    for conn in connections.all(initialized_only=True):
+        conn.connection = None
+
+
+def run_gunicorn(options, phases, workers, threads):
+    from gunicorn.app.base import BaseApplication
+
+    class Application(BaseApplication):
+        def load_config(self):
+            config = {
+                "bind": options.bind,
+                "workers": workers,
+                "threads": threads,
+                "worker_class": "gthread" if threads > 1 else "sync",
+                "preload_app": options.preload,
+                "post_fork": discard_inherited_connections,
+                "timeout": options.timeout,
+            }
+            for key, value in config.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            with phases.phase("import app"):
+                from django.urls import get_resolver
+
+                from heart_monitoring.wsgi import application
+
+                # Django loads the URLconf (views, serializers, ...) on the
+                # first request; do it before forking so workers share it
+                get_resolver().url_patterns
+            warm(phases)
+            # nothing opened while loading may leak into the workers
+            close_connections()
+            if options.preload:
+                print(phases.report(), file=sys.stderr, flush=True)
+            return application
+
+    if not options.preload:
+        # every worker imports the app itself
+        print(phases.report(), file=sys.stderr, flush=True)
+    Application().run()
+
+
+def run_uvicorn(options, phases, workers):
+    import uvicorn
+
+    host, _, port = options.bind.rpartition(":")
+    print(phases.report(), file=sys.stderr, flush=True)
+    # uvicorn imports the app in every worker; there is no preload
+    uvicorn.run(
+        "heart_monitoring.asgi:application",
+        host=host,
+        port=int(port),
+        workers=workers,
+        log_level="info",
+    )
+
+
+def env_flag(name, default=""):
+    return os.environ.get(name, default).lower() in ("1", "true", "yes")
+
+
+def parse_args(argv):
+    env = os.environ
+    parser = argparse.ArgumentParser(prog="python -m heart_monitoring.launcher")
+    parser.add_argument(
+        "command", nargs="?", default="serve", choices=("serve", "prepare", "plan")
+    )
+    parser.add_argument(
+        "--mode", choices=("wsgi", "asgi"), default=env.get("SERVER_MODE", "wsgi")
+    )
+    parser.add_argument("--bind", default=env.get("WEB_BIND", "0.0.0.0:8000"))
+    parser.add_argument("--workers", default=env.get("WEB_WORKERS"))
+    parser.add_argument("--threads", default=env.get("WEB_THREADS"))
+    parser.add_argument(
+        "--worker-memory-mb",
+        type=int,
+        default=int(env.get("WEB_WORKER_MEMORY_MB", WORKER_MEMORY_MB)),
+    )
+    parser.add_argument("--timeout", type=int, default=int(env.get("WEB_TIMEOUT", "30")))
+    parser.add_argument(
+        "--no-preload",
+        dest="preload",
+        action="store_false",
+        default=env_flag("WEB_PRELOAD", "True"),
+    )
+    parser.add_argument(
+        "--skip-migrate", action="store_true", default=env_flag("SKIP_MIGRATE")
+    )
+    parser.add_argument(
+        "--skip-collectstatic", action="store_true", default=env_flag("SKIP_COLLECTSTATIC")
+    )
+    options = parser.parse_args(argv)
+    # "auto" / unset: sized from the machine
+    options.workers = optional_int(options.workers)
+    options.threads = optional_int(options.threads)
+    return options
+
+
+def main(argv=None):
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    cpus, memory_mb = available_cpus(), available_memory_mb()
+    workers, threads = size_workers(
+        cpus, memory_mb, options.worker_memory_mb, options.workers, options.threads
+    )
+    if options.mode == "asgi":
+        threads = 1  # concurrency comes from the event loop
+    print(
+        f"sizing: cpus={cpus} memory={memory_mb}MB -> mode={options.mode} "
+        f"workers={workers} threads={threads} preload={options.preload}",
+        file=sys.stderr,
+        flush=True,
+    )
+    if options.command == "plan":
+        return
+
+    if options.command == "serve":
+        os.environ["WEB_PROCESSES"] = str(workers)
+    from django.core.exceptions import ImproperlyConfigured
+
+    phases = Phases()
+    try:
+        prepare(options, phases)
+    except ImproperlyConfigured as exc:
+        sys.exit(f"launcher: {exc}")
+    if options.command == "prepare":
+        print(phases.report(), file=sys.stderr, flush=True)
+        return
+    # the app server re-imports what it needs; nothing from prepare is shared
+    close_connections()
+    if options.mode == "asgi":
+        run_uvicorn(options, phases, workers)
+    else:
+        run_gunicorn(options, phases, workers, threads)
+
+
+if __name__ == "__main__":
+    main()
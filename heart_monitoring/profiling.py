@@ -0,0 +1,333 @@
+# heart_monitoring/profiling.py
+"""
+On-demand profiles of single requests, for staff (PROFILING_ENABLED).
+
+A request sent by a staff user with `X-Profile: cprofile|sample` (or
+`?profile=cprofile|sample`) runs under cProfile or a sampling profiler that
+records the request thread's stack every PROFILING_SAMPLE_INTERVAL seconds,
+and every SQL statement it executes is recorded with its duration (never its
+parameters). The capture is written to PROFILING_DIR as `<id>.json` (request,
+status, timings, SQL) next to `<id>.prof` (pstats) or `<id>.stacks`
+(collapsed stacks); only the newest PROFILING_MAX_CAPTURES are kept. The
+response carries `X-Profile-Id: <id>`.
+
+Staff list captures at GET /api/profiles/ (and one at /api/profiles/<id>/);
+`manage.py render_profile <id>` prints collapsed stacks ("a;b;c 42") for
+flamegraph.pl or speedscope.
+
+The middleware is only installed with PROFILING_ENABLED; then requests
+without the flag cost one header lookup. JWT clients are authenticated by the
+middleware itself, for flagged requests only. SQL run by async views in
+worker threads is not captured.
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import Http404
+from rest_framework import permissions
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+MODES = ("cprofile", "sample")
+# UTC timestamp to the microsecond, so ids sort by age
+CAPTURE_ID = re.compile(r"^[0-9]{20}-[0-9a-f]{8}$")
+# longest SQL text stored per statement
+SQL_MAX_LENGTH = 2000
+
+
+def requested_mode(request):
+    """The profiling mode asked for by `request`, or None."""
+    flag = request.headers.get("X-Profile") or request.GET.get("profile")
+    if not flag:
+        return None
+    flag = flag.lower()
+    return flag if flag in MODES else "cprofile"
+
+
+def staff_user(request):
+    """The staff user sending `request` (session or JWT), or None."""
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        try:
+            result = JWTAuthentication().authenticate(request)
+        except APIException:
+            return None
+        user = result[0] if result else None
+    return user if user is not None and user.is_staff else None
+
+
+class Sampler:
+    """Counts the stacks of one thread, sampled from a background thread."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self._target = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+
+def frame_label(code):
+    filename = code.co_filename
+    if filename.startswith(str(settings.BASE_DIR)):
+        filename = os.path.relpath(filename, settings.BASE_DIR)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class Capture:
+    """Profile and SQL of one request, used as a context manager."""
+
+    def __init__(self, mode):
+        self.mode = mode
+        now = time.time()
+        stamp = time.strftime("%Y%m%d%H%M%S", time.gmtime(now))
+        self.id = f"{stamp}{int(now * 1e6) % 1000000:06d}-{uuid.uuid4().hex[:8]}"
+        self.queries = []
+        self._stack = ExitStack()
+
+    def __enter__(self):
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self._record_sql))
+        if self.mode == "sample":
+            self.profiler = Sampler(settings.PROFILING_SAMPLE_INTERVAL)
+            self.profiler.start()
+        else:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.duration = time.perf_counter() - self.started
+        if self.mode == "sample":
+            self.profiler.stop()
+        else:
+            self.profiler.disable()
+        self._stack.close()
+
+    def _record_sql(self, execute, sql, params, many, context):
+        began = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(
+                {
+                    "alias": context["connection"].alias,
+                    "sql": sql[:SQL_MAX_LENGTH],
+                    "many": many,
+                    "ms": round((time.perf_counter() - began) * 1000, 3),
+                }
+            )
+
+    def save(self, request, user, response):
+        """Write the capture to PROFILING_DIR and tag `response` with its id."""
+        directory = settings.PROFILING_DIR
+        os.makedirs(directory, exist_ok=True)
+        if self.mode == "sample":
+            with open(os.path.join(directory, f"{self.id}.stacks"), "w") as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in self.profiler.stacks.items())
+        else:
+            self.profiler.dump_stats(os.path.join(directory, f"{self.id}.prof"))
+        meta = {
+            "id": self.id,
+            "mode": self.mode,
+            "method": request.method,
+            "path": request.get_full_path(),
+            "user": user.get_username(),
+            "status": response.status_code,
+            "duration_ms": round(self.duration * 1000, 3),
+            "query_count": len(self.queries),
+            "sql_ms": round(sum(query["ms"] for query in self.queries), 3),
+            "created_at": time.time(),
+            "queries": self.queries,
+        }
+        with open(os.path.join(directory, f"{self.id}.json"), "w") as f:
+            json.dump(meta, f)
+        prune(directory, settings.PROFILING_MAX_CAPTURES)
+        response["X-Profile-Id"] = self.id
+        return response
+
+
+class ProfilingMiddleware:
+    """Profiles requests flagged by staff users; see the module docstring."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        mode = requested_mode(request)
+        user = mode and staff_user(request)
+        if not user:
+            return self.get_response(request)
+        with Capture(mode) as capture:
+            response = self.get_response(request)
+        return capture.save(request, user, response)
+
+    async def __acall__(self, request):
+        mode = requested_mode(request)
+        user = mode and await sync_to_async(staff_user)(request)
+        if not user:
+            return await self.get_response(request)
+        with Capture(mode) as capture:
+            response = await self.get_response(request)
+        return await sync_to_async(capture.save)(request, user, response)
+
+
+def capture_ids(directory=None):
+    """Ids of the stored captures, newest first."""
+    directory = directory or settings.PROFILING_DIR
+    if not os.path.isdir(directory):
+        return []
+    ids = {name.split(".")[0] for name in os.listdir(directory) if name.endswith(".json")}
+    return sorted((i for i in ids if CAPTURE_ID.match(i)), reverse=True)
+
+
+def prune(directory, keep):
+    for capture_id in capture_ids(directory)[keep:]:
+        for suffix in (".json", ".prof", ".stacks"):
+            try:
+                os.remove(os.path.join(directory, capture_id + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def load_capture(capture_id):
+    """The metadata of a capture; raises LookupError for unknown ids."""
+    if not CAPTURE_ID.match(capture_id or ""):
+        raise LookupError(capture_id)
+    try:
+        with open(os.path.join(settings.PROFILING_DIR, f"{capture_id}.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise LookupError(capture_id)
+
+
+def collapsed_stacks(capture_id, min_share=0.001):
+    """
+    {"a;b;c": weight} of a capture: sample counts, or microseconds estimated
+    for cProfile captures by splitting each call edge's cumulative time across
+    its callees (cProfile keeps callers, not whole stacks). Paths holding less
+    than `min_share` of the total are dropped.
+    """
+    meta = load_capture(capture_id)
+    directory = settings.PROFILING_DIR
+    if meta["mode"] == "sample":
+        stacks = Counter()
+        with open(os.path.join(directory, f"{capture_id}.stacks")) as f:
+            for line in f:
+                stack, _, count = line.rstrip("\n").rpartition(" ")
+                stacks[stack] += int(count)
+        return stacks
+
+    stats = pstats.Stats(os.path.join(directory, f"{capture_id}.prof")).stats
+    callees = defaultdict(dict)
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees[caller][func] = edge
+    roots = [func for func, entry in stats.items() if not entry[4]]
+    total = sum(stats[func][3] for func in roots) or 1
+    stacks = Counter()
+
+    def label(func):
+        filename, line, name = func
+        if filename.startswith(str(settings.BASE_DIR)):
+            filename = os.path.relpath(filename, settings.BASE_DIR)
+        return f"{name} ({filename}:{line})" if line else name
+
+    def walk(func, path, labels, cumulative):
+        # `cumulative`: seconds of `func` (with callees) spent on this path
+        own = stats[func][2] * cumulative / stats[func][3] if stats[func][3] else 0
+        stacks[";".join(labels)] += round(own * 1e6)
+        for callee, edge in callees[func].items():
+            share = edge[3] * cumulative / stats[func][3] if stats[func][3] else 0
+            if callee in path or share < min_share * total:
+                continue
+            walk(callee, path | {callee}, [*labels, label(callee)], share)
+
+    for root in roots:
+        if stats[root][3] >= min_share * total:
+            walk(root, {root}, [label(root)], stats[root][3])
+    return +stacks
+
+
+class ProfileListView(APIView):
+    """
+    GET /api/profiles/ (staff only)
+    Stored request profiles, newest first, without their SQL.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+    # operator tooling, not part of the documented API
+    schema = None
+
+    def get(self, request):
+        captures = []
+        for capture_id in capture_ids():
+            try:
+                meta = load_capture(capture_id)
+            except LookupError:
+                # pruned meanwhile
+                continue
+            meta.pop("queries", None)
+            captures.append(meta)
+        return Response(captures)
+
+
+class ProfileDetailView(APIView):
+    """
+    GET /api/profiles/<id>/ (staff only)
+    One profile with its SQL; `?stacks=1` adds the heaviest collapsed stacks.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+    # operator tooling, not part of the documented API
+    schema = None
+
+    def get(self, request, capture_id):
+        try:
+            meta = load_capture(capture_id)
+        except LookupError:
+            raise Http404
+        if request.query_params.get("stacks"):
+            meta["stacks"] = dict(collapsed_stacks(capture_id).most_common(50))
+        return Response(meta)
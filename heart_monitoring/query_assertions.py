@@ -0,0 +1,80 @@
+# heart_monitoring/query_assertions.py
+"""
+Test helpers that make performance regressions fail like correctness bugs:
+exact SQL query counts per request plus a check that no captured query plans a
+full scan of the big tables.
+"""
+
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+def full_scan_markers(vendor, table):
+    if vendor == "postgresql":
+        return (f"Seq Scan on {table}",)
+    # sqlite: "SCAN <table>" without "USING ... INDEX" reads every row
+    return (f"SCAN {table}\n",)
+
+
+def explain(connection, sql):
+    prefix = "EXPLAIN QUERY PLAN " if connection.vendor == "sqlite" else "EXPLAIN "
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql)
+        rows = cursor.fetchall()
+    # sqlite rows are (id, parent, notused, detail), postgres rows are (line,)
+    return "\n".join(str(row[-1]) for row in rows) + "\n"
+
+
+def find_full_scans(connection, statements, tables):
+    """
+    Return (sql, plan) pairs for every SELECT in `statements` whose plan scans
+    one of `tables` sequentially.
+    """
+    if connection.vendor not in ("sqlite", "postgresql"):
+        return []
+    found = []
+    for sql in statements:
+        if not sql.lstrip().upper().startswith("SELECT"):
+            continue
+        if not any(table in sql for table in tables):
+            continue
+        plan = explain(connection, sql)
+        for table in tables:
+            if any(m in plan for m in full_scan_markers(connection.vendor, table)):
+                found.append((sql, plan))
+                break
+    return found
+
+
+class QueryAssertionsMixin:
+    """
+    Mixin for TestCase classes.
+
+        with self.assertQueries(2, full_scan_tables=["patients_heartrate"]):
+            self.client.get(url)
+    """
+
+    @contextmanager
+    def assertQueries(self, num, full_scan_tables=(), using=DEFAULT_DB_ALIAS):
+        connection = connections[using]
+        with CaptureQueriesContext(connection) as ctx:
+            yield ctx
+        statements = [q["sql"] for q in ctx.captured_queries]
+        self.assertEqual(
+            len(statements),
+            num,
+            "%d queries executed, %d expected\n%s"
+            % (
+                len(statements),
+                num,
+                "\n".join(f"{i}. {sql}" for i, sql in enumerate(statements, 1)),
+            ),
+        )
+        scans = find_full_scans(connection, statements, full_scan_tables)
+        self.assertFalse(
+            scans,
+            "full table scan planned:\n"
+            + "\n".join(f"{sql}\n{plan}" for sql, plan in scans),
+        )
@@ -10,10 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import importlib.util
 import os
 from datetime import timedelta
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 # load .env if present (useful in local docker dev)
@@ -40,18 +42,31 @@ ALLOWED_HOSTS = [h.strip() for h in allowed.split(",")] if allowed else ["*"]
 
 # Application definition
 
+# API docs: "dynamic" (drf-spectacular generates the schema on every request),
+# "static" (schema precomputed into OPENAPI_SCHEMA_FILE and served from it) or
+# "off". Swagger/Redoc are imported on first use. Device-facing processes can run
+# with API_DOCS=off and ADMIN_ENABLED=False so neither drf-spectacular nor the
+# admin is imported at all; docs/admin are then served by designated processes.
+API_DOCS = os.environ.get("API_DOCS", "dynamic")
+OPENAPI_SCHEMA_FILE = os.environ.get(
+    "OPENAPI_SCHEMA_FILE", str(BASE_DIR / ".cache" / "openapi.yaml")
+)
+ADMIN_ENABLED = os.environ.get("ADMIN_ENABLED", "True").lower() in ("1", "true", "yes")
+
 INSTALLED_APPS = [
-    "django.contrib.admin",
     "django.contrib.auth",
     "django.contrib.contenttypes",
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
     "rest_framework",
-    "drf_spectacular",
     "accounts",
     "patients",
 ]
+if ADMIN_ENABLED:
+    INSTALLED_APPS.insert(0, "django.contrib.admin")
+if API_DOCS != "off":
+    INSTALLED_APPS.append("drf_spectacular")
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
@@ -119,6 +134,39 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing (accounts.hashers): PASSWORD_HASHER hashes new and changed
+# passwords: pbkdf2 (Django's default), argon2 (needs argon2-cffi), bcrypt
+# (needs bcrypt) or scrypt. The others still verify existing hashes, which are
+# rehashed on the next login, as are hashes of another cost. ARGON2_* (memory
+# in KiB) and BCRYPT_ROUNDS set the cost: lower is faster logins, and cheaper
+# guessing should the hashes leak.
+PASSWORD_HASHER = os.environ.get("PASSWORD_HASHER", "pbkdf2")
+_password_hashers = {
+    "pbkdf2": "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+    "argon2": "accounts.hashers.Argon2PasswordHasher",
+    "bcrypt": "accounts.hashers.BCryptSHA256PasswordHasher",
+    "scrypt": "django.contrib.auth.hashers.ScryptPasswordHasher",
+}
+if PASSWORD_HASHER not in _password_hashers:
+    raise ImproperlyConfigured(f"PASSWORD_HASHER must be one of {', '.join(_password_hashers)}.")
+if PASSWORD_HASHER in ("argon2", "bcrypt") and importlib.util.find_spec(PASSWORD_HASHER) is None:
+    raise ImproperlyConfigured(f"PASSWORD_HASHER={PASSWORD_HASHER} needs its package installed.")
+PASSWORD_HASHERS = [
+    _password_hashers[PASSWORD_HASHER],
+    *(path for name, path in _password_hashers.items() if name != PASSWORD_HASHER),
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+]
+ARGON2_TIME_COST = int(os.environ.get("ARGON2_TIME_COST", "2"))
+ARGON2_MEMORY_COST = int(os.environ.get("ARGON2_MEMORY_COST", "19456"))
+ARGON2_PARALLELISM = int(os.environ.get("ARGON2_PARALLELISM", "1"))
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "10"))
+
+# Password checks run on a pool of this many threads per process (accounts.auth):
+# a burst of logins hashes at most this many passwords at once, leaving CPU to
+# the other requests of a threaded or ASGI server; 0 = hash inline
+AUTH_HASH_WORKERS = int(os.environ.get("AUTH_HASH_WORKERS", "2"))
+AUTHENTICATION_BACKENDS = ["accounts.auth.PooledModelBackend"]
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
@@ -139,6 +187,32 @@ USE_TZ = True
 MIDDLEWARE.insert(
     1, "whitenoise.middleware.WhiteNoiseMiddleware"
 )  # just after SecurityMiddleware
+# negotiated gzip/br/zstd compression of API responses; outermost, so it sees
+# the final body (heart_monitoring/compression.py)
+MIDDLEWARE.insert(0, "heart_monitoring.compression.CompressionMiddleware")
+RESPONSE_COMPRESSION_ENABLED = os.environ.get(
+    "RESPONSE_COMPRESSION_ENABLED", "True"
+).lower() in ("1", "true", "yes")
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.environ.get("RESPONSE_COMPRESSION_MIN_SIZE", "1024"))
+# server preference; br/zstd are used only when `brotli` / `zstandard` are installed
+RESPONSE_COMPRESSION_ENCODINGS = os.environ.get(
+    "RESPONSE_COMPRESSION_ENCODINGS", "zstd,br,gzip"
+).split(",")
+# Staff-only per-request profiling (heart_monitoring/profiling.py): requests
+# flagged with `X-Profile: cprofile|sample` are profiled and their SQL recorded;
+# the newest PROFILING_MAX_CAPTURES captures are kept in PROFILING_DIR. Off,
+# the middleware is not installed at all.
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "False").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+PROFILING_DIR = os.environ.get("PROFILING_DIR", str(BASE_DIR / ".cache" / "profiles"))
+PROFILING_MAX_CAPTURES = int(os.environ.get("PROFILING_MAX_CAPTURES", "50"))
+PROFILING_SAMPLE_INTERVAL = float(os.environ.get("PROFILING_SAMPLE_INTERVAL", "0.001"))
+if PROFILING_ENABLED:
+    # innermost, after authentication, so session users are known
+    MIDDLEWARE.append("heart_monitoring.profiling.ProfilingMiddleware")
 STATIC_ROOT = BASE_DIR / "staticfiles"
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 
@@ -177,21 +251,213 @@ REST_FRAMEWORK = {
     ),
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.LimitOffsetPagination",
     "PAGE_SIZE": 25,
-    # drf-spectacular: use its AutoSchema for generating schema
-    "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
 }
+if API_DOCS != "off":
+    # drf-spectacular: use its AutoSchema for generating schema
+    REST_FRAMEWORK["DEFAULT_SCHEMA_CLASS"] = "drf_spectacular.openapi.AutoSchema"
 
 SPECTACULAR_SETTINGS = {
     "TITLE": "Heart Monitoring API",
     "DESCRIPTION": "Simplified backend for devices that record patient heart rates.",
     "VERSION": "2025.09.20",
     "SERVE_INCLUDE_SCHEMA": False,
+    # schema-only annotations, imported when a schema is generated
+    "PREPROCESSING_HOOKS": ["patients.schema.annotate_serializers"],
 }
 
+# Worker processes serving requests, exported by heart_monitoring.launcher
+# (and patients.loadgen). The "api" cache and the recent-readings buffers must
+# then be coherent across processes, which decides the defaults below.
+WEB_PROCESSES = int(os.environ.get("WEB_PROCESSES", "1"))
+
+# Caches
+# "api" holds server-side cached API responses (patients.response_cache), the
+# namespace versions that invalidate them (also used by reading-list ETags and
+# the recent-readings buffers) and users' access sets (patients.access).
+# API_CACHE_BACKEND: locmem (per process, LRU bounded by API_CACHE_MAX_ENTRIES;
+# default with one process), file (shared by workers on one host; default with
+# several) or redis (shared, eviction policy is configured on the redis server;
+# needs the `redis` package). With several processes a locmem cache would keep
+# invalidations and revoked access in the process that saw the write.
+API_CACHE_ENABLED = os.environ.get("API_CACHE_ENABLED", "True").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+API_CACHE_BACKEND = os.environ.get(
+    "API_CACHE_BACKEND", "locmem" if WEB_PROCESSES == 1 else "file"
+)
+if API_CACHE_BACKEND == "locmem" and WEB_PROCESSES > 1:
+    raise ImproperlyConfigured(
+        f"API_CACHE_BACKEND=locmem is per process; use file or redis with "
+        f"{WEB_PROCESSES} worker processes."
+    )
+API_CACHE_TTL = int(os.environ.get("API_CACHE_TTL", "60"))
+API_CACHE_MAX_ENTRIES = int(os.environ.get("API_CACHE_MAX_ENTRIES", "5000"))
+_api_cache_backends = {
+    "locmem": ("django.core.cache.backends.locmem.LocMemCache", "api-responses"),
+    "file": (
+        "django.core.cache.backends.filebased.FileBasedCache",
+        str(BASE_DIR / ".cache" / "api"),
+    ),
+    "redis": ("django.core.cache.backends.redis.RedisCache", "redis://127.0.0.1:6379/1"),
+}
+_backend, _location = _api_cache_backends[API_CACHE_BACKEND]
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "api": {
+        "BACKEND": _backend,
+        "LOCATION": os.environ.get("API_CACHE_LOCATION", _location),
+        "TIMEOUT": API_CACHE_TTL,
+    },
+}
+if API_CACHE_BACKEND != "redis":
+    CACHES["api"]["OPTIONS"] = {"MAX_ENTRIES": API_CACHE_MAX_ENTRIES}
+
+# Most rows accepted by one POST/PATCH /api/patients/patients/bulk/ request
+PATIENT_BULK_MAX_ROWS = int(os.environ.get("PATIENT_BULK_MAX_ROWS", "10000"))
+
+# Responses to POSTs carrying an `Idempotency-Key` header are replayed for this
+# many seconds (stored in the "api" cache, which every worker shares)
+IDEMPOTENCY_KEY_TTL = int(os.environ.get("IDEMPOTENCY_KEY_TTL", "600"))
+
+# Postgres only: also create a BRIN index on HeartRate.recorded_at (migration
+# 0003). Worth it for very large, append-mostly reading tables.
+HEARTRATE_BRIN_INDEX = os.environ.get("HEARTRATE_BRIN_INDEX", "False").lower() in (
+    "1",
+    "true",
+)
+
+# HeartRate.metadata storage (patients.metadata): keys promoted to their typed,
+# indexed columns at ingestion (comma-separated, of signal_quality and
+# battery_level), and what happens to the other keys: "json", "compressed"
+# (zlib, when smaller) or "drop". HEARTRATE_METADATA_GIN_INDEX (Postgres only,
+# migration 0012) adds a GIN index for `metadata__contains` queries.
+HEARTRATE_METADATA_PROMOTE = [
+    key.strip()
+    for key in os.environ.get(
+        "HEARTRATE_METADATA_PROMOTE", "signal_quality,battery_level"
+    ).split(",")
+    if key.strip()
+]
+HEARTRATE_METADATA_REST = os.environ.get("HEARTRATE_METADATA_REST", "json")
+HEARTRATE_METADATA_GIN_INDEX = os.environ.get(
+    "HEARTRATE_METADATA_GIN_INDEX", "False"
+).lower() in ("1", "true", "yes")
+
+# Heart-rate list windows ending more than HEARTRATE_LATE_ARRIVAL_WINDOW seconds
+# ago are considered final and sent with Cache-Control max-age
+HEARTRATE_LATE_ARRIVAL_WINDOW = int(
+    os.environ.get("HEARTRATE_LATE_ARRIVAL_WINDOW", str(6 * 3600))
+)
+HEARTRATE_HISTORICAL_MAX_AGE = int(
+    os.environ.get("HEARTRATE_HISTORICAL_MAX_AGE", str(24 * 3600))
+)
+
+# Per-process ring buffers of each patient's latest readings (patients.recent),
+# serving /patients/{id}/recent/ without database reads. Memory: about
+# 10 bytes * CAPACITY per buffered patient. WARM patients with readings in the
+# last WARM_WINDOW seconds are loaded at startup (launcher, before forking).
+# With several processes the buffers stay coherent only through atomic version
+# increments in a shared cache, i.e. API_CACHE_BACKEND=redis (the file cache
+# can lose one of two racing increments), so they default to off otherwise.
+RECENT_READINGS_ENABLED = os.environ.get(
+    "RECENT_READINGS_ENABLED",
+    str(WEB_PROCESSES == 1 or API_CACHE_BACKEND == "redis"),
+).lower() in ("1", "true", "yes")
+if RECENT_READINGS_ENABLED and WEB_PROCESSES > 1 and API_CACHE_BACKEND != "redis":
+    raise ImproperlyConfigured(
+        f"RECENT_READINGS_ENABLED needs API_CACHE_BACKEND=redis with {WEB_PROCESSES} "
+        "worker processes."
+    )
+RECENT_READINGS_CAPACITY = int(os.environ.get("RECENT_READINGS_CAPACITY", "720"))
+RECENT_READINGS_MAX_PATIENTS = int(os.environ.get("RECENT_READINGS_MAX_PATIENTS", "5000"))
+RECENT_READINGS_WARM = int(os.environ.get("RECENT_READINGS_WARM", "500"))
+RECENT_READINGS_WARM_WINDOW = int(os.environ.get("RECENT_READINGS_WARM_WINDOW", "3600"))
+
+# Non-staff users see the patients they own or share through a care team; their
+# list queries filter on `patient_id IN (ids)` up to this many ids, a semi-join
+# beyond (patients.access)
+ACCESS_IN_LIST_MAX = int(os.environ.get("ACCESS_IN_LIST_MAX", "1000"))
+
+# GET /api/patients/heartrates/multi/: most patient ids per request and most
+# readings (or downsampled buckets) returned per patient
+MULTI_PATIENT_MAX_IDS = int(os.environ.get("MULTI_PATIENT_MAX_IDS", "100"))
+MULTI_PATIENT_MAX_READINGS = int(os.environ.get("MULTI_PATIENT_MAX_READINGS", "1000"))
+
+# Longest window of GET /patients/{id}/hourly/ (hourly rollups, patients.rollups)
+ROLLUP_MAX_WINDOW_DAYS = int(os.environ.get("ROLLUP_MAX_WINDOW_DAYS", "92"))
+
+# Daily patient reports (patients.reports, manage.py materialize_reports): time
+# above HIGH_BPM / below LOW_BPM is counted from readings, each standing for at
+# most MAX_GAP seconds; GET /patients/{id}/daily-reports/ spans at most MAX_DAYS
+DAILY_REPORT_HIGH_BPM = int(os.environ.get("DAILY_REPORT_HIGH_BPM", "100"))
+DAILY_REPORT_LOW_BPM = int(os.environ.get("DAILY_REPORT_LOW_BPM", "60"))
+DAILY_REPORT_MAX_GAP = int(os.environ.get("DAILY_REPORT_MAX_GAP", "300"))
+DAILY_REPORT_MAX_DAYS = int(os.environ.get("DAILY_REPORT_MAX_DAYS", "366"))
+
+# Patient purges (patients.purge): readings deleted per DELETE/transaction, and
+# seconds to sleep between batches to leave room for other writes. Purges run
+# in a background thread of the requesting process unless PURGE_IN_BACKGROUND
+# is off; `manage.py purge_patients --resume` finishes interrupted ones.
+PURGE_BATCH_SIZE = int(os.environ.get("PURGE_BATCH_SIZE", "2000"))
+PURGE_PAUSE = float(os.environ.get("PURGE_PAUSE", "0"))
+PURGE_IN_BACKGROUND = os.environ.get("PURGE_IN_BACKGROUND", "True").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+PURGE_WORKERS = int(os.environ.get("PURGE_WORKERS", "1"))
+
+# Optional columnar storage of old readings (patients.compaction): with
+# HEARTRATE_COMPACTION on, `manage.py compact_heartrates` packs each patient,
+# device and UTC hour older than HEARTRATE_COMPACT_AFTER seconds into one
+# binary HeartRateBlock row, and reads merge rows and blocks. Keep
+# COMPACT_AFTER above the late-arrival window and every "recent" window.
+HEARTRATE_COMPACTION = os.environ.get("HEARTRATE_COMPACTION", "False").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+HEARTRATE_COMPACT_AFTER = int(
+    os.environ.get("HEARTRATE_COMPACT_AFTER", str(7 * 24 * 3600))
+)
+
+# Heart-rate readings sharded over several databases (patients.sharding):
+# comma-separated database URLs (sqlite:///shard0.sqlite3, postgres://...),
+# configured as shard0, shard1, ... in that order, so only ever append. Each
+# needs `manage.py migrate --database shardN`, then `manage.py rebalance_shards`
+# moves existing readings. Patients are placed by HEARTRATE_SHARD_BY:
+# "patient" (hash of the id) or "place" (one hospital/ward per shard). Reads
+# spanning shards run on HEARTRATE_SHARD_WORKERS threads. Not combinable with
+# HEARTRATE_COMPACTION yet.
+HEARTRATE_SHARDS = []
+for _url in filter(None, os.environ.get("HEARTRATE_SHARD_URLS", "").split(",")):
+    import dj_database_url
+
+    HEARTRATE_SHARDS.append(f"shard{len(HEARTRATE_SHARDS)}")
+    DATABASES[HEARTRATE_SHARDS[-1]] = dj_database_url.parse(_url.strip())
+HEARTRATE_SHARD_BY = os.environ.get("HEARTRATE_SHARD_BY", "patient")
+HEARTRATE_SHARD_WORKERS = int(os.environ.get("HEARTRATE_SHARD_WORKERS", "8"))
+DATABASE_ROUTERS = ["patients.sharding.ShardRouter"]
+if HEARTRATE_SHARDS and HEARTRATE_COMPACTION:
+    raise ImproperlyConfigured("HEARTRATE_COMPACTION does not support HEARTRATE_SHARDS.")
+
+# SQLite ignores INCLUDE columns of covering indexes (Postgres-only optimization)
+SILENCED_SYSTEM_CHECKS = ["models.W040"]
+
 # Simple JWT settings (reasonable defaults; can be tuned)
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
     "ROTATE_REFRESH_TOKENS": False,
     "BLACKLIST_AFTER_ROTATION": False,
+    "TOKEN_REFRESH_SERIALIZER": "accounts.serializers.StatelessTokenRefreshSerializer",
 }
+# POST /api/auth/token/refresh/ checks only the refresh token, without loading
+# the user (accounts.serializers.StatelessTokenRefreshSerializer)
+AUTH_STATELESS_REFRESH = os.environ.get("AUTH_STATELESS_REFRESH", "True").lower() in (
+    "1",
+    "true",
+    "yes",
+)
@@ -0,0 +1,209 @@
+# heart_monitoring/tests.py
+import gzip
+import os
+import subprocess
+import sys
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import compression, docs, launcher, profiling
+
+
+class LauncherTest(TestCase):
+    def test_size_workers_from_cpus(self):
+        self.assertEqual(launcher.size_workers(4, None), (9, 1))
+
+    def test_size_workers_memory_capped_uses_threads(self):
+        # 4 CPUs want 9 processes but 600MB only fits 3 of 150MB
+        self.assertEqual(launcher.size_workers(4, 600), (3, 3))
+
+    def test_size_workers_overrides(self):
+        self.assertEqual(launcher.size_workers(4, 600, workers=2, threads=8), (2, 8))
+        self.assertEqual(launcher.optional_int("auto"), None)
+
+    def test_no_pending_migrations_in_test_database(self):
+        self.assertEqual(launcher.pending_migrations(), [])
+
+    def run_python(self, *args, **env):
+        # settings are read once per process
+        environ = {
+            name: value
+            for name, value in os.environ.items()
+            if name not in ("API_CACHE_BACKEND", "RECENT_READINGS_ENABLED", "WEB_PROCESSES")
+        }
+        return subprocess.run(
+            [sys.executable, *args],
+            env={**environ, **env},
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            timeout=60,
+        )
+
+    def test_several_processes_need_a_shared_cache(self):
+        code = (
+            "from heart_monitoring import settings as s; "
+            "print(s.API_CACHE_BACKEND, s.RECENT_READINGS_ENABLED)"
+        )
+        self.assertEqual(self.run_python("-c", code).stdout.split(), ["locmem", "True"])
+        several = self.run_python("-c", code, WEB_PROCESSES="3")
+        self.assertEqual(several.stdout.split(), ["file", "False"])
+        refused = self.run_python(
+            "-c", code, WEB_PROCESSES="3", API_CACHE_BACKEND="file", RECENT_READINGS_ENABLED="1"
+        )
+        self.assertIn("RECENT_READINGS_ENABLED needs API_CACHE_BACKEND=redis", refused.stderr)
+
+        refused = self.run_python(
+            *("-m", "heart_monitoring.launcher", "serve", "--workers", "3"),
+            *("--skip-migrate", "--skip-collectstatic"),
+            API_CACHE_BACKEND="locmem",
+            DJANGO_SETTINGS_MODULE="heart_monitoring.settings",
+        )
+        self.assertEqual(refused.returncode, 1)
+        self.assertIn("launcher: API_CACHE_BACKEND=locmem is per process", refused.stderr)
+
+    def test_collectstatic_skipped_when_sources_unchanged(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(
+            STATIC_ROOT=root,
+            STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage",
+        ):
+            phases = launcher.Phases()
+            launcher.collectstatic(phases)
+            launcher.collectstatic(phases)
+        notes = [note for _, _, note in phases.timings]
+        self.assertEqual(notes, ["collected", "unchanged"])
+        self.assertIn("collectstatic=", phases.report())
+
+
+class ApiDocsTest(TestCase):
+    def test_dynamic_schema_view_is_imported_on_first_request(self):
+        resp = self.client.get("/api/schema/")
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(b"Normal reading", resp.content)
+
+    def test_static_schema_file_is_generated_once_and_revalidated(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, "openapi.yaml")
+            with override_settings(OPENAPI_SCHEMA_FILE=path):
+                resp = docs.schema_file(RequestFactory().get("/api/schema/"))
+                self.assertTrue(os.path.exists(path))
+                self.assertEqual(resp.status_code, 200)
+                self.assertIn(b"Heart Monitoring API", resp.content)
+                self.assertIn("max-age", resp["Cache-Control"])
+
+                request = RequestFactory().get("/api/schema/", HTTP_IF_NONE_MATCH=resp["ETag"])
+                self.assertEqual(docs.schema_file(request).status_code, 304)
+
+
+class CompressionTest(TestCase):
+    def process(self, response, accept_encoding="gzip"):
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING=accept_encoding)
+        return compression.CompressionMiddleware(lambda r: response)(request)
+
+    def test_negotiate_honours_q_values_and_server_preference(self):
+        preference = ["zstd", "br", "gzip"]
+        self.assertEqual(compression.negotiate("gzip", preference), "gzip")
+        self.assertEqual(compression.negotiate("gzip;q=0, deflate", preference), None)
+        self.assertEqual(compression.negotiate("identity", preference), None)
+        self.assertEqual(
+            compression.negotiate("*;q=0.5, gzip;q=0.8", ["gzip"]), "gzip"
+        )
+        if "br" in compression.ENCODERS:
+            self.assertEqual(compression.negotiate("gzip;q=0.5, br", preference), "br")
+            self.assertEqual(compression.negotiate("gzip, br", preference[1:]), "br")
+
+    def test_large_json_is_compressed_small_is_not(self):
+        body = b'{"bpm": [' + b"72, " * 1000 + b"72]}"
+        response = HttpResponse(body, content_type="application/json")
+        response["ETag"] = '"abc"'
+        response = self.process(response)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["ETag"], 'W/"abc"')
+        self.assertEqual(gzip.decompress(response.content), body)
+        self.assertEqual(response["Content-Length"], str(len(response.content)))
+        self.assertIn("compress;desc=", response["Server-Timing"])
+
+        small = self.process(HttpResponse(b'{"bpm": 72}', content_type="application/json"))
+        self.assertFalse(small.has_header("Content-Encoding"))
+        image = self.process(HttpResponse(b"\0" * 5000, content_type="image/png"))
+        self.assertFalse(image.has_header("Content-Encoding"))
+
+    def test_streaming_response_is_flushed_per_chunk(self):
+        chunks = [b'{"bpm": [', b"72, " * 100, b"72]}"]
+        response = self.process(
+            StreamingHttpResponse(iter(chunks), content_type="application/json")
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        parts = list(response.streaming_content)
+        self.assertGreaterEqual(len(parts), len(chunks))
+        self.assertEqual(gzip.decompress(b"".join(parts)), b"".join(chunks))
+
+
+class ProfilingTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        middleware = [*settings.MIDDLEWARE, "heart_monitoring.profiling.ProfilingMiddleware"]
+        overrides = override_settings(
+            MIDDLEWARE=middleware,
+            PROFILING_DIR=directory.name,
+            PROFILING_MAX_CAPTURES=2,
+            # profile the view itself, not a cached response
+            API_CACHE_ENABLED=False,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        User = get_user_model()
+        self.staff = User.objects.create_user("prof", password="pw12345678", is_staff=True)
+        self.user = User.objects.create_user("noprof", password="pw12345678")
+        self.client = APIClient()
+
+    def get(self, user, flag="cprofile", path="/api/patients/heartrates/"):
+        token = RefreshToken.for_user(user).access_token
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {token}"}
+        if flag:
+            headers["HTTP_X_PROFILE"] = flag
+        return self.client.get(path, **headers)
+
+    def test_staff_requests_are_profiled_with_their_sql(self):
+        resp = self.get(self.staff)
+        self.assertEqual(resp.status_code, 200)
+        capture_id = resp["X-Profile-Id"]
+        meta = profiling.load_capture(capture_id)
+        self.assertEqual((meta["mode"], meta["status"]), ("cprofile", 200))
+        self.assertEqual(meta["query_count"], len(meta["queries"]))
+        self.assertTrue(any("patients_heartrate" in q["sql"] for q in meta["queries"]))
+
+        listing = self.get(self.staff, flag=None, path="/api/profiles/").data
+        self.assertEqual([capture["id"] for capture in listing], [capture_id])
+        self.assertNotIn("queries", listing[0])
+        detail = self.get(self.staff, flag=None, path=f"/api/profiles/{capture_id}/?stacks=1")
+        self.assertTrue(detail.data["stacks"])
+
+        out = StringIO()
+        call_command("render_profile", capture_id, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines)
+        # "frame;frame;frame weight"
+        self.assertTrue(all(line.rsplit(" ", 1)[1].isdigit() for line in lines))
+
+    def test_unflagged_and_non_staff_requests_are_not_profiled(self):
+        self.assertNotIn("X-Profile-Id", self.get(self.staff, flag=None))
+        self.assertNotIn("X-Profile-Id", self.get(self.user))
+        self.assertEqual(profiling.capture_ids(), [])
+        self.assertEqual(self.get(self.user, flag=None, path="/api/profiles/").status_code, 403)
+
+    def test_sampling_mode_and_bounded_retention(self):
+        ids = [self.get(self.staff, flag="sample")["X-Profile-Id"] for _ in range(3)]
+        self.assertEqual(profiling.load_capture(ids[-1])["mode"], "sample")
+        self.assertEqual(sorted(profiling.capture_ids()), sorted(ids[1:]))
+        self.assertEqual(len(os.listdir(settings.PROFILING_DIR)), 4)
+        self.assertEqual(self.get(self.staff, path="/api/profiles/../x/").status_code, 404)
@@ -1,31 +1,46 @@
 # heart_monitoring/heart_monitoring/urls.py
-from django.contrib import admin
+from django.conf import settings
 from django.urls import include, path
-
-# drf-spectacular views
-from drf_spectacular.views import (
-    SpectacularAPIView,
-    SpectacularRedocView,
-    SpectacularSwaggerView,
-)
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from .docs import lazy_view, schema_file
+from .profiling import ProfileDetailView, ProfileListView
+
 urlpatterns = [
-    path("admin/", admin.site.urls),
     # JWT token endpoints
     path("api/auth/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("api/auth/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     # API apps
     path("api/accounts/", include("accounts.urls")),
     path("api/patients/", include("patients.urls")),
-    # OpenAPI schema + docs
-    path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
-    path(
-        "api/docs/swagger/",
-        SpectacularSwaggerView.as_view(url_name="schema"),
-        name="swagger-ui",
-    ),
+    # stored request profiles (staff only, see profiling)
+    path("api/profiles/", ProfileListView.as_view(), name="profile-list"),
     path(
-        "api/docs/redoc/", SpectacularRedocView.as_view(url_name="schema"), name="redoc"
+        "api/profiles/<str:capture_id>/", ProfileDetailView.as_view(), name="profile-detail"
     ),
 ]
+
+if settings.ADMIN_ENABLED:
+    from django.contrib import admin
+
+    urlpatterns.append(path("admin/", admin.site.urls))
+
+# OpenAPI schema + docs (drf-spectacular views, imported on first use)
+if settings.API_DOCS != "off":
+    if settings.API_DOCS == "static":
+        schema_view = schema_file
+    else:
+        schema_view = lazy_view("drf_spectacular.views.SpectacularAPIView")
+    urlpatterns += [
+        path("api/schema/", schema_view, name="schema"),
+        path(
+            "api/docs/swagger/",
+            lazy_view("drf_spectacular.views.SpectacularSwaggerView", url_name="schema"),
+            name="swagger-ui",
+        ),
+        path(
+            "api/docs/redoc/",
+            lazy_view("drf_spectacular.views.SpectacularRedocView", url_name="schema"),
+            name="redoc",
+        ),
+    ]
@@ -0,0 +1,143 @@
+# patients/access.py
+"""
+Which patients a user can see and edit, computed once and cached.
+
+- clinicians and staff: every patient (querysets are only cleared of the
+  readings of patients being purged, see patients.purge)
+- everyone else: the patients they own plus the patients of every care team
+  they are a member of
+
+The accessible patient ids of a user are loaded with one indexed UNION query
+and cached in the "api" cache under the version of the namespace
+`access:user:{id}`, which is bumped whenever the user's patients or team
+memberships change (see signals), in every process sharing the cache (see
+API_CACHE_BACKEND). Querysets are then restricted with `patient_id IN (...)`,
+or with an equivalent semi-join once the set is larger than
+ACCESS_IN_LIST_MAX, and object permission checks are a set lookup.
+"""
+
+from django.conf import settings
+
+from .models import Patient
+from .response_cache import bump, get_cache, namespace_versions
+
+
+def namespace(user_id):
+    return f"access:user:{user_id}"
+
+
+def invalidate_access(user_ids):
+    """Recompute the access sets of `user_ids` on their next request."""
+    return bump({namespace(user_id) for user_id in user_ids if user_id})
+
+
+def is_privileged(user):
+    return user.is_staff or getattr(user, "is_clinician", False)
+
+
+class Access:
+    """The patients one user can access; `patient_ids` is None for all of them."""
+
+    __slots__ = ("user_id", "patient_ids", "shared")
+
+    def __init__(self, user_id, patient_ids=None, shared=False):
+        self.user_id = user_id
+        self.patient_ids = patient_ids
+        # whether some accessible patients are owned by someone else
+        self.shared = shared
+
+    @property
+    def everything(self):
+        return self.patient_ids is None
+
+    def allows(self, patient_id):
+        return self.patient_ids is None or patient_id in self.patient_ids
+
+    def allowed(self, patient_ids):
+        """The accessible ones of `patient_ids`, in order."""
+        if self.patient_ids is not None:
+            return [pk for pk in patient_ids if pk in self.patient_ids]
+        active = set(
+            Patient.objects.active().filter(pk__in=patient_ids).values_list("pk", flat=True)
+        )
+        return [pk for pk in patient_ids if pk in active]
+
+    def filter(self, queryset, field="pk"):
+        """Restrict `queryset` to accessible patients; `field` holds the patient id."""
+        # readings on shards cannot join the patient tables (patients.sharding)
+        sharded = field != "pk" and settings.HEARTRATE_SHARDS
+        if self.patient_ids is None:
+            if field == "pk":
+                return queryset
+            # readings outlive their patient's deleted_at until the purge job
+            # deletes them; hidden for everyone from the start
+            if sharded:
+                purged = Patient.objects.filter(deleted_at__isnull=False)
+                return queryset.exclude(
+                    **{f"{field}__in": list(purged.values_list("pk", flat=True))}
+                )
+            return queryset.exclude(**{f"{field.removesuffix('_id')}__deleted_at__isnull": False})
+        if sharded or len(self.patient_ids) <= settings.ACCESS_IN_LIST_MAX:
+            return queryset.filter(**{f"{field}__in": self.patient_ids})
+        ids = accessible_patients(self.user_id, "pk")
+        return queryset.filter(**{f"{field}__in": ids})
+
+    def namespaces(self, prefix=None):
+        """
+        Response-cache namespaces of data scoped to this user: the access set,
+        plus those of the `prefix` list. Lists including shared patients also
+        depend on every other owner's changes, which only `:all` follows.
+        """
+        if self.patient_ids is None:
+            return [f"{prefix}:all"] if prefix else []
+        namespaces = [namespace(self.user_id)]
+        if prefix:
+            namespaces.append(f"{prefix}:user:{self.user_id}")
+            if self.shared:
+                namespaces.append(f"{prefix}:all")
+        return namespaces
+
+
+def accessible_patients(user_id, *fields):
+    """`fields` of the active patients `user_id` can access (owned UNION shared)."""
+    patients = Patient.objects.active().order_by()
+    owned = patients.filter(owner_id=user_id).values_list(*fields)
+    shared = patients.filter(care_teams__members=user_id).values_list(*fields)
+    return owned.union(shared)
+
+
+def load_access(user_id):
+    rows = list(accessible_patients(user_id, "pk", "owner_id"))
+    return Access(
+        user_id,
+        frozenset(pk for pk, _ in rows),
+        shared=any(owner_id != user_id for _, owner_id in rows),
+    )
+
+
+def access_for(user):
+    """The user's Access (cached across requests)."""
+    if is_privileged(user):
+        return Access(user.pk)
+    (version,) = namespace_versions([namespace(user.pk)])
+    key = f"access:{user.pk}:{version}"
+    cache = get_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        return Access(user.pk, *cached)
+    access = load_access(user.pk)
+    cache.set(key, (access.patient_ids, access.shared))
+    return access
+
+
+class AccessMixin:
+    """View mixin exposing the requesting user's Access as `self.access`."""
+
+    _access = None
+
+    @property
+    def access(self):
+        # views are instantiated per request
+        if self._access is None:
+            self._access = access_for(self.request.user)
+        return self._access
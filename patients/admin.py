@@ -1,7 +1,52 @@
 # patients/admin.py
+import datetime
+
 from django.contrib import admin
+from django.db.models import Max, Min, QuerySet
+from django.utils import timezone
+
+from .models import CareTeam, Device, HeartRate, Patient, PatientPurge
+from .pagination import EstimatedCountPaginator
+from .purge import request_purge
+from .response_cache import invalidate_heart_rates
+from .rollups import mark_dirty
+from .search import FTS_CANDIDATES, search_patients
+
+
+class CalendarQuerySet(QuerySet):
+    """
+    QuerySet for admin changelists with a `date_hierarchy`: month/day choices
+    are generated from the indexed MIN/MAX of the current (already bounded)
+    range instead of a SELECT DISTINCT over every row in it. Choices may
+    include months/days without rows.
+    """
 
-from .models import HeartRate, Patient
+    def datetimes(self, field_name, kind, order="ASC", tzinfo=None, is_dst=None):
+        bounds = self.order_by().aggregate(first=Min(field_name), last=Max(field_name))
+        if not bounds["first"]:
+            return []
+        first = timezone.localtime(bounds["first"], tzinfo)
+        last = timezone.localtime(bounds["last"], tzinfo)
+        values = []
+        if kind == "year":
+            values = [
+                first.replace(year=y, month=1, day=1)
+                for y in range(first.year, last.year + 1)
+            ]
+        elif kind == "month":
+            year, month = first.year, first.month
+            while (year, month) <= (last.year, last.month):
+                values.append(first.replace(year=year, month=month, day=1))
+                year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        else:
+            day = first.date()
+            while day <= last.date():
+                values.append(first.replace(year=day.year, month=day.month, day=day.day))
+                day += datetime.timedelta(days=1)
+        values = [
+            v.replace(hour=0, minute=0, second=0, microsecond=0) for v in values
+        ]
+        return values if order == "ASC" else values[::-1]
 
 
 @admin.register(Patient)
@@ -16,10 +61,117 @@ class PatientAdmin(admin.ModelAdmin):
     )
     search_fields = ("first_name", "last_name", "external_id", "owner__username")
     list_filter = ("place",)
+    list_select_related = ("owner",)
+    autocomplete_fields = ("owner",)
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    def get_search_results(self, request, queryset, search_term):
+        # use the patient search index instead of icontains over every field
+        if not search_term:
+            return super().get_search_results(request, queryset, search_term)
+        matches = search_patients(queryset, search_term, limit=FTS_CANDIDATES)
+        return queryset.filter(pk__in=[p.pk for p in matches]), False
+
+    def get_queryset(self, request):
+        # patients being purged are gone for every other client too
+        return super().get_queryset(request).active()
+
+    def get_deleted_objects(self, objs, request):
+        # the default collects every reading only to list them on the
+        # confirmation page; count them instead
+        objs = list(objs)
+        readings = HeartRate.objects.filter(patient__in=objs).count()
+        model_count = {
+            Patient._meta.verbose_name_plural: len(objs),
+            HeartRate._meta.verbose_name_plural: readings,
+        }
+        perms_needed = set()
+        if not self.has_delete_permission(request):
+            perms_needed.add(Patient._meta.verbose_name)
+        return [str(obj) for obj in objs], model_count, perms_needed, []
+
+    def delete_model(self, request, obj):
+        request_purge(obj, request.user)
+
+    def delete_queryset(self, request, queryset):
+        for patient in queryset:
+            request_purge(patient, request.user)
+
+
+class DeviceFilter(admin.SimpleListFilter):
+    """device_id filter whose choices come from the small Device table."""
+
+    title = "device"
+    parameter_name = "device_id"
+    max_choices = 200
+
+    def lookups(self, request, model_admin):
+        device_ids = Device.objects.values_list("device_id", flat=True)
+        return [(d, d) for d in device_ids[: self.max_choices]]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(device_id=self.value())
+        return queryset
 
 
 @admin.register(HeartRate)
 class HeartRateAdmin(admin.ModelAdmin):
     list_display = ("id", "patient", "bpm", "recorded_at", "device_id")
-    search_fields = ("patient__first_name", "patient__last_name", "device_id")
-    list_filter = ("device_id",)
+    # exact matches only: both are indexed, icontains would scan every reading
+    search_fields = ("=device_id", "=patient__external_id")
+    list_filter = (DeviceFilter,)
+    list_select_related = ("patient",)
+    autocomplete_fields = ("patient",)
+    date_hierarchy = "recorded_at"
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return CalendarQuerySet(model=qs.model, query=qs.query, using=qs.db)
+
+    # HeartRate has no post_delete receiver (see patients.signals)
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        invalidate_heart_rates([obj.patient])
+        mark_dirty([(obj.patient_id, obj.recorded_at)])
+
+    def delete_queryset(self, request, queryset):
+        deleted = list(queryset.values_list("patient_id", "recorded_at"))
+        super().delete_queryset(request, queryset)
+        patients = Patient.objects.filter(pk__in={patient_id for patient_id, _ in deleted})
+        invalidate_heart_rates(patients.only("pk", "owner_id"))
+        mark_dirty(deleted)
+
+
+@admin.register(CareTeam)
+class CareTeamAdmin(admin.ModelAdmin):
+    list_display = ("name", "created_at")
+    search_fields = ("name",)
+    autocomplete_fields = ("members", "patients")
+
+
+@admin.register(Device)
+class DeviceAdmin(admin.ModelAdmin):
+    list_display = ("device_id", "first_seen")
+    search_fields = ("device_id",)
+
+
+@admin.register(PatientPurge)
+class PatientPurgeAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "patient_id",
+        "status",
+        "readings_deleted",
+        "readings_total",
+        "created_at",
+        "finished_at",
+    )
+    list_filter = ("status",)
+    readonly_fields = [f.name for f in PatientPurge._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
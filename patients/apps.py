@@ -1,7 +1,21 @@
 # patients/apps.py
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def reserve_shard_ids(sender, using, **kwargs):
+    from .sharding import reserve_ids
+
+    reserve_ids(using)
 
 
 class PatientsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "patients"
+
+    def ready(self):
+        # response cache invalidation
+        from . import signals  # noqa: F401
+
+        # reading ids of each shard start in its own range (patients.sharding)
+        post_migrate.connect(reserve_shard_ids, sender=self)
@@ -0,0 +1,167 @@
+# patients/async_views.py
+"""
+Async-native versions of the hot endpoints, for deployments served through
+`heart_monitoring.asgi` (SERVER_MODE=asgi). Under ASGI an in-flight request
+waiting on the database does not pin a worker process.
+
+- GET/POST /api/patients/async/heartrates/  (same filters, pagination,
+  `?format=columnar` and idempotent single/batch create as HeartRateViewSet)
+- GET      /api/patients/async/patients/    (same filters as PatientViewSet)
+
+ETag and response-cache support stay on the DRF endpoints.
+"""
+
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from rest_framework.exceptions import APIException
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .access import access_for
+from .compaction import compacted_reading, reaches_blocks
+from .filters import filter_heart_rates, filter_patients
+from .ingestion import ingest_readings, preload_patients
+from .metadata import stored
+from .models import HeartRate, Patient
+from .renderers import to_columns
+from .serializers import HeartRateSerializer, PatientSerializer
+from .sharding import ShardedReadings, alias_of, prepare_writes, readings
+
+MAX_LIMIT = 1000
+
+
+def error(detail, status):
+    return JsonResponse({"detail": detail}, status=status)
+
+
+async def authenticate(request):
+    """Return the JWT-authenticated user, or None."""
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except APIException:
+        return None
+    return result[0] if result else None
+
+
+async def paginate(request, queryset, serializer_class):
+    """LimitOffsetPagination-compatible page built with async ORM calls."""
+    try:
+        limit = min(int(request.GET.get("limit", api_settings.PAGE_SIZE)), MAX_LIMIT)
+        offset = max(int(request.GET.get("offset", 0)), 0)
+    except ValueError:
+        limit, offset = api_settings.PAGE_SIZE, 0
+    if isinstance(queryset, ShardedReadings):
+        # fanned out over the shards by the shard thread pool
+        count = await sync_to_async(queryset.count)()
+        rows = await sync_to_async(queryset.__getitem__)(slice(offset, offset + limit))
+    else:
+        count = await queryset.acount()
+        rows = [obj async for obj in queryset[offset : offset + limit]]
+
+    url = request.build_absolute_uri()
+    next_url = previous_url = None
+    if offset + limit < count:
+        next_url = replace_query_param(
+            replace_query_param(url, "limit", limit), "offset", offset + limit
+        )
+    if offset > 0:
+        previous_url = replace_query_param(url, "limit", limit)
+        previous_url = (
+            remove_query_param(previous_url, "offset")
+            if offset - limit <= 0
+            else replace_query_param(previous_url, "offset", offset - limit)
+        )
+    return {
+        "count": count,
+        "next": next_url,
+        "previous": previous_url,
+        "results": serializer_class(rows, many=True).data,
+    }
+
+
+async def patient_list(request):
+    user = await authenticate(request)
+    if user is None:
+        return error("Authentication credentials were not provided.", 401)
+    if request.method != "GET":
+        return error(f'Method "{request.method}" not allowed.', 405)
+
+    access = await sync_to_async(access_for)(user)
+    qs = filter_patients(access.filter(Patient.objects.active()), request.GET)
+    return JsonResponse(await paginate(request, qs, PatientSerializer))
+
+
+async def heart_rate_list(request):
+    user = await authenticate(request)
+    if user is None:
+        return error("Authentication credentials were not provided.", 401)
+    if request.method == "POST":
+        return await create_heart_rates(request, user)
+    if request.method != "GET":
+        return error(f'Method "{request.method}" not allowed.', 405)
+
+    access = await sync_to_async(access_for)(user)
+    qs = access.filter(filter_heart_rates(HeartRate.objects.all(), request.GET), "patient_id")
+    if settings.HEARTRATE_SHARDS:
+        patient_id = request.GET.get("patient", "")
+        scope = [int(patient_id)] if patient_id.isdigit() else access.patient_ids
+        qs = await sync_to_async(readings)(qs, scope)
+    page = await paginate(request, qs, HeartRateSerializer)
+    if request.GET.get("format") == "columnar":
+        page["results"] = to_columns(page["results"], HeartRateSerializer().fields)
+    return JsonResponse(page)
+
+
+async def create_heart_rates(request, user):
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return error("JSON parse error.", 400)
+
+    many = isinstance(data, list)
+    context = {}
+    if many:
+        context["patients"] = await sync_to_async(preload_patients)(data)
+    serializer = HeartRateSerializer(data=data, many=many, context=context)
+    # field validation resolves the patient FK, which is a (sync) query
+    if not await sync_to_async(serializer.is_valid)():
+        return JsonResponse(serializer.errors, status=400, safe=False)
+
+    rows = serializer.validated_data if many else [serializer.validated_data]
+    access = await sync_to_async(access_for)(user)
+    for patient in {row["patient"] for row in rows}:
+        if patient.owner_id and not access.allows(patient.pk):
+            return error("You are not allowed to add readings for this patient.", 403)
+
+    if many:
+        created, duplicates = await sync_to_async(ingest_readings)(rows)
+        return JsonResponse({"created": created, "duplicates": duplicates}, status=201)
+
+    row = rows[0]
+    if reaches_blocks(row["recorded_at"]):
+        packed = await sync_to_async(compacted_reading)(
+            row["patient"].pk, row.get("device_id"), row["recorded_at"]
+        )
+        if packed is not None:
+            return JsonResponse(HeartRateSerializer(packed).data, status=200)
+    if settings.HEARTRATE_SHARDS:
+        await sync_to_async(prepare_writes)([row["patient"]])
+    instance, created = await HeartRate.objects.using(alias_of(row["patient"])).aget_or_create(
+        patient=row["patient"],
+        device_id=row.get("device_id"),
+        recorded_at=row["recorded_at"],
+        defaults={"bpm": row["bpm"], **stored(row)},
+    )
+    return JsonResponse(
+        HeartRateSerializer(instance).data, status=201 if created else 200
+    )
+
+
+# JWT only, no session cookies. (django.views.decorators.csrf.csrf_exempt
+# cannot wrap coroutine functions before Django 5.0.)
+patient_list.csrf_exempt = True
+heart_rate_list.csrf_exempt = True
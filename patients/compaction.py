@@ -0,0 +1,383 @@
+# patients/compaction.py
+"""
+Optional columnar storage of old heart-rate readings (HEARTRATE_COMPACTION).
+
+Once an hour is past the late-arrival window its readings practically never
+change, yet each one still costs a HeartRate row plus its index entries.
+`compact()` (run by `manage.py compact_heartrates`) moves the readings of
+every (patient, device, UTC hour) that ended more than HEARTRATE_COMPACT_AFTER
+seconds ago into one HeartRateBlock row whose `data` is
+
+    FORMAT byte + zlib(uint32 microsecond deltas of recorded_at from the hour
+                       start, then int16 bpm deltas), little-endian
+
+next to count/min/max/sum columns for aggregates that need no decoding.
+Readings carrying metadata stay rows. Compacted readings have no id,
+created_at or metadata; readings arriving later for a compacted hour are
+stored as rows and folded into its block by the next run. A reading re-sent
+after it was compacted is still a duplicate: ingestion looks it up in the
+block (`compacted_reading()`) and compaction drops rows already packed.
+
+Reads whose window reaches back past the compaction horizon see both kinds
+of storage: `CompactedReadings` merges rows and blocks for the paginated
+heart-rate list, `newest_block_readings()` and `block_buckets()` serve the
+multi-patient endpoint, and the rollups add block totals to their buckets.
+With the setting off, blocks are ignored by every reader; run
+`compact_heartrates --expand` before switching it off.
+"""
+
+import datetime
+import heapq
+import sys
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, islice
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .metadata import without_metadata
+from .models import HeartRate, HeartRateBlock, Patient
+from .response_cache import invalidate_heart_rates
+from .rollups import BUCKET, bucket_of
+
+FORMAT = 1
+MICROSECOND = datetime.timedelta(microseconds=1)
+# (patient, device, hour) groups compacted per transaction
+COMPACT_BATCH_SIZE = 100
+# blocks fetched per query while paging through compacted readings
+BLOCK_CHUNK_SIZE = 16
+
+
+def horizon(now=None):
+    """Hours starting before this are closed and get compacted."""
+    now = now or timezone.now()
+    return bucket_of(now - datetime.timedelta(seconds=settings.HEARTRATE_COMPACT_AFTER))
+
+
+def reaches_blocks(start):
+    """Whether a window from `start` (None: unbounded) may include compacted readings."""
+    return settings.HEARTRATE_COMPACTION and (start is None or start < horizon())
+
+
+def encode(bucket, readings):
+    """Encode (recorded_at, bpm) pairs of the hour `bucket`, sorted by time."""
+    offsets, bpms = array("I"), array("h")
+    last_offset = last_bpm = 0
+    for recorded_at, bpm in readings:
+        offset = (recorded_at - bucket) // MICROSECOND
+        offsets.append(offset - last_offset)
+        bpms.append(bpm - last_bpm)
+        last_offset, last_bpm = offset, bpm
+    if sys.byteorder == "big":
+        offsets.byteswap()
+        bpms.byteswap()
+    return bytes([FORMAT]) + zlib.compress(offsets.tobytes() + bpms.tobytes())
+
+
+def unpack(count, data):
+    """Cumulative microsecond offsets and bpm values of a block, oldest first."""
+    data = bytes(data)
+    if data[0] != FORMAT:
+        raise ValueError(f"Unknown heart-rate block format {data[0]}.")
+    raw = zlib.decompress(data[1:])
+    offsets, bpms = array("I"), array("h")
+    offsets.frombytes(raw[: offsets.itemsize * count])
+    bpms.frombytes(raw[offsets.itemsize * count :])
+    if sys.byteorder == "big":
+        offsets.byteswap()
+        bpms.byteswap()
+    return list(accumulate(offsets)), list(accumulate(bpms))
+
+
+def decode(bucket, count, data):
+    """The (recorded_at, bpm) pairs of a block, oldest first."""
+    offsets, bpms = unpack(count, data)
+    return [(bucket + offset * MICROSECOND, bpm) for offset, bpm in zip(offsets, bpms)]
+
+
+def span(bucket, offsets, start=None, end=None):
+    """Index range of the readings within [start, end]; offsets are sorted."""
+    low = 0 if start is None else bisect_left(offsets, (start - bucket) // MICROSECOND)
+    high = len(offsets) if end is None else bisect_right(offsets, (end - bucket) // MICROSECOND)
+    return low, high
+
+
+def count_within(block, start=None, end=None):
+    low, high = span(block.bucket, unpack(block.count, block.data)[0], start, end)
+    return high - low
+
+
+def block_readings(block, start=None, end=None):
+    """
+    Unsaved HeartRate instances of `block` within [start, end], newest first,
+    built lazily so a page only pays for the readings it shows.
+    """
+    offsets, bpms = unpack(block.count, block.data)
+    low, high = span(block.bucket, offsets, start, end)
+    for i in range(high - 1, low - 1, -1):
+        yield HeartRate(
+            patient_id=block.patient_id,
+            device_id=block.device_id,
+            bpm=bpms[i],
+            recorded_at=block.bucket + offsets[i] * MICROSECOND,
+        )
+
+
+def window_blocks(patient_ids, start, end):
+    """Blocks of `patient_ids` holding readings that may fall within [start, end]."""
+    return HeartRateBlock.objects.filter(
+        patient_id__in=patient_ids, bucket__gt=start - BUCKET, bucket__lte=end
+    ).order_by()
+
+
+def compacted_readings(patient_id, start, end):
+    """
+    The compacted readings (unsaved HeartRates) of `patient_id` within
+    [start, end]; none without a query if the window cannot reach a block.
+    """
+    if not reaches_blocks(start):
+        return []
+    return [
+        reading
+        for block in window_blocks([patient_id], start, end)
+        for reading in block_readings(block, start, end)
+    ]
+
+
+def compacted_reading(patient_id, device_id, recorded_at):
+    """The compacted reading with this identity (see patients.ingestion), or None."""
+    for reading in compacted_readings(patient_id, recorded_at, recorded_at):
+        if reading.device_id == device_id:
+            return reading
+    return None
+
+
+def inside(bucket, start, end):
+    """Whether the whole hour `bucket` lies within [start, end]."""
+    return (start is None or bucket >= start) and (end is None or bucket + BUCKET <= end)
+
+
+class CompactedReadings:
+    """
+    The readings of `rows` (a filtered HeartRate queryset) and of `blocks`
+    (the HeartRateBlocks of the same filters) as one sequence, newest first.
+    Supports what pagination needs: count(), slicing and iteration. A page
+    decodes only the newest blocks it reaches.
+    """
+
+    def __init__(self, rows, blocks, start=None, end=None):
+        self.rows = rows
+        self.blocks = blocks.order_by("-bucket")
+        self.start = start
+        self.end = end
+
+    def count(self):
+        total = self.rows.count()
+        blocks = self.blocks.order_by()
+        whole = blocks
+        if self.start is not None:
+            whole = whole.filter(bucket__gte=self.start)
+        if self.end is not None:
+            whole = whole.filter(bucket__lte=self.end - BUCKET)
+        total += whole.aggregate(n=Sum("count"))["n"] or 0
+        if self.start is not None or self.end is not None:
+            # blocks cut by the window edges are decoded
+            edges = Q()
+            if self.start is not None:
+                edges |= Q(bucket__lt=self.start)
+            if self.end is not None:
+                edges |= Q(bucket__gt=self.end - BUCKET)
+            for block in blocks.filter(edges):
+                total += count_within(block, self.start, self.end)
+        return total
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError("CompactedReadings only supports slicing.")
+        return list(islice(self.merged(key.stop), key.start or 0, key.stop))
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def merged(self, stop=None):
+        rows = self.rows if stop is None else self.rows[:stop]
+        return heapq.merge(
+            rows, self.block_readings(), key=attrgetter("recorded_at"), reverse=True
+        )
+
+    def block_readings(self):
+        # blocks of other devices in the same hour interleave, so the blocks of
+        # an hour are merged before moving on to the previous hour
+        hour, pending = None, []
+        for block in self.blocks.iterator(chunk_size=BLOCK_CHUNK_SIZE):
+            if block.bucket != hour:
+                yield from self.merge_hour(pending)
+                hour, pending = block.bucket, []
+            pending.append(block_readings(block, self.start, self.end))
+        yield from self.merge_hour(pending)
+
+    @staticmethod
+    def merge_hour(readings):
+        if len(readings) == 1:
+            return readings[0]
+        return heapq.merge(*readings, key=attrgetter("recorded_at"), reverse=True)
+
+
+def newest_block_readings(patient_ids, start, end, limit):
+    """
+    {patient_id: [(recorded_at, bpm), ...]}: the newest `limit` compacted
+    readings of each patient within [start, end], oldest first. Block sizes
+    are read first so only the blocks that can contribute are decoded.
+    """
+    sizes = window_blocks(patient_ids, start, end).order_by("patient_id", "-bucket")
+    needed, taken, last_hour = [], {}, {}
+    for pk, patient_id, bucket, count in sizes.values_list(
+        "pk", "patient_id", "bucket", "count"
+    ):
+        if taken.get(patient_id, 0) >= limit and bucket != last_hour[patient_id]:
+            continue
+        needed.append(pk)
+        # edge blocks may hold fewer readings within the window than `count`
+        taken[patient_id] = taken.get(patient_id, 0) + (
+            count if inside(bucket, start, end) else 0
+        )
+        last_hour[patient_id] = bucket
+    series = {pk: [] for pk in patient_ids}
+    for block in HeartRateBlock.objects.filter(pk__in=needed):
+        series[block.patient_id].extend(
+            (reading.recorded_at, reading.bpm) for reading in block_readings(block, start, end)
+        )
+    return {pk: sorted(readings)[-limit:] for pk, readings in series.items()}
+
+
+def block_buckets(patient_ids, start, end, step):
+    """
+    {(patient_id, bucket): [count, min, max, sum]} of the compacted readings
+    within [start, end], per `step` (a divisor of an hour) bucket. Whole hours
+    aggregated per hour come from the block columns without decoding.
+    """
+    stats = {}
+
+    def add(key, count, low, high, total):
+        current = stats.get(key)
+        if current is None:
+            stats[key] = [count, low, high, total]
+        else:
+            current[0] += count
+            current[1] = min(current[1], low)
+            current[2] = max(current[2], high)
+            current[3] += total
+
+    for block in window_blocks(patient_ids, start, end):
+        if step == BUCKET and inside(block.bucket, start, end):
+            add(
+                (block.patient_id, block.bucket),
+                block.count,
+                block.bpm_min,
+                block.bpm_max,
+                block.bpm_sum,
+            )
+            continue
+        for reading in block_readings(block, start, end):
+            bucket = block.bucket + (reading.recorded_at - block.bucket) // step * step
+            add((block.patient_id, bucket), 1, reading.bpm, reading.bpm, reading.bpm)
+    return stats
+
+
+def compact(patient_ids=None, batch_size=COMPACT_BATCH_SIZE, stdout=None):
+    """
+    Compact the readings of every closed hour before `horizon()` (of
+    `patient_ids`, or of every patient), `batch_size` (patient, device, hour)
+    groups per transaction. Returns the number of readings compacted.
+    """
+    rows = HeartRate.objects.filter(without_metadata(), recorded_at__lt=horizon())
+    if patient_ids is not None:
+        rows = rows.filter(patient_id__in=patient_ids)
+    groups = (
+        rows.annotate(bucket=TruncHour("recorded_at", tzinfo=datetime.timezone.utc))
+        .values_list("patient_id", "device_id", "bucket")
+        .distinct()
+        .order_by("patient_id", "bucket")
+    )
+    compacted = 0
+    while True:
+        # compacted groups no longer match, so the first slice is the next batch
+        batch = list(groups[:batch_size])
+        if not batch:
+            break
+        with transaction.atomic():
+            for patient_id, device_id, bucket in batch:
+                compacted += compact_hour(patient_id, device_id, bucket)
+        invalidate_heart_rates(
+            Patient.objects.filter(pk__in={patient_id for patient_id, _, _ in batch})
+        )
+        if stdout is not None:
+            stdout.write(f"compacted {compacted} readings")
+    return compacted
+
+
+def compact_hour(patient_id, device_id, bucket):
+    """Fold the rows of one (patient, device, hour) into its block."""
+    rows = HeartRate.objects.filter(
+        without_metadata(),
+        patient_id=patient_id,
+        device_id=device_id,
+        recorded_at__gte=bucket,
+        recorded_at__lt=bucket + BUCKET,
+    ).order_by()
+    found = list(rows.values_list("pk", "recorded_at", "bpm"))
+    if not found:
+        return 0
+    block = (
+        HeartRateBlock.objects.select_for_update()
+        .filter(patient_id=patient_id, device_id=device_id, bucket=bucket)
+        .first()
+    )
+    readings = [(recorded_at, bpm) for _, recorded_at, bpm in found]
+    if block is None:
+        block = HeartRateBlock(patient_id=patient_id, device_id=device_id, bucket=bucket)
+    else:
+        packed = decode(block.bucket, block.count, block.data)
+        # a row re-sent after its reading was compacted is the same reading
+        times = {recorded_at for recorded_at, _ in packed}
+        readings = [reading for reading in readings if reading[0] not in times] + packed
+    readings.sort()
+    bpms = [bpm for _, bpm in readings]
+    block.count = len(readings)
+    block.bpm_min = min(bpms)
+    block.bpm_max = max(bpms)
+    block.bpm_sum = sum(bpms)
+    block.data = encode(bucket, readings)
+    block.save()
+    rows.filter(pk__in=[pk for pk, _, _ in found]).delete()
+    return len(found)
+
+
+def expand(batch_size=COMPACT_BATCH_SIZE, stdout=None):
+    """Turn every block back into rows. Returns the number of readings restored."""
+    restored = 0
+    while True:
+        blocks = list(HeartRateBlock.objects.order_by("pk")[:batch_size])
+        if not blocks:
+            break
+        with transaction.atomic():
+            for block in blocks:
+                readings = list(block_readings(block))
+                HeartRate.objects.bulk_create(readings, batch_size=1000, ignore_conflicts=True)
+                restored += len(readings)
+            HeartRateBlock.objects.filter(pk__in=[block.pk for block in blocks]).delete()
+        invalidate_heart_rates(
+            Patient.objects.filter(pk__in={block.patient_id for block in blocks})
+        )
+        if stdout is not None:
+            stdout.write(f"restored {restored} readings")
+    return restored
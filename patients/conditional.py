@@ -0,0 +1,142 @@
+# patients/conditional.py
+"""
+Conditional GET support (ETag / Last-Modified / 304) for the patients API.
+
+The validator of a response is computed before any rows are loaded or
+serialized, so a matching `If-None-Match` / `If-Modified-Since` is answered
+with a 304 cheaply: patient lists and details use one small aggregate query
+over the filtered queryset, reading lists the response-cache namespace
+versions (patients.response_cache) and no query at all. Lists send no
+Last-Modified: no timestamp of the remaining rows moves when one is deleted.
+"""
+
+import hashlib
+from functools import partial
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .filters import parse_bound
+from .response_cache import namespace_versions
+
+
+def make_etag(request, *parts):
+    # the full path carries filters and limit/offset, the user scopes the result
+    raw = "|".join(str(p) for p in (request.get_full_path(), request.user.pk, *parts))
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+def set_validators(response, etag, last_modified):
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+    # responses depend on who is asking
+    patch_vary_headers(response, ("Authorization",))
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    ViewSet mixin adding ETag/Last-Modified validators to `list` and `retrieve`.
+
+    Subclasses implement `get_list_version(queryset)` and optionally
+    `get_object_version(queryset, pk)`, each returning `(last_modified, token)`;
+    `token` must change whenever the serialized response would, and
+    `last_modified` (None for no Last-Modified) whenever it would for an
+    If-Modified-Since client. A list version may set `self.count_hint` so
+    CountHintPagination skips its own COUNT(*).
+    """
+
+    count_hint = None
+
+    def get_list_version(self, queryset):
+        raise NotImplementedError
+
+    def get_object_version(self, queryset, pk):
+        return None, None
+
+    def get_cache_control(self, request):
+        # clients may reuse the response but must revalidate it first
+        return "private, no-cache"
+
+    def conditional(self, request, last_modified, token, render):
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        etag = make_etag(request, token, last_modified.isoformat() if last_modified else "")
+        response = get_conditional_response(
+            request._request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            response = render()
+            if response.status_code != 200:
+                return response
+        response["Cache-Control"] = self.get_cache_control(request)
+        return set_validators(response, etag, last_modified)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        last_modified, token = self.get_list_version(queryset)
+        return self.conditional(
+            request, last_modified, token, partial(super().list, request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        last_modified, token = self.get_object_version(
+            self.filter_queryset(self.get_queryset()), pk
+        )
+        if token is None:
+            # unknown object (or no cheap version): plain retrieve, incl. 404
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional(
+            request,
+            last_modified,
+            token,
+            partial(super().retrieve, request, *args, **kwargs),
+        )
+
+
+class PatientConditionalMixin(ConditionalGetMixin):
+    def get_list_version(self, queryset):
+        agg = queryset.order_by().aggregate(last=Max("updated_at"), n=Count("id"))
+        self.count_hint = agg["n"]
+        # the count catches deletes, which leave max(updated_at) where it was
+        return None, f"{agg['last'] and agg['last'].isoformat()}:{agg['n']}"
+
+    def get_object_version(self, queryset, pk):
+        try:
+            updated_at = (
+                queryset.filter(pk=pk).values_list("updated_at", flat=True).first()
+            )
+        except (TypeError, ValueError):
+            return None, None
+        return updated_at, updated_at and updated_at.isoformat()
+
+
+class HeartRateConditionalMixin(ConditionalGetMixin):
+    """
+    Reading lists are versioned by the response-cache namespaces they depend
+    on (`get_cache_namespaces`, see HeartRateCacheMixin): every write path
+    bumps them, including edits of any field, deletes, moves between patients
+    and compaction, which no aggregate over the rows reliably reflects. The
+    patient id is normalized there, so `?patient=01` follows patient 1.
+    """
+
+    def get_list_version(self, queryset):
+        namespaces = self.get_cache_namespaces(self.request, "list", self.kwargs)
+        if not namespaces:
+            # no single patient to follow: every reading the user can see
+            namespaces = self.access.namespaces("heartrates:scope")
+        return None, ":".join(str(v) for v in namespace_versions(namespaces))
+
+    def get_cache_control(self, request):
+        # a window that ended before the late-arrival horizon no longer changes
+        end = parse_bound(request.query_params.get("end"), end=True)
+        horizon = timezone.now() - timezone.timedelta(
+            seconds=settings.HEARTRATE_LATE_ARRIVAL_WINDOW
+        )
+        if end and end < horizon:
+            return f"private, max-age={settings.HEARTRATE_HISTORICAL_MAX_AGE}"
+        return super().get_cache_control(request)
@@ -0,0 +1,120 @@
+# patients/filters.py
+import math
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .metadata import PROMOTABLE
+
+# query params understood by HeartRateViewSet.list (also used by `explain_heartrates`)
+HEART_RATE_FILTERS = ("patient", "device_id", "start", "end")
+# plus `<key>`, `<key>_min` and `<key>_max` for every promoted metadata key
+METADATA_FILTERS = tuple(
+    (f"{key}{suffix}", key, lookup)
+    for key in PROMOTABLE
+    for suffix, lookup in (("", "exact"), ("_min", "gte"), ("_max", "lte"))
+)
+
+
+def parse_bound(value, end=False):
+    """
+    Parse a `start`/`end` query param given as ISO date or datetime.
+    A plain date means the start of that day, or its last instant when `end`.
+    Naive datetimes are treated as UTC. Returns None when unparseable.
+    """
+    if not value:
+        return None
+    day = parse_date(value)
+    if day is not None:
+        bound = timezone.datetime.max.time() if end else timezone.datetime.min.time()
+        return timezone.make_aware(
+            timezone.datetime.combine(day, bound), timezone.utc
+        )
+    try:
+        dt = parse_datetime(value)
+    except ValueError:
+        return None
+    if dt is not None and dt.tzinfo is None:
+        dt = timezone.make_aware(dt, timezone.utc)
+    return dt
+
+
+def filter_patients(qs, params):
+    """
+    Apply the PatientViewSet list filters (external_id, place) to `qs`.
+    """
+    # optional filtering by external_id or place via query params
+    external_id = params.get("external_id")
+    place = params.get("place")
+    if external_id:
+        qs = qs.filter(external_id=external_id)
+    if place:
+        qs = qs.filter(place__icontains=place)
+    return qs
+
+
+def parse_number(value):
+    """A finite float from a query param, or None when unparseable."""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def filters_metadata(params):
+    """Whether `params` filter on promoted metadata keys."""
+    return any(parse_number(params.get(param)) is not None for param, _, _ in METADATA_FILTERS)
+
+
+def filter_heart_rates(qs, params):
+    """
+    Apply the HeartRateViewSet list filters (patient, device_id, start, end and
+    the promoted metadata keys) to `qs`.
+    """
+    patient_id = params.get("patient")
+    device_id = params.get("device_id")
+
+    if patient_id:
+        qs = qs.filter(patient_id=patient_id)
+    if device_id:
+        qs = qs.filter(device_id=device_id)
+
+    start = parse_bound(params.get("start"))
+    end = parse_bound(params.get("end"), end=True)
+    if start:
+        qs = qs.filter(recorded_at__gte=start)
+    if end:
+        qs = qs.filter(recorded_at__lte=end)
+
+    for param, key, lookup in METADATA_FILTERS:
+        value = parse_number(params.get(param))
+        if value is not None:
+            qs = qs.filter(**{f"{key}__{lookup}": value})
+    return qs
+
+
+def filter_heart_rate_blocks(qs, params):
+    """
+    The HeartRateViewSet list filters applied to compacted readings
+    (HeartRateBlock): blocks of the patient/device whose hour overlaps the window.
+    Readings with metadata are never compacted.
+    """
+    if filters_metadata(params):
+        return qs.none()
+    patient_id = params.get("patient")
+    device_id = params.get("device_id")
+
+    if patient_id:
+        qs = qs.filter(patient_id=patient_id)
+    if device_id:
+        qs = qs.filter(device_id=device_id)
+
+    start = parse_bound(params.get("start"))
+    end = parse_bound(params.get("end"), end=True)
+    if start:
+        # a block's readings span the hour after `bucket`
+        qs = qs.filter(bucket__gt=start - timezone.timedelta(hours=1))
+    if end:
+        qs = qs.filter(bucket__lte=end)
+    return qs
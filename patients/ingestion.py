@@ -0,0 +1,216 @@
+# patients/ingestion.py
+"""
+Helpers for idempotent heart-rate ingestion.
+
+A reading is identified by (patient, device_id, recorded_at); devices retry on
+timeouts, so re-sending the same reading must not create a second row, nor
+a row next to the same reading compacted into a block (patients.compaction).
+"""
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, Min
+
+from .compaction import compacted_readings
+from .metadata import stored
+from .models import Device, HeartRate, Patient
+from .recent import recent_readings
+from .rollups import mark_dirty
+from .sharding import alias_of, prepare_writes
+from .response_cache import invalidate_heart_rates
+
+# rows per INSERT / DELETE statement
+INGEST_BATCH_SIZE = 500
+DEDUPE_BATCH_SIZE = 1000
+
+# device ids this process already registered in the Device table
+_known_devices = set()
+KNOWN_DEVICES_MAX = 10000
+
+
+def reading_key(patient_id, device_id, recorded_at):
+    return (patient_id, device_id, recorded_at)
+
+
+def register_devices(device_ids):
+    """Make sure every device id has a Device row (one INSERT for new ids only)."""
+    new = {d for d in device_ids if d} - _known_devices
+    if not new:
+        return
+    Device.objects.bulk_create(
+        [Device(device_id=d) for d in new], ignore_conflicts=True
+    )
+    if len(_known_devices) + len(new) > KNOWN_DEVICES_MAX:
+        _known_devices.clear()
+    _known_devices.update(new)
+
+
+def preload_patients(data):
+    """
+    Fetch every patient referenced by a raw batch upload in one query, for
+    `HeartRateSerializer(..., context={"patients": ...})`.
+    """
+    patient_ids = {
+        row.get("patient")
+        for row in data
+        if isinstance(row, dict) and str(row.get("patient", "")).isdigit()
+    }
+    return Patient.objects.active().in_bulk(patient_ids)
+
+
+def stored_readings(alias, by_patient, *fields):
+    """
+    `fields` of the readings in database `alias` within each patient's time
+    span in `by_patient` ({patient_id: [recorded_at, ...]}); one indexed query
+    per patient.
+    """
+    for patient_id, stamps in by_patient.items():
+        yield from (
+            HeartRate.objects.using(alias)
+            .filter(
+                patient_id=patient_id,
+                recorded_at__gte=min(stamps),
+                recorded_at__lte=max(stamps),
+            )
+            .order_by()
+            .values_list(*fields)
+        )
+
+
+def ingest_readings(rows, batch_size=INGEST_BATCH_SIZE):
+    """
+    Insert validated reading dicts (as produced by HeartRateSerializer) skipping
+    duplicates, both within `rows` and against readings already stored.
+
+    Returns (created, duplicates). Existing rows are looked up up-front;
+    `ignore_conflicts=True` covers concurrent retries racing this batch, and
+    the rows it skipped are told apart afterwards (by `created_at`) so they are
+    counted as duplicates and not handed to the rollups or recent buffers.
+    """
+    unique = {}
+    for row in rows:
+        key = reading_key(row["patient"].pk, row.get("device_id"), row["recorded_at"])
+        unique.setdefault(key, row)
+
+    if not unique:
+        return 0, len(rows)
+
+    # each patient's readings go to its database (patients.sharding)
+    prepare_writes({row["patient"] for row in unique.values()})
+    by_alias = {}
+    for key, row in unique.items():
+        by_alias.setdefault(alias_of(row["patient"]), {})[key] = row
+
+    objs = []
+    for alias, group in by_alias.items():
+        by_patient = {}
+        for patient_id, _, recorded_at in group:
+            by_patient.setdefault(patient_id, []).append(recorded_at)
+        existing = {
+            reading_key(*values)
+            for values in stored_readings(
+                alias, by_patient, "patient_id", "device_id", "recorded_at"
+            )
+        }
+        for patient_id, stamps in by_patient.items():
+            # readings of closed hours may already be packed into blocks
+            existing.update(
+                reading_key(reading.patient_id, reading.device_id, reading.recorded_at)
+                for reading in compacted_readings(patient_id, min(stamps), max(stamps))
+            )
+
+        new = [
+            HeartRate(
+                patient=row["patient"],
+                bpm=row["bpm"],
+                recorded_at=row["recorded_at"],
+                device_id=row.get("device_id"),
+                **stored(row),
+            )
+            for key, row in group.items()
+            if key not in existing
+        ]
+        if not new:
+            continue
+        HeartRate.objects.using(alias).bulk_create(
+            new, batch_size=batch_size, ignore_conflicts=True
+        )
+        # a row inserted concurrently keeps its own created_at; ours get their ids
+        inserted = {
+            (reading_key(patient_id, device_id, recorded_at), created_at): pk
+            for pk, patient_id, device_id, recorded_at, created_at in stored_readings(
+                alias,
+                by_patient,
+                "pk",
+                "patient_id",
+                "device_id",
+                "recorded_at",
+                "created_at",
+            )
+        }
+        for obj in new:
+            key = reading_key(obj.patient_id, obj.device_id, obj.recorded_at)
+            obj.pk = inserted.get((key, obj.created_at))
+        objs.extend(obj for obj in new if obj.pk is not None)
+    # bulk_create sends no post_save signals
+    mark_dirty((obj.patient_id, obj.recorded_at) for obj in objs)
+    versions = invalidate_heart_rates({obj.patient for obj in objs})
+    if settings.RECENT_READINGS_ENABLED:
+        recent_readings.add(objs, versions)
+    register_devices({obj.device_id for obj in objs})
+    return len(objs), len(rows) - len(objs)
+
+
+def dedupe_heart_rates(
+    model=HeartRate, batch_size=DEDUPE_BATCH_SIZE, stdout=None, using=DEFAULT_DB_ALIAS
+):
+    """
+    Delete duplicate readings in database `using`, keeping the lowest id of
+    every (patient, device_id, recorded_at) group.
+
+    Work is split into short transactions of at most `batch_size` groups so no
+    long-lived lock is held on the table. `model` is a parameter so data
+    migrations can pass their historical model. Returns the number of deleted rows.
+    """
+    readings = model.objects.using(using)
+    groups = (
+        readings.order_by()
+        .values("patient_id", "device_id", "recorded_at")
+        .annotate(n=Count("id"), keep=Min("id"))
+        .filter(n__gt=1)
+    )
+    # materialize the group list first: deleting while iterating a server-side
+    # cursor over the same table is not portable
+    groups = list(groups)
+
+    deleted = 0
+    for start in range(0, len(groups), batch_size):
+        batch = groups[start : start + batch_size]
+        keys = {reading_key(g["patient_id"], g["device_id"], g["recorded_at"]) for g in batch}
+        keep = {g["keep"] for g in batch}
+        with transaction.atomic(using=using):
+            # two IN lists instead of one OR term per group: SQLite refuses
+            # expression trees deeper than 1000
+            candidates = readings.filter(
+                patient_id__in={g["patient_id"] for g in batch},
+                recorded_at__in={g["recorded_at"] for g in batch},
+            ).values_list("pk", "patient_id", "device_id", "recorded_at")
+            ids = [
+                pk for pk, *key in candidates if tuple(key) in keys and pk not in keep
+            ]
+            count = 0
+            for chunk in range(0, len(ids), batch_size):
+                # HeartRate has no reverse relations: one DELETE per chunk of ids
+                count += readings.filter(pk__in=ids[chunk : chunk + batch_size]).delete()[0]
+            if model is HeartRate:
+                # historical models (migrations) predate rollups and cached lists
+                mark_dirty(((g["patient_id"], g["recorded_at"]) for g in batch), using=using)
+                patients = Patient.objects.filter(pk__in={g["patient_id"] for g in batch})
+                invalidate_heart_rates(patients.only("pk", "owner_id"))
+        deleted += count
+        if stdout is not None:
+            stdout.write(
+                f"processed {start + len(batch)}/{len(groups)} groups, "
+                f"deleted {deleted} rows"
+            )
+    return deleted
@@ -0,0 +1,154 @@
+# patients/loadgen.py
+"""
+Tiny offline HTTP load generator (stdlib only) used by the benchmark and
+stress-test management commands, and `serve()` to run the app for them.
+"""
+
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# how the app is served, and the prefix of the endpoints exercised in each mode
+SERVERS = {
+    # current deployment: gunicorn sync workers + DRF views
+    "wsgi": {
+        "argv": lambda port, workers: [
+            *(sys.executable, "-m", "gunicorn", "heart_monitoring.wsgi:application"),
+            *("--bind", f"127.0.0.1:{port}", "--workers", str(workers)),
+        ],
+        "prefix": "/api/patients",
+    },
+    # uvicorn + async views
+    "asgi": {
+        "argv": lambda port, workers: [
+            *(sys.executable, "-m", "uvicorn", "heart_monitoring.asgi:application"),
+            *("--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)),
+            *("--log-level", "warning"),
+        ],
+        "prefix": "/api/patients/async",
+    },
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def send(base_url, method, path, headers=None, body=None, timeout=30):
+    """Send one request on a fresh connection; return (status, seconds, body)."""
+    parts = urlsplit(base_url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+    payload = json.dumps(body).encode() if body is not None else None
+    headers = dict(headers or {})
+    if payload is not None:
+        headers["Content-Type"] = "application/json"
+    started = time.perf_counter()
+    try:
+        conn.request(method, path, body=payload, headers=headers)
+        response = conn.getresponse()
+        data = response.read()
+        status = response.status
+    except OSError:
+        status, data = 0, b""
+    finally:
+        conn.close()
+    return status, time.perf_counter() - started, data
+
+
+class ServerError(Exception):
+    pass
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def serve(mode, workers, startup_timeout=30, env=None):
+    """
+    Run the app as in SERVERS[mode] on a free local port, with the current
+    environment (so the same database) updated with `env`, and yield its base
+    URL. Raises ServerError if it does not answer within `startup_timeout`
+    seconds.
+    """
+    port = free_port()
+    process = subprocess.Popen(
+        SERVERS[mode]["argv"](port, workers),
+        # as the launcher does: the workers' settings must share their state
+        env={**os.environ, "WEB_PROCESSES": str(workers), **(env or {})},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + startup_timeout
+        while not send(base_url, "GET", "/api/patients/", timeout=2)[0]:
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise ServerError(f"{mode} server did not start (is it installed?)")
+            time.sleep(0.2)
+        yield base_url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def latency_summary(seconds):
+    """Percentiles, max and mean (ms) of request durations given in seconds."""
+    latencies = sorted(value * 1000 for value in seconds)
+    return {
+        "p50_ms": round(percentile(latencies, 50) or 0, 2),
+        "p95_ms": round(percentile(latencies, 95) or 0, 2),
+        "p99_ms": round(percentile(latencies, 99) or 0, 2),
+        "max_ms": round(latencies[-1], 2) if latencies else None,
+        "mean_ms": round(statistics.fmean(latencies), 2) if latencies else None,
+    }
+
+
+def run_load(base_url, make_request, total, concurrency, headers=None):
+    """
+    Issue `total` requests with `concurrency` parallel clients.
+
+    `make_request(i)` returns `(method, path, body)` for the i-th request.
+    Returns a summary dict: throughput, error rate and latency percentiles (ms).
+    """
+
+    def one(i):
+        method, path, body = make_request(i)
+        status, seconds, _ = send(base_url, method, path, headers, body)
+        return status, seconds
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    errors = sum(n for status, n in statuses.items() if not 200 <= status < 300)
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "rps": round(total / elapsed, 1) if elapsed else None,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0,
+        "statuses": statuses,
+        **latency_summary(seconds for _, seconds in results),
+    }
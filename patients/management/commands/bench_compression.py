@@ -0,0 +1,84 @@
+# patients/management/commands/bench_compression.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from heart_monitoring.compression import ENCODERS, compress
+from patients.models import HeartRate
+from patients.renderers import ColumnarJSONRenderer
+from patients.serializers import HeartRateSerializer
+
+
+def sample_page(rows):
+    """A paginated heart-rate list page of `rows` readings (no database)."""
+    start = timezone.now() - timezone.timedelta(days=1)
+    readings = [
+        HeartRate(
+            id=i + 1,
+            patient_id=1,
+            bpm=60 + (i * 7) % 40,
+            recorded_at=start + timezone.timedelta(seconds=5 * i),
+            device_id="device-abc",
+            metadata=None,
+            created_at=start + timezone.timedelta(seconds=5 * i + 1),
+        )
+        for i in range(rows)
+    ]
+    return {
+        "count": rows,
+        "next": None,
+        "previous": None,
+        "results": HeartRateSerializer(readings, many=True).data,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure bytes on the wire and compression CPU time of heart-rate list "
+        "responses: row vs columnar JSON, for every available content-coding."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, nargs="+", default=[25, 500, 5000])
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        shapes = {"rows": JSONRenderer(), "columnar": ColumnarJSONRenderer()}
+        self.stdout.write(
+            f"{'rows':>6}  {'shape':<9}{'coding':<9}{'bytes':>10}{'ratio':>8}"
+            f"{'render ms':>11}{'cpu ms':>9}"
+        )
+        for rows in options["rows"]:
+            page = sample_page(rows)
+            baseline = None
+            for shape, renderer in shapes.items():
+                render_ms, body = self.measure(
+                    lambda: renderer.render(page), options["repeat"]
+                )
+                baseline = baseline or len(body)
+                self.report(rows, shape, "identity", len(body), baseline, render_ms, 0)
+                for encoding in ENCODERS:
+                    cpu_ms, compressed = self.measure(
+                        lambda: compress(encoding, body), options["repeat"]
+                    )
+                    self.report(
+                        rows, shape, encoding, len(compressed), baseline, render_ms, cpu_ms
+                    )
+
+    def measure(self, func, repeat):
+        """CPU milliseconds per call (best of `repeat`) and the last result."""
+        best = None
+        for _ in range(repeat):
+            started = time.process_time()
+            result = func()
+            elapsed = time.process_time() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best * 1000, result
+
+    def report(self, rows, shape, encoding, size, baseline, render_ms, cpu_ms):
+        self.stdout.write(
+            f"{rows:>6}  {shape:<9}{encoding:<9}{size:>10}{size / baseline:>8.3f}"
+            f"{render_ms:>11.2f}{cpu_ms:>9.2f}"
+        )
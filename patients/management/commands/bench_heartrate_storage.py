@@ -0,0 +1,130 @@
+# patients/management/commands/bench_heartrate_storage.py
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from patients.compaction import CompactedReadings, compact, horizon
+from patients.models import HeartRate, HeartRateBlock, Patient
+
+
+def stored_bytes(model):
+    """Bytes of the table and its indexes, or None on unsupported databases."""
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SELECT pg_total_relation_size(%s)", [table])
+        elif connection.vendor == "sqlite":
+            cursor.execute(
+                "SELECT SUM(pgsize) FROM dbstat "
+                "WHERE name IN (SELECT name FROM sqlite_master WHERE tbl_name = %s)",
+                [table],
+            )
+        else:
+            return None
+        return cursor.fetchone()[0] or 0
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare row vs compacted heart-rate storage on the configured database: "
+        "bytes stored (table + indexes) and range-scan time for --patients "
+        "patients with --hours hours of readings every --interval seconds. "
+        "Everything is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--patients", type=int, default=5)
+        parser.add_argument("--hours", type=int, default=24)
+        parser.add_argument("--interval", type=float, default=5.0)
+        parser.add_argument("--page", type=int, default=100)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        with override_settings(HEARTRATE_COMPACTION=True), transaction.atomic():
+            self.run(options)
+            transaction.set_rollback(True)
+
+    def run(self, options):
+        User = get_user_model()
+        owner, _ = User.objects.get_or_create(username="bench")
+        patients = Patient.objects.bulk_create(
+            [Patient(first_name=f"Storage{i}", owner=owner) for i in range(options["patients"])]
+        )
+        end = horizon()
+        start = end - timezone.timedelta(hours=options["hours"])
+        step = timezone.timedelta(seconds=options["interval"])
+        per_patient = int((end - start) / step)
+        base = {model: stored_bytes(model) for model in (HeartRate, HeartRateBlock)}
+        rng = random.Random(42)
+        for patient in patients:
+            # jittered sampling times and a bounded random walk, like real devices
+            bpm, rows = 75, []
+            for i in range(per_patient):
+                bpm = min(max(bpm + rng.randint(-3, 3), 40), 180)
+                jitter = timezone.timedelta(milliseconds=rng.randint(0, 999))
+                rows.append(
+                    HeartRate(
+                        patient=patient,
+                        device_id="bench-device",
+                        bpm=bpm,
+                        recorded_at=start + i * step + jitter,
+                    )
+                )
+            HeartRate.objects.bulk_create(rows, batch_size=2000)
+        readings = per_patient * len(patients)
+        row_bytes = stored_bytes(HeartRate)
+        scans_before = self.scans(patients, start, end, options)
+
+        began = time.perf_counter()
+        compact(patient_ids=[patient.pk for patient in patients])
+        compact_s = time.perf_counter() - began
+        block_bytes = stored_bytes(HeartRateBlock)
+        scans_after = self.scans(patients, start, end, options)
+
+        self.stdout.write(f"{readings} readings, {per_patient} per patient")
+        self.stdout.write(f"compaction: {compact_s:.2f}s ({readings / compact_s:.0f} readings/s)")
+        if row_bytes is not None:
+            rows = row_bytes - base[HeartRate]
+            blocks = block_bytes - base[HeartRateBlock]
+            self.stdout.write(f"{'storage':<10}{'bytes':>14}{'bytes/reading':>15}")
+            self.stdout.write(f"{'rows':<10}{rows:>14}{rows / readings:>15.1f}")
+            self.stdout.write(f"{'blocks':<10}{blocks:>14}{blocks / readings:>15.1f}")
+        self.stdout.write(f"{'scan':<16}{'rows ms':>10}{'blocks ms':>11}")
+        for name in scans_before:
+            self.stdout.write(
+                f"{name:<16}{scans_before[name]:>10.2f}{scans_after[name]:>11.2f}"
+            )
+
+    def scans(self, patients, start, end, options):
+        """Median ms of reading one patient's whole range, its newest page and its count."""
+
+        def readings(patient):
+            rows = HeartRate.objects.filter(
+                patient=patient, recorded_at__gte=start, recorded_at__lte=end
+            )
+            blocks = HeartRateBlock.objects.filter(
+                patient=patient, bucket__gt=start - timezone.timedelta(hours=1), bucket__lte=end
+            )
+            return CompactedReadings(rows, blocks, start, end)
+
+        scans = {
+            "full range": lambda patient: list(readings(patient)),
+            "newest page": lambda patient: readings(patient)[: options["page"]],
+            "count": lambda patient: readings(patient).count(),
+        }
+        timings = {}
+        for name, scan in scans.items():
+            samples = []
+            for _ in range(options["repeat"]):
+                for patient in patients:
+                    began = time.perf_counter()
+                    scan(patient)
+                    samples.append((time.perf_counter() - began) * 1000)
+            samples.sort()
+            timings[name] = samples[len(samples) // 2]
+        return timings
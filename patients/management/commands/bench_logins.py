@@ -0,0 +1,117 @@
+# patients/management/commands/bench_logins.py
+import importlib.util
+import statistics
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from patients.loadgen import SERVERS, ServerError, run_load, serve
+
+PASSWORD = "bench-login-password"
+# PASSWORD_HASHER values -> Django algorithm names
+ALGORITHMS = {
+    "pbkdf2": "pbkdf2_sha256",
+    "argon2": "argon2",
+    "bcrypt": "bcrypt_sha256",
+    "scrypt": "scrypt",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure logins/s of POST /api/auth/token/ for each PASSWORD_HASHER (with "
+        "the configured costs and AUTH_HASH_WORKERS), the latency of other "
+        "requests served meanwhile (GET /api/accounts/me/), and refreshes/s. "
+        "Hashers whose package is not installed are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hashers", nargs="+", choices=ALGORITHMS, default=list(ALGORITHMS)
+        )
+        parser.add_argument("--mode", choices=SERVERS, default="wsgi")
+        parser.add_argument("--workers", type=int, default=3)
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--logins", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=16)
+
+    def handle(self, *args, **options):
+        users = self.seed(options["users"])
+        access = str(RefreshToken.for_user(users[0]).access_token)
+        refresh = str(RefreshToken.for_user(users[0]))
+
+        self.stdout.write(
+            f"{'hasher':<8}{'hash ms':>9}  {'scenario':<18}{'req/s':>9}{'p50 ms':>9}"
+            f"{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}"
+        )
+        for hasher in options["hashers"]:
+            if hasher in ("argon2", "bcrypt") and importlib.util.find_spec(hasher) is None:
+                self.stdout.write(f"{hasher:<8}skipped: package not installed")
+                continue
+            encoded = make_password(PASSWORD, hasher=ALGORITHMS[hasher])
+            get_user_model().objects.filter(pk__in=[u.pk for u in users]).update(
+                password=encoded
+            )
+            hash_ms = self.hash_ms(encoded)
+
+            def login(i):
+                body = {"username": users[i % len(users)].username, "password": PASSWORD}
+                return "POST", "/api/auth/token/", body
+
+            try:
+                with serve(
+                    options["mode"], options["workers"], env={"PASSWORD_HASHER": hasher}
+                ) as base_url:
+                    results = {}
+
+                    def other_traffic():
+                        results["me during logins"] = run_load(
+                            base_url,
+                            lambda i: ("GET", "/api/accounts/me/", None),
+                            options["logins"] // 4,
+                            2,
+                            {"Authorization": f"Bearer {access}"},
+                        )
+
+                    during = threading.Thread(target=other_traffic)
+                    during.start()
+                    results["login"] = run_load(
+                        base_url, login, options["logins"], options["concurrency"]
+                    )
+                    during.join()
+                    results["refresh"] = run_load(
+                        base_url,
+                        lambda i: ("POST", "/api/auth/token/refresh/", {"refresh": refresh}),
+                        options["logins"],
+                        options["concurrency"],
+                    )
+            except ServerError as exc:
+                raise CommandError(str(exc))
+            for name in ("login", "me during logins", "refresh"):
+                result = results[name]
+                self.stdout.write(
+                    f"{hasher:<8}{hash_ms:>9}  {name:<18}{result['rps']:>9}"
+                    f"{result['p50_ms']:>9}{result['p95_ms']:>9}{result['p99_ms']:>9}"
+                    f"{result['errors']:>8}"
+                )
+
+    def hash_ms(self, encoded, rounds=5):
+        """Median ms of one password check in this process."""
+        durations = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            check_password(PASSWORD, encoded)
+            durations.append((time.perf_counter() - started) * 1000)
+        return round(statistics.median(durations), 1)
+
+    def seed(self, count):
+        User = get_user_model()
+        users = []
+        for n in range(count):
+            user, _ = User.objects.get_or_create(username=f"bench-login-{n}")
+            users.append(user)
+        return users
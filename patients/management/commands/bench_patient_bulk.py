@@ -0,0 +1,87 @@
+# patients/management/commands/bench_patient_bulk.py
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from patients.models import Patient
+from patients.views import PatientViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure patient provisioning throughput on the configured database: "
+        "one-at-a-time POSTs vs bulk create, upsert and partial update of "
+        "--patients rows sent --batch rows per request. Everything is rolled back "
+        "unless --keep is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--patients", type=int, default=50000)
+        parser.add_argument("--batch", type=int, default=5000)
+        parser.add_argument("--singles", type=int, default=500)
+        parser.add_argument("--keep", action="store_true")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        self.factory = APIRequestFactory()
+        self.create_one = PatientViewSet.as_view({"post": "create"})
+        self.bulk = PatientViewSet.as_view({"post": "bulk", "patch": "bulk"})
+        run = time.time_ns()
+
+        self.stdout.write(f"{'operation':<16}{'rows':>8}{'seconds':>10}{'rows/s':>10}")
+        with transaction.atomic():
+            self.user, _ = User.objects.get_or_create(username="bench")
+            self.measure(
+                "single POST",
+                options["singles"],
+                lambda: [
+                    self.send("post", self.create_one, "", {"first_name": f"S{i}"})
+                    for i in range(options["singles"])
+                ],
+            )
+            rows = [
+                {"first_name": f"B{i}", "external_id": f"bench-{run}-{i}", "place": "A"}
+                for i in range(options["patients"])
+            ]
+            self.measure("bulk create", len(rows), lambda: self.batches("post", "", rows, options))
+            for row in rows:
+                row["place"] = "B"
+            self.measure(
+                "bulk upsert",
+                len(rows),
+                lambda: self.batches("post", "?upsert=true", rows, options),
+            )
+            ids = Patient.objects.filter(external_id__startswith=f"bench-{run}-").values_list(
+                "pk", flat=True
+            )
+            changes = [{"id": pk, "place": "C"} for pk in ids]
+            self.measure(
+                "bulk patch", len(changes), lambda: self.batches("patch", "", changes, options)
+            )
+            if not options["keep"]:
+                transaction.set_rollback(True)
+
+    def send(self, method, view, query, body):
+        request = getattr(self.factory, method)(
+            f"/api/patients/patients/bulk/{query}", body, format="json"
+        )
+        force_authenticate(request, user=self.user)
+        response = view(request)
+        if response.status_code >= 300:
+            self.stderr.write(f"{method} failed: {response.status_code} {response.data}")
+        return response
+
+    def batches(self, method, query, rows, options):
+        for start in range(0, len(rows), options["batch"]):
+            self.send(method, self.bulk, query, rows[start : start + options["batch"]])
+
+    def measure(self, name, count, func):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{name:<16}{count:>8}{elapsed:>10.2f}{count / elapsed if elapsed else 0:>10.0f}"
+        )
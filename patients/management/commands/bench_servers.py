@@ -0,0 +1,99 @@
+# patients/management/commands/bench_servers.py
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from patients.loadgen import SERVERS, ServerError, run_load, serve
+from patients.models import HeartRate, Patient
+
+
+class Command(BaseCommand):
+    help = (
+        "Start the app under gunicorn sync workers (wsgi) and uvicorn (asgi) on the "
+        "configured database and compare throughput and tail latency of the "
+        "heart-rate list/create and patient list endpoints under concurrency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--modes", nargs="+", default=list(SERVERS), choices=SERVERS)
+        parser.add_argument("--workers", type=int, default=3)
+        parser.add_argument("--concurrency", type=int, default=64)
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--seed-readings", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        token, patient = self.seed(options["seed_readings"])
+        headers = {"Authorization": f"Bearer {token}"}
+        # readings created by the write scenario start after everything seeded
+        base_time = timezone.now() - timezone.timedelta(days=1)
+
+        self.stdout.write(
+            f"{'mode':<6}{'scenario':<16}{'req/s':>9}{'p50 ms':>9}"
+            f"{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}"
+        )
+        for run, mode in enumerate(options["modes"]):
+            prefix = SERVERS[mode]["prefix"]
+            offset = (run + 1) * options["requests"]
+            scenarios = {
+                "patient list": lambda i: ("GET", f"{prefix}/patients/", None),
+                "reading list": lambda i: (
+                    "GET",
+                    f"{prefix}/heartrates/?patient={patient.pk}&limit=50",
+                    None,
+                ),
+                "reading create": lambda i, offset=offset: (
+                    "POST",
+                    f"{prefix}/heartrates/",
+                    {
+                        "patient": patient.pk,
+                        "bpm": 60 + i % 60,
+                        "device_id": "bench",
+                        "recorded_at": (
+                            base_time + timezone.timedelta(milliseconds=offset + i)
+                        ).isoformat(),
+                    },
+                ),
+            }
+            try:
+                with serve(mode, options["workers"]) as base_url:
+                    for name, make_request in scenarios.items():
+                        result = run_load(
+                            base_url,
+                            make_request,
+                            options["requests"],
+                            options["concurrency"],
+                            headers,
+                        )
+                        self.stdout.write(
+                            f"{mode:<6}{name:<16}{result['rps']:>9}{result['p50_ms']:>9}"
+                            f"{result['p95_ms']:>9}{result['p99_ms']:>9}{result['errors']:>8}"
+                        )
+            except ServerError as exc:
+                raise CommandError(str(exc))
+
+    def seed(self, readings):
+        User = get_user_model()
+        user, _ = User.objects.get_or_create(
+            username="bench", defaults={"is_clinician": False}
+        )
+        patient, _ = Patient.objects.get_or_create(
+            external_id="bench-patient", defaults={"first_name": "Bench", "owner": user}
+        )
+        missing = readings - HeartRate.objects.filter(patient=patient).count()
+        if missing > 0:
+            start = timezone.now() - timezone.timedelta(days=30)
+            HeartRate.objects.bulk_create(
+                (
+                    HeartRate(
+                        patient=patient,
+                        bpm=60 + i % 60,
+                        recorded_at=start + timezone.timedelta(seconds=i),
+                        device_id="seed",
+                    )
+                    for i in range(missing)
+                ),
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+        return str(RefreshToken.for_user(user).access_token), patient
@@ -0,0 +1,41 @@
+# patients/management/commands/compact_heartrates.py
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from patients.compaction import COMPACT_BATCH_SIZE, compact, expand, horizon
+
+
+class Command(BaseCommand):
+    help = (
+        "Pack the readings of every patient, device and UTC hour older than "
+        "HEARTRATE_COMPACT_AFTER seconds into compacted blocks. --expand turns "
+        "all blocks back into rows (do so before turning HEARTRATE_COMPACTION off)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--patient", type=int, action="append", dest="patient_ids", metavar="ID"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=COMPACT_BATCH_SIZE,
+            help="Hours (or blocks with --expand) handled per transaction.",
+        )
+        parser.add_argument("--expand", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["expand"]:
+            restored = expand(batch_size=options["batch_size"], stdout=self.stdout)
+            self.stdout.write(self.style.SUCCESS(f"Restored {restored} readings."))
+            return
+        if not settings.HEARTRATE_COMPACTION:
+            # blocks would be invisible to every reader
+            raise CommandError("Set HEARTRATE_COMPACTION to compact readings.")
+        self.stdout.write(f"compacting readings before {horizon().isoformat()}")
+        compacted = compact(
+            patient_ids=options["patient_ids"],
+            batch_size=options["batch_size"],
+            stdout=self.stdout,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Compacted {compacted} readings."))
@@ -0,0 +1,28 @@
+# patients/management/commands/dedupe_heartrates.py
+from django.core.management.base import BaseCommand
+
+from patients.ingestion import DEDUPE_BATCH_SIZE, dedupe_heart_rates
+from patients.sharding import databases
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete duplicate heart-rate readings (same patient, device_id and "
+        "recorded_at), keeping the oldest row, in every database holding "
+        "readings. Runs in small batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEDUPE_BATCH_SIZE,
+            help="Duplicate groups handled per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        deleted = sum(
+            dedupe_heart_rates(batch_size=options["batch_size"], stdout=self.stdout, using=alias)
+            for alias in databases()
+        )
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} duplicate readings."))
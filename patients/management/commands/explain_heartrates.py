@@ -0,0 +1,96 @@
+# patients/management/commands/explain_heartrates.py
+import itertools
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from patients.access import load_access
+from patients.filters import filter_heart_rates
+from patients.models import HeartRate, Patient
+
+# plan fragments meaning "read the whole table" for sqlite / postgres
+FULL_SCAN_MARKERS = ("SCAN patients_heartrate\n", "Seq Scan on patients_heartrate")
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the query plan of the heart-rate list query for every supported "
+        "filter combination (patient, device_id, start/end, owner scope)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--patient", type=int, help="Patient id used in filters.")
+        parser.add_argument("--device", help="device_id used in filters.")
+        parser.add_argument(
+            "--analyze",
+            action="store_true",
+            help="Run EXPLAIN ANALYZE (Postgres only, executes the queries).",
+        )
+        parser.add_argument(
+            "--fail-on-full-scan",
+            action="store_true",
+            help="Exit with an error if any plan scans the whole reading table.",
+        )
+
+    def handle(self, *args, **options):
+        patient = (
+            Patient.objects.filter(pk=options["patient"]).first()
+            if options["patient"]
+            else Patient.objects.exclude(owner=None).first()
+        )
+        patient_id = patient.pk if patient else 1
+        owner_id = patient.owner_id if patient else 1
+        device_id = options["device"] or (
+            HeartRate.objects.exclude(device_id=None)
+            .values_list("device_id", flat=True)
+            .first()
+            or "device-abc"
+        )
+        now = timezone.now()
+        window = {
+            "start": (now - timezone.timedelta(hours=1)).isoformat(),
+            "end": now.isoformat(),
+        }
+
+        explain_options = {}
+        if options["analyze"] and connection.vendor == "postgresql":
+            explain_options = {"analyze": True, "buffers": True}
+
+        access = load_access(owner_id)
+        full_scans = []
+        for with_patient, with_device, with_window, owner_scope in itertools.product(
+            (False, True), repeat=4
+        ):
+            params = {}
+            if with_patient:
+                params["patient"] = str(patient_id)
+            if with_device:
+                params["device_id"] = device_id
+            if with_window:
+                params.update(window)
+            qs = filter_heart_rates(HeartRate.objects.all(), params)
+            if owner_scope:
+                # same restriction HeartRateViewSet applies to non-clinicians
+                qs = access.filter(qs, "patient_id")
+            page = qs[: settings.REST_FRAMEWORK["PAGE_SIZE"]]
+
+            label = ", ".join(
+                name
+                for name, enabled in (
+                    ("patient", with_patient),
+                    ("device_id", with_device),
+                    ("start/end", with_window),
+                    ("owner scope", owner_scope),
+                )
+                if enabled
+            )
+            plan = page.explain(**explain_options)
+            self.stdout.write(self.style.MIGRATE_HEADING(f"== {label or 'no filters'}"))
+            self.stdout.write(plan + "\n")
+            if any(marker in plan + "\n" for marker in FULL_SCAN_MARKERS):
+                full_scans.append(label or "no filters")
+
+        if full_scans and options["fail_on_full_scan"]:
+            raise CommandError("Full table scan for: " + "; ".join(full_scans))
@@ -0,0 +1,55 @@
+# patients/management/commands/materialize_reports.py
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from patients.models import Patient
+from patients.reports import CHUNK_SIZE, materialize
+
+
+class Command(BaseCommand):
+    help = (
+        "Materialize the daily report of every patient with readings on the "
+        "given UTC days (default: yesterday), in a pool of worker processes. "
+        "Re-running a day replaces its reports, e.g. --days 3 after late readings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--date", action="append", dest="dates", metavar="YYYY-MM-DD", default=[]
+        )
+        parser.add_argument(
+            "--days", type=int, default=1, help="The last N complete days (without --date)."
+        )
+        parser.add_argument(
+            "--patient", type=int, action="append", dest="patient_ids", metavar="ID"
+        )
+        parser.add_argument(
+            "--workers", type=int, help="Worker processes (default: one per CPU; 1: none)."
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=CHUNK_SIZE, help="Patients per worker task."
+        )
+
+    def handle(self, *args, **options):
+        if options["dates"]:
+            days = [parse_date(value) for value in options["dates"]]
+            if None in days:
+                raise CommandError("--date takes YYYY-MM-DD.")
+        else:
+            today = datetime.datetime.now(datetime.timezone.utc).date()
+            days = [today - datetime.timedelta(days=n) for n in range(options["days"], 0, -1)]
+        patient_ids = options["patient_ids"]
+        if patient_ids is not None:
+            patient_ids = list(
+                Patient.objects.filter(pk__in=patient_ids).values_list("pk", flat=True)
+            )
+        stored = materialize(
+            days,
+            patient_ids=patient_ids,
+            workers=options["workers"],
+            chunk_size=options["chunk_size"],
+            stdout=self.stdout,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Stored {stored} reports."))
@@ -0,0 +1,97 @@
+# patients/management/commands/profile_startup.py
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# run in a fresh interpreter: this process has already imported everything
+PROFILE_SCRIPT = """
+import importlib, os, time
+started = time.perf_counter()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "heart_monitoring.settings")
+importlib.import_module({module!r})
+if {urls!r}:
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+print(time.perf_counter() - started)
+"""
+
+
+def parse_importtime(output):
+    """
+    Parse `python -X importtime` output into a list of
+    (module, self_us, cumulative_us), in import order.
+    """
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # header
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def by_package(rows):
+    """Self time summed per top-level package, largest first."""
+    totals = {}
+    for name, self_us, _ in rows:
+        package = name.split(".")[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+class Command(BaseCommand):
+    help = (
+        "Report per-module import time of heart_monitoring.wsgi (and its URLconf, "
+        "which Django otherwise loads on the first request) in a fresh interpreter. "
+        "Pass --env API_DOCS=off --env ADMIN_ENABLED=False to compare configurations."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--module", default="heart_monitoring.wsgi")
+        parser.add_argument(
+            "--no-urls", dest="urls", action="store_false", help="skip loading the URLconf"
+        )
+        parser.add_argument("--top", type=int, default=25)
+        parser.add_argument(
+            "--env", action="append", default=[], metavar="KEY=VALUE",
+            help="environment override for the profiled interpreter (repeatable)",
+        )
+
+    def handle(self, *args, **options):
+        env = os.environ.copy()
+        for item in options["env"]:
+            key, sep, value = item.partition("=")
+            if not sep:
+                raise CommandError(f"--env expects KEY=VALUE, got {item!r}")
+            env[key] = value
+        script = PROFILE_SCRIPT.format(module=options["module"], urls=options["urls"])
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", script],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode:
+            raise CommandError(result.stderr.strip().splitlines()[-1])
+        rows = parse_importtime(result.stderr)
+        wall = float(result.stdout.strip().splitlines()[-1])
+        top = options["top"]
+
+        self.stdout.write(
+            f"{options['module']}{' + URLconf' if options['urls'] else ''}: "
+            f"{wall * 1000:.0f} ms wall, {len(rows)} modules imported"
+        )
+        self.stdout.write(f"\n{'cumulative ms':>14}{'self ms':>10}  module")
+        for name, self_us, cumulative_us in sorted(rows, key=lambda r: r[2], reverse=True)[
+            :top
+        ]:
+            self.stdout.write(f"{cumulative_us / 1000:>14.1f}{self_us / 1000:>10.1f}  {name}")
+        self.stdout.write(f"\n{'self ms':>14}  package")
+        for package, self_us in by_package(rows)[:top]:
+            self.stdout.write(f"{self_us / 1000:>14.1f}  {package}")
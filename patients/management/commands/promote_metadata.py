@@ -0,0 +1,56 @@
+# patients/management/commands/promote_metadata.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from patients.metadata import STORAGE_FIELDS, joined, split, without_metadata
+from patients.models import HeartRate
+from patients.sharding import databases
+
+
+def stored_value(reading, field):
+    value = getattr(reading, field)
+    # Postgres returns binary columns as memoryview
+    return bytes(value) if isinstance(value, memoryview) else value
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-store the metadata of existing readings under the current "
+        "HEARTRATE_METADATA_PROMOTE / HEARTRATE_METADATA_REST settings: promote "
+        "keys to their columns, compress or drop the rest, in every database "
+        "holding readings. Runs in short transactions of --batch-size readings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        changed = sum(self.promote(alias, options["batch_size"]) for alias in databases())
+        self.stdout.write(self.style.SUCCESS(f"Rewrote the metadata of {changed} readings."))
+
+    def promote(self, alias, batch_size):
+        readings = (
+            HeartRate.objects.using(alias)
+            .exclude(without_metadata())
+            .order_by("pk")
+            .only("pk", *STORAGE_FIELDS)
+        )
+        last_pk, seen, changed = 0, 0, 0
+        while True:
+            batch = list(readings.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            updated = []
+            for reading in batch:
+                values = split(joined(reading))
+                if any(stored_value(reading, field) != value for field, value in values.items()):
+                    for field, value in values.items():
+                        setattr(reading, field, value)
+                    updated.append(reading)
+            with transaction.atomic(using=alias):
+                HeartRate.objects.using(alias).bulk_update(updated, STORAGE_FIELDS)
+            seen += len(batch)
+            changed += len(updated)
+            self.stdout.write(f"{alias}: checked {seen} readings, rewrote {changed}")
+        return changed
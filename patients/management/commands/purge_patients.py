@@ -0,0 +1,66 @@
+# patients/management/commands/purge_patients.py
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from patients.models import Patient
+from patients.purge import request_purge, run_purge, unfinished_purges
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete patients and all of their readings in small batches, reporting "
+        "progress. With --resume, finish purges that were interrupted or failed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("patient_ids", nargs="*", type=int, metavar="patient_id")
+        parser.add_argument(
+            "--resume", action="store_true", help="also run every unfinished purge job"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.PURGE_BATCH_SIZE,
+            help="Readings deleted per transaction.",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=settings.PURGE_PAUSE,
+            help="Seconds to sleep between batches.",
+        )
+
+    def handle(self, *args, **options):
+        if not options["patient_ids"] and not options["resume"]:
+            raise CommandError("Pass patient ids and/or --resume.")
+
+        jobs = list(unfinished_purges()) if options["resume"] else []
+        queued = {job.patient_id for job in jobs}
+        for patient_id in options["patient_ids"]:
+            if patient_id in queued:
+                continue
+            patient = Patient.objects.filter(pk=patient_id).first()
+            if patient is None:
+                raise CommandError(f"Patient {patient_id} does not exist.")
+            job = (
+                unfinished_purges().filter(patient_id=patient_id).first()
+                or request_purge(patient, start=False)
+            )
+            jobs.append(job)
+
+        failed = 0
+        for job in jobs:
+            try:
+                run_purge(
+                    job,
+                    batch_size=options["batch_size"],
+                    pause=options["pause"],
+                    stdout=self.stdout,
+                )
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(f"purge of patient {job.patient_id} failed: {exc}")
+        done = len(jobs) - failed
+        self.stdout.write(self.style.SUCCESS(f"Purged {done} patients."))
+        if failed:
+            raise CommandError(f"{failed} purges failed; rerun with --resume.")
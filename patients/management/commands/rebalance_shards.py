@@ -0,0 +1,65 @@
+# patients/management/commands/rebalance_shards.py
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from patients.models import HeartRate, Patient
+from patients.sharding import MOVE_BATCH_SIZE, databases, move, placement
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the heart-rate readings of every patient to the database "
+        "HEARTRATE_SHARDS / HEARTRATE_SHARD_BY place them on, e.g. after adding "
+        "a shard. Patients are moved --patients at a time; readings stay "
+        "readable throughout. Run `migrate --database` for new shards first; a "
+        "shard can only be retired once it holds no readings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--patients", type=int, default=100, help="Patients moved per step."
+        )
+        parser.add_argument("--batch-size", type=int, default=MOVE_BATCH_SIZE)
+        parser.add_argument(
+            "--dry-run", action="store_true", help="only report what would move"
+        )
+
+    def handle(self, *args, **options):
+        moved = patients_moved = 0
+        for source in databases():
+            plan = defaultdict(list)
+            for ids in self.patients_on(source, options["patients"]):
+                for patient in Patient.objects.filter(pk__in=ids).only("pk", "place", "shard"):
+                    target = placement(patient)
+                    if target != source:
+                        plan[target].append(patient.pk)
+            for target, ids in plan.items():
+                self.stdout.write(f"{source} -> {target}: {len(ids)} patients")
+                if options["dry_run"]:
+                    continue
+                for start in range(0, len(ids), options["patients"]):
+                    step = ids[start : start + options["patients"]]
+                    moved += move(step, source, target, batch_size=options["batch_size"])
+                    patients_moved += len(step)
+                    self.stdout.write(f"  moved {moved} readings of {patients_moved} patients")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Moved {moved} readings of {patients_moved} patients.")
+        )
+
+    def patients_on(self, alias, size):
+        """Batches of the ids of the patients with readings in `alias`."""
+        ids = (
+            HeartRate.objects.using(alias)
+            .order_by("patient_id")
+            .values_list("patient_id", flat=True)
+            .distinct()
+        )
+        last = 0
+        while True:
+            batch = list(ids.filter(patient_id__gt=last)[:size])
+            if not batch:
+                return
+            last = batch[-1]
+            yield batch
@@ -0,0 +1,40 @@
+# patients/management/commands/recompute_rollups.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from patients.rollups import RECOMPUTE_BATCH_SIZE, mark_all_dirty, recompute_dirty
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh the hourly rollups of the (patient, hour) buckets whose readings "
+        "changed since they were computed. --loop keeps doing so every --interval seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=RECOMPUTE_BATCH_SIZE,
+            help="Dirty buckets refreshed per transaction.",
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="First mark every bucket with readings dirty (initial build, repairs).",
+        )
+        parser.add_argument("--loop", action="store_true")
+        parser.add_argument("--interval", type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            mark_all_dirty(stdout=self.stdout)
+        while True:
+            refreshed = recompute_dirty(
+                batch_size=options["batch_size"], stdout=self.stdout
+            )
+            self.stdout.write(self.style.SUCCESS(f"Refreshed {refreshed} buckets."))
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
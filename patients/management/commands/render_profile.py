@@ -0,0 +1,57 @@
+# patients/management/commands/render_profile.py
+from django.core.management.base import BaseCommand, CommandError
+
+from heart_monitoring.profiling import capture_ids, collapsed_stacks, load_capture
+
+
+class Command(BaseCommand):
+    help = (
+        "Print a stored request profile (X-Profile captures) as collapsed stacks, "
+        "one 'frame;frame;frame weight' line each, for flamegraph.pl or speedscope. "
+        "Defaults to the newest capture; --list shows the stored ones, --sql its queries."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("capture_id", nargs="?")
+        parser.add_argument("--list", action="store_true")
+        parser.add_argument("--sql", action="store_true", help="print the SQL instead")
+        parser.add_argument(
+            "--min-share",
+            type=float,
+            default=0.001,
+            help="cProfile captures: drop paths below this share of the total time",
+        )
+        parser.add_argument("--output", help="write to this file instead of stdout")
+
+    def handle(self, *args, **options):
+        if options["list"]:
+            for capture_id in capture_ids():
+                meta = load_capture(capture_id)
+                self.stdout.write(
+                    f"{capture_id}  {meta['mode']:<8}{meta['status']:>4}"
+                    f"{meta['duration_ms']:>10.1f} ms{meta['query_count']:>5} queries  "
+                    f"{meta['method']} {meta['path']}"
+                )
+            return
+        capture_id = options["capture_id"] or next(iter(capture_ids()), None)
+        if capture_id is None:
+            raise CommandError("No stored profiles.")
+        try:
+            meta = load_capture(capture_id)
+        except LookupError:
+            raise CommandError(f"No profile {capture_id!r}.")
+
+        if options["sql"]:
+            lines = [f"{query['ms']:>9.3f} ms  {query['sql']}" for query in meta["queries"]]
+        else:
+            stacks = collapsed_stacks(capture_id, min_share=options["min_share"])
+            lines = [f"{stack} {weight}" for stack, weight in sorted(stacks.items())]
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.writelines(line + "\n" for line in lines)
+            self.stdout.write(
+                self.style.SUCCESS(f"Wrote {len(lines)} lines to {options['output']}.")
+            )
+        else:
+            for line in lines:
+                self.stdout.write(line)
@@ -0,0 +1,246 @@
+# patients/management/commands/stress_ingestion.py
+import json
+import random
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from patients.loadgen import SERVERS, ServerError, latency_summary, send, serve
+from patients.models import HeartRate, Patient
+from patients.sharding import databases, fan_out
+
+# statuses a device retries (with backoff) instead of giving up
+RETRY_STATUSES = {0, 429, 500, 502, 503, 504}
+
+
+def make_work(run, patients, options):
+    """
+    The requests of every simulated device, interleaved so all devices write
+    at the same time. A share of the batches (--duplicate-rate) is queued twice
+    back to back, like a device re-sending after a lost acknowledgement while
+    the first copy may still be in flight.
+    """
+    rng = random.Random(options["seed"])
+    start = timezone.now() - timezone.timedelta(days=2)
+    devices = []
+    for n in range(options["devices"]):
+        device_id = f"stress-{run}-{n}"
+        patient = patients[n % len(patients)]
+        readings = [
+            {
+                "patient": patient.pk,
+                "device_id": device_id,
+                "bpm": rng.randint(45, 160),
+                "recorded_at": start + timezone.timedelta(seconds=i),
+            }
+            for i in range(options["readings"])
+        ]
+        size = options["batch_size"]
+        devices.append([readings[i : i + size] for i in range(0, len(readings), size)])
+
+    work = []
+    for index in range(max(map(len, devices), default=0)):
+        for n, batches in enumerate(devices):
+            if index < len(batches):
+                key = f"{run}-{n}-{index}"
+                work.append((key, batches[index]))
+                if rng.random() < options["duplicate_rate"]:
+                    work.append((key, batches[index]))
+    return work
+
+
+def post(base_url, path, headers, key, rows, options):
+    """
+    Send one batch (a single object when it holds one reading), retrying like a
+    device would; returns the outcome of the last attempt and every attempt's
+    (status, seconds).
+    """
+    body = [
+        {**row, "recorded_at": row["recorded_at"].isoformat()} for row in rows
+    ]
+    body = body[0] if len(body) == 1 else body
+    headers = dict(headers)
+    if options["idempotency_keys"]:
+        headers["Idempotency-Key"] = key
+    attempts = []
+    for attempt in range(options["attempts"]):
+        status, seconds, data = send(
+            base_url, "POST", path, headers, body, timeout=options["timeout"]
+        )
+        attempts.append((status, seconds))
+        if status not in RETRY_STATUSES:
+            break
+        time.sleep(0.05 * 2**attempt * random.random())
+    created = None
+    if 200 <= status < 300:
+        if isinstance(body, list):
+            created = json.loads(data)["created"]
+        else:
+            created = int(status == 201)
+    return {
+        "rows": rows,
+        "status": status,
+        "created": created,
+        "attempts": attempts,
+        "finished": time.perf_counter(),
+    }
+
+
+def check_readings(patient_ids, run, sent, acknowledged):
+    """
+    Compare the stored readings of a run with what was sent: `lost` were
+    acknowledged but are missing, `duplicated` are extra copies of one
+    reading, `unexpected` were never sent. Keys are (device_id, recorded_at).
+    Every database holding readings is checked (patients.sharding).
+    """
+    rows = HeartRate.objects.filter(
+        patient_id__in=patient_ids, device_id__startswith=f"stress-{run}-"
+    ).values_list("device_id", "recorded_at")
+    stored = Counter()
+    for part in fan_out(lambda alias: list(rows.using(alias)), databases()):
+        stored.update(part)
+    return {
+        "stored": sum(stored.values()),
+        "lost": len(acknowledged - stored.keys()),
+        "duplicated": sum(n - 1 for n in stored.values()),
+        "unexpected": len(stored.keys() - sent),
+    }
+
+
+def sustained_rate(outcomes, started):
+    """
+    Readings acknowledged per second over the slowest full second of the run
+    (the first and last seconds are ramp-up and drain).
+    """
+    per_second = Counter()
+    for outcome in outcomes:
+        if outcome["created"] is not None:
+            per_second[int(outcome["finished"] - started)] += len(outcome["rows"])
+    seconds = range(1, max(per_second, default=0))
+    return min((per_second[s] for s in seconds), default=None)
+
+
+class Command(BaseCommand):
+    help = (
+        "Stress heart-rate ingestion: start the app (or use --url), have many "
+        "simulated devices post readings concurrently, including retries and "
+        "re-sent batches, then check that no acknowledged reading was lost or "
+        "stored twice. Reports readings/s, errors and latency percentiles; exits "
+        "with an error if the stored data is wrong."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mode", choices=SERVERS, default="wsgi")
+        parser.add_argument("--workers", type=int, default=3)
+        parser.add_argument(
+            "--url", help="use an already running server (endpoints as in --mode)"
+        )
+        parser.add_argument("--devices", type=int, default=50)
+        parser.add_argument("--patients", type=int, default=10)
+        parser.add_argument("--readings", type=int, default=200, help="per device")
+        parser.add_argument("--batch-size", type=int, default=20)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--duplicate-rate", type=float, default=0.05)
+        parser.add_argument("--attempts", type=int, default=3)
+        parser.add_argument("--timeout", type=float, default=30)
+        parser.add_argument("--idempotency-keys", action="store_true")
+        parser.add_argument(
+            "--max-error-rate",
+            type=float,
+            help="also fail if more than this share of requests finally failed",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **options):
+        if min(options["devices"], options["patients"], options["batch_size"]) < 1:
+            raise CommandError("--devices, --patients and --batch-size must be positive.")
+        run = uuid.uuid4().hex[:8]
+        token, patients = self.seed(options["patients"])
+        work = make_work(run, patients, options)
+        headers = {"Authorization": f"Bearer {token}"}
+        path = f"{SERVERS[options['mode']]['prefix']}/heartrates/"
+
+        if options["url"]:
+            outcomes, seconds = self.drive(options["url"], path, headers, work, options)
+        else:
+            try:
+                with serve(options["mode"], options["workers"]) as base_url:
+                    outcomes, seconds = self.drive(base_url, path, headers, work, options)
+            except ServerError as exc:
+                raise CommandError(str(exc))
+
+        def keys(rows):
+            return {(row["device_id"], row["recorded_at"]) for row in rows}
+
+        sent = set().union(*(keys(rows) for _, rows in work))
+        acknowledged = set().union(
+            *(keys(o["rows"]) for o in outcomes if o["created"] is not None)
+        )
+        failed = [o for o in outcomes if o["created"] is None]
+        attempts = [attempt for o in outcomes for attempt in o["attempts"]]
+        statuses = Counter(status for status, _ in attempts)
+        report = {
+            "run": run,
+            "requests": len(outcomes),
+            "attempts": len(attempts),
+            "readings_sent": len(sent),
+            "readings_acknowledged": len(acknowledged),
+            "created_reported": sum(o["created"] or 0 for o in outcomes),
+            "seconds": round(seconds, 3),
+            "readings_per_s": round(len(acknowledged) / seconds, 1) if seconds else None,
+            "sustained_readings_per_s": sustained_rate(outcomes, self.started),
+            "failed_requests": len(failed),
+            "error_rate": round(len(failed) / len(outcomes), 4) if outcomes else 0,
+            "statuses": {str(status): n for status, n in sorted(statuses.items())},
+            **latency_summary(seconds for _, seconds in attempts),
+            **check_readings([p.pk for p in patients], run, sent, acknowledged),
+        }
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            for name, value in report.items():
+                self.stdout.write(f"{name:<26}{value}")
+
+        problems = [
+            f"{report[name]} {name}"
+            for name in ("lost", "duplicated", "unexpected")
+            if report[name]
+        ]
+        max_error_rate = options["max_error_rate"]
+        if max_error_rate is not None and report["error_rate"] > max_error_rate:
+            problems.append(f"error rate {report['error_rate']}")
+        if problems:
+            raise CommandError("Ingestion check failed: " + ", ".join(problems) + ".")
+        self.stdout.write(self.style.SUCCESS("No lost or duplicated readings."))
+
+    def drive(self, base_url, path, headers, work, options):
+        self.started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            outcomes = list(
+                pool.map(
+                    lambda item: post(base_url, path, headers, *item, options), work
+                )
+            )
+        return outcomes, time.perf_counter() - self.started
+
+    def seed(self, count):
+        User = get_user_model()
+        user, _ = User.objects.get_or_create(
+            username="stress", defaults={"is_clinician": False}
+        )
+        patients = []
+        for n in range(count):
+            patient, _ = Patient.objects.get_or_create(
+                external_id=f"stress-patient-{n}",
+                defaults={"first_name": "Stress", "owner": user},
+            )
+            patients.append(patient)
+        return str(RefreshToken.for_user(user).access_token), patients
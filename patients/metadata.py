@@ -0,0 +1,116 @@
+# patients/metadata.py
+"""
+How HeartRate.metadata is stored.
+
+Keys that analysts filter on are promoted out of the JSON into typed HeartRate
+columns at ingestion (`split()`), where they have partial indexes and can be
+filtered with `?signal_quality_max=...` etc. (patients.filters) instead of
+parsing JSON per row. PROMOTABLE lists the keys that have a column;
+HEARTRATE_METADATA_PROMOTE selects which of them are promoted. A value of the
+wrong type stays in the JSON.
+
+The remaining keys are kept according to HEARTRATE_METADATA_REST:
+
+- "json": in the `metadata` JSON column (default)
+- "compressed": zlib-compressed JSON in `metadata_packed`, when that is smaller
+- "drop": discarded
+
+`joined()` reassembles the metadata as sent for the API. Rows written before a
+setting changed are rewritten by `manage.py promote_metadata`.
+"""
+
+import json
+import math
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q
+
+# metadata key (and HeartRate column) -> (type, min, max)
+PROMOTABLE = {
+    "signal_quality": (float, None, None),
+    "battery_level": (int, 0, 32767),
+}
+# HeartRate columns holding a reading's metadata
+STORAGE_FIELDS = (*PROMOTABLE, "metadata", "metadata_packed")
+
+
+def coerce(key, value):
+    """`value` as the type of the `key` column, or None if it does not fit."""
+    kind, low, high = PROMOTABLE[key]
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    if kind is int:
+        if isinstance(value, float) and not value.is_integer():
+            return None
+        value = int(value)
+    elif not math.isfinite(value):
+        return None
+    else:
+        value = float(value)
+    if (low is not None and value < low) or (high is not None and value > high):
+        return None
+    return value
+
+
+def pack(rest):
+    return zlib.compress(json.dumps(rest, separators=(",", ":")).encode())
+
+
+def unpack(data):
+    return json.loads(zlib.decompress(bytes(data)))
+
+
+def split(metadata):
+    """The STORAGE_FIELDS values storing `metadata`."""
+    values = dict.fromkeys(STORAGE_FIELDS)
+    if metadata is None:
+        return values
+    mode = settings.HEARTRATE_METADATA_REST
+    if mode not in ("json", "compressed", "drop"):
+        raise ImproperlyConfigured(f"Unknown HEARTRATE_METADATA_REST {mode!r}.")
+    rest = metadata
+    if isinstance(metadata, dict):
+        rest = dict(metadata)
+        for key in settings.HEARTRATE_METADATA_PROMOTE:
+            if key not in PROMOTABLE:
+                raise ImproperlyConfigured(f"Metadata key {key!r} has no HeartRate column.")
+            value = coerce(key, rest.get(key))
+            if value is not None:
+                values[key] = value
+                del rest[key]
+        if not rest and len(rest) != len(metadata):
+            # everything was promoted
+            return values
+    if mode == "compressed":
+        packed = pack(rest)
+        if len(packed) < len(json.dumps(rest, separators=(",", ":"))):
+            values["metadata_packed"] = packed
+            return values
+    if mode != "drop":
+        values["metadata"] = rest
+    return values
+
+
+def stored(row):
+    """The STORAGE_FIELDS of validated serializer data, for create defaults."""
+    return {field: row[field] for field in STORAGE_FIELDS if field in row}
+
+
+def joined(reading):
+    """The metadata of `reading` as sent: its stored rest plus the promoted keys."""
+    rest = reading.metadata
+    if reading.metadata_packed is not None:
+        rest = unpack(reading.metadata_packed)
+    promoted = {
+        key: getattr(reading, key) for key in PROMOTABLE if getattr(reading, key) is not None
+    }
+    if not promoted:
+        return rest
+    return {**(rest or {}), **promoted}
+
+
+def without_metadata():
+    """Q matching readings that carry no metadata at all."""
+    return Q(**{f"{field}__isnull": True for field in STORAGE_FIELDS})
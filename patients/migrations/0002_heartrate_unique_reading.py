@@ -0,0 +1,31 @@
+# Generated by Django 4.2 on 2026-10-19 18:11
+
+from django.db import migrations, models
+
+
+def remove_duplicates(apps, schema_editor):
+    # Existing duplicates would make AddConstraint fail. On large tables run
+    # `manage.py dedupe_heartrates` before migrating; this is then a no-op.
+    from patients.ingestion import dedupe_heart_rates
+
+    dedupe_heart_rates(
+        model=apps.get_model("patients", "HeartRate"), using=schema_editor.connection.alias
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("patients", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="heartrate",
+            constraint=models.UniqueConstraint(
+                fields=("patient", "device_id", "recorded_at"),
+                name="uniq_heartrate_patient_device_recorded",
+            ),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2 on 2026-10-19 18:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+BRIN_INDEX_NAME = "heartrate_recorded_brin_idx"
+
+
+def create_brin_index(apps, schema_editor):
+    # Opt-in (HEARTRATE_BRIN_INDEX=1): a BRIN index on recorded_at is a few
+    # pages in size on append-mostly tables with hundreds of millions of rows.
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    if not getattr(settings, "HEARTRATE_BRIN_INDEX", False):
+        return
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS {BRIN_INDEX_NAME} "
+        "ON patients_heartrate USING brin (recorded_at)"
+    )
+
+
+def drop_brin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(f"DROP INDEX IF EXISTS {BRIN_INDEX_NAME}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("patients", "0002_heartrate_unique_reading"),
+    ]
+
+    operations = [
+        # create the replacements before dropping the old index so the patient
+        # window queries are never left without one
+        migrations.AddIndex(
+            model_name="heartrate",
+            index=models.Index(
+                fields=["patient", "-recorded_at"],
+                include=("bpm",),
+                name="heartrate_patient_recent_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="heartrate",
+            index=models.Index(
+                fields=["device_id", "-recorded_at"],
+                name="heartrate_device_recent_idx",
+            ),
+        ),
+        migrations.RemoveIndex(
+            model_name="heartrate",
+            name="patients_he_patient_a73817_idx",
+        ),
+        migrations.RunPython(create_brin_index, drop_brin_index),
+    ]
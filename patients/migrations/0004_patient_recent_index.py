@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-19 18:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("patients", "0003_heartrate_query_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="patient",
+            index=models.Index(fields=["-created_at"], name="patient_recent_idx"),
+        ),
+    ]
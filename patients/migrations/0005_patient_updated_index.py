@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-19 18:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("patients", "0004_patient_recent_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="patient",
+            index=models.Index(fields=["updated_at"], name="patient_updated_idx"),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2 on 2026-10-19 18:40
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from patients.search import create_search_index
+
+    create_search_index(schema_editor)
+
+
+def drop_search_index(apps, schema_editor):
+    from patients.search import drop_search_index
+
+    drop_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("patients", "0005_patient_updated_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2 on 2026-10-19 18:26
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_devices(apps, schema_editor):
+    # one-time DISTINCT over existing readings; ingestion keeps it current after
+    HeartRate = apps.get_model("patients", "HeartRate")
+    Device = apps.get_model("patients", "Device")
+    device_ids = (
+        HeartRate.objects.exclude(device_id=None)
+        .exclude(device_id="")
+        .order_by()
+        .values_list("device_id", flat=True)
+        .distinct()
+    )
+    now = timezone.now()
+    Device.objects.bulk_create(
+        (Device(device_id=device_id, first_seen=now) for device_id in device_ids),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("patients", "0006_patient_search_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Device",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("device_id", models.CharField(max_length=128, unique=True)),
+                ("first_seen", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ("device_id",),
+            },
+        ),
+        migrations.RunPython(backfill_devices, migrations.RunPython.noop),
+    ]
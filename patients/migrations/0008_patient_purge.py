@@ -0,0 +1,67 @@
+# Generated by Django 4.2 on 2026-10-19 18:47
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("patients", "0007_device"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PatientPurge",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("patient_id", models.BigIntegerField()),
+                ("status", models.CharField(choices=[("pending", "Pending"), ("running", "Running"), ("done", "Done"), ("failed", "Failed")], default="pending", max_length=10)),
+                ("readings_total", models.BigIntegerField(blank=True, help_text="Readings to delete, counted when the purge starts", null=True)),
+                ("readings_deleted", models.BigIntegerField(default=0)),
+                ("error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ("-created_at",),
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name="patient",
+            name="patient_recent_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="patient",
+            name="patient_updated_idx",
+        ),
+        migrations.AddField(
+            model_name="patient",
+            name="deleted_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="patient",
+            index=models.Index(condition=models.Q(("deleted_at__isnull", True)), fields=["-created_at"], name="patient_recent_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="patient",
+            index=models.Index(condition=models.Q(("deleted_at__isnull", True)), fields=["updated_at"], name="patient_updated_idx"),
+        ),
+        migrations.AddField(
+            model_name="patientpurge",
+            name="requested_by",
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="+", to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name="patientpurge",
+            index=models.Index(fields=["patient_id"], name="patients_pa_patient_684fb9_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="patientpurge",
+            index=models.Index(fields=["status"], name="patients_pa_status_1c0327_idx"),
+        ),
+    ]
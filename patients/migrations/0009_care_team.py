@@ -0,0 +1,28 @@
+# Generated by Django 4.2 on 2026-10-19 18:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("patients", "0008_patient_purge"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CareTeam",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.CharField(max_length=150)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("members", models.ManyToManyField(blank=True, related_name="care_teams", to=settings.AUTH_USER_MODEL)),
+                ("patients", models.ManyToManyField(blank=True, related_name="care_teams", to="patients.patient")),
+            ],
+            options={
+                "ordering": ("name",),
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2 on 2026-10-19 18:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("patients", "0009_care_team"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HeartRateRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("bucket", models.DateTimeField()),
+                ("count", models.PositiveIntegerField()),
+                ("bpm_min", models.PositiveSmallIntegerField()),
+                ("bpm_max", models.PositiveSmallIntegerField()),
+                ("bpm_sum", models.BigIntegerField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("patient", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="rollups", to="patients.patient")),
+            ],
+            options={
+                "ordering": ("bucket",),
+            },
+        ),
+        migrations.CreateModel(
+            name="DirtyBucket",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("bucket", models.DateTimeField()),
+                ("marked_at", models.DateTimeField()),
+                ("patient", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="+", to="patients.patient")),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="heartraterollup",
+            constraint=models.UniqueConstraint(fields=("patient", "bucket"), name="uniq_rollup_patient_bucket"),
+        ),
+        migrations.AddIndex(
+            model_name="dirtybucket",
+            index=models.Index(fields=["marked_at"], name="patients_di_marked__18ce8f_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="dirtybucket",
+            constraint=models.UniqueConstraint(fields=("patient", "bucket"), name="uniq_dirty_patient_bucket"),
+        ),
+    ]
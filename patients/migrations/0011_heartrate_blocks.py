@@ -0,0 +1,40 @@
+# Generated by Django 4.2 on 2026-10-19 19:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("patients", "0010_heartrate_rollups"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HeartRateBlock",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("device_id", models.CharField(blank=True, max_length=128, null=True)),
+                ("bucket", models.DateTimeField()),
+                ("count", models.PositiveIntegerField()),
+                ("bpm_min", models.PositiveSmallIntegerField()),
+                ("bpm_max", models.PositiveSmallIntegerField()),
+                ("bpm_sum", models.BigIntegerField()),
+                ("data", models.BinaryField()),
+                ("compacted_at", models.DateTimeField(auto_now=True)),
+                ("patient", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="heart_rate_blocks", to="patients.patient")),
+            ],
+            options={
+                "ordering": ("-bucket",),
+            },
+        ),
+        migrations.AddIndex(
+            model_name="heartrateblock",
+            index=models.Index(fields=["patient", "-bucket"], name="heartrate_block_recent_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="heartrateblock",
+            constraint=models.UniqueConstraint(fields=("patient", "device_id", "bucket"), name="uniq_block_patient_device_bucket"),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2 on 2026-10-19 19:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+GIN_INDEX_NAME = "heartrate_metadata_gin_idx"
+
+
+def create_gin_index(apps, schema_editor):
+    # Opt-in (HEARTRATE_METADATA_GIN_INDEX=1): ad-hoc `metadata__contains`
+    # queries on keys that have no column of their own.
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    if not getattr(settings, "HEARTRATE_METADATA_GIN_INDEX", False):
+        return
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS {GIN_INDEX_NAME} "
+        "ON patients_heartrate USING gin (metadata jsonb_path_ops)"
+    )
+
+
+def drop_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(f"DROP INDEX IF EXISTS {GIN_INDEX_NAME}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("patients", "0011_heartrate_blocks"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="heartrate",
+            name="battery_level",
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="heartrate",
+            name="metadata_packed",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="heartrate",
+            name="signal_quality",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="heartrate",
+            index=models.Index(condition=models.Q(("signal_quality__isnull", False)), fields=["signal_quality", "-recorded_at"], name="heartrate_signal_quality_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="heartrate",
+            index=models.Index(condition=models.Q(("battery_level__isnull", False)), fields=["battery_level", "-recorded_at"], name="heartrate_battery_level_idx"),
+        ),
+        migrations.RunPython(create_gin_index, drop_gin_index),
+    ]
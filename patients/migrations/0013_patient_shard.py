@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-19 19:26
+
+from django.db import migrations, models
+
+
+def create_search_index(apps, schema_editor):
+    # adding the column rebuilds patients_patient on SQLite, dropping the
+    # search triggers
+    from patients.search import create_search_index
+
+    create_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("patients", "0012_heartrate_promoted_metadata"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="patient",
+            name="shard",
+            field=models.CharField(blank=True, default="", editable=False, max_length=64),
+        ),
+        migrations.RunPython(create_search_index, migrations.RunPython.noop),
+    ]
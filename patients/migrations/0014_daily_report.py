@@ -0,0 +1,39 @@
+# Generated by Django 4.2 on 2026-10-19 19:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("patients", "0013_patient_shard"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyReport",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("day", models.DateField()),
+                ("count", models.PositiveIntegerField()),
+                ("bpm_min", models.PositiveSmallIntegerField()),
+                ("bpm_max", models.PositiveSmallIntegerField()),
+                ("bpm_sum", models.BigIntegerField()),
+                ("seconds_covered", models.PositiveIntegerField()),
+                ("seconds_above", models.PositiveIntegerField()),
+                ("seconds_below", models.PositiveIntegerField()),
+                ("high_bpm", models.PositiveSmallIntegerField()),
+                ("low_bpm", models.PositiveSmallIntegerField()),
+                ("generated_at", models.DateTimeField(auto_now=True)),
+                ("patient", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="daily_reports", to="patients.patient")),
+            ],
+            options={
+                "ordering": ("day",),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="dailyreport",
+            constraint=models.UniqueConstraint(fields=("patient", "day"), name="uniq_report_patient_day"),
+        ),
+    ]
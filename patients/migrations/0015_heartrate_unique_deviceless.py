@@ -0,0 +1,31 @@
+# Generated by Django 4.2 on 2026-10-19 20:02
+
+from django.db import migrations, models
+
+
+def remove_duplicates(apps, schema_editor):
+    # Device-less duplicates would make AddConstraint fail; see 0002.
+    from patients.ingestion import dedupe_heart_rates
+
+    dedupe_heart_rates(
+        model=apps.get_model("patients", "HeartRate"), using=schema_editor.connection.alias
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("patients", "0014_daily_report"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="heartrate",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("device_id__isnull", True)),
+                fields=("patient", "recorded_at"),
+                name="uniq_heartrate_patient_recorded_no_device",
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2 on 2026-10-19 20:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("patients", "0015_heartrate_unique_deviceless"),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name="dirtybucket",
+            name="uniq_dirty_patient_bucket",
+        ),
+        migrations.RemoveIndex(
+            model_name="dirtybucket",
+            name="patients_di_marked__18ce8f_idx",
+        ),
+        migrations.AddIndex(
+            model_name="dirtybucket",
+            index=models.Index(fields=["patient", "bucket"], name="dirty_patient_bucket_idx"),
+        ),
+    ]
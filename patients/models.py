@@ -3,6 +3,12 @@ from django.conf import settings
 from django.db import models
 
 
+class PatientQuerySet(models.QuerySet):
+    def active(self):
+        """Patients that are not being purged."""
+        return self.filter(deleted_at__isnull=True)
+
+
 class Patient(models.Model):
     """
     Represents a patient monitored by the devices.
@@ -33,12 +39,33 @@ class Patient(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # set when a purge is requested: the patient is hidden from then on and
+    # deleted, readings first, by a PatientPurge job (see patients.purge)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # database holding the patient's readings ("" = default), set before the
+    # first reading is stored; see patients.sharding
+    shard = models.CharField(max_length=64, blank=True, default="", editable=False)
+
+    objects = PatientQuerySet.as_manager()
 
     class Meta:
         ordering = ("-created_at",)
         indexes = [
             models.Index(fields=["external_id"]),
             models.Index(fields=["owner"]),
+            # clinician/staff list: all patients, newest first (default ordering);
+            # partial, so hiding purged patients (active()) costs no scan
+            models.Index(
+                fields=["-created_at"],
+                name="patient_recent_idx",
+                condition=models.Q(deleted_at__isnull=True),
+            ),
+            # ETag/Last-Modified of patient lists (max(updated_at)) without a scan
+            models.Index(
+                fields=["updated_at"],
+                name="patient_updated_idx",
+                condition=models.Q(deleted_at__isnull=True),
+            ),
         ]
 
     def __str__(self):
@@ -46,6 +73,34 @@ class Patient(models.Model):
             f" ({self.external_id})" if self.external_id else ""
         )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # lets post_save see ownership changes (access sets, see patients.access)
+        instance._loaded_owner_id = instance.__dict__.get("owner_id")
+        return instance
+
+
+class CareTeam(models.Model):
+    """
+    Users sharing a set of patients, e.g. the staff of a ward. Members can
+    view and edit the team's patients and add readings for them, like owners.
+    """
+
+    name = models.CharField(max_length=150)
+    members = models.ManyToManyField(
+        settings.AUTH_USER_MODEL, related_name="care_teams", blank=True
+    )
+    patients = models.ManyToManyField(Patient, related_name="care_teams", blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ("name",)
+
+    def __str__(self):
+        return self.name
+
 
 class HeartRate(models.Model):
     """
@@ -61,15 +116,240 @@ class HeartRate(models.Model):
     metadata = models.JSONField(
         blank=True, null=True, help_text="Optional additional data from device"
     )
+    # hot metadata keys promoted to typed columns at ingestion (patients.metadata)
+    signal_quality = models.FloatField(blank=True, null=True)
+    battery_level = models.PositiveSmallIntegerField(blank=True, null=True)
+    # the remaining metadata, zlib-compressed (HEARTRATE_METADATA_REST=compressed)
+    metadata_packed = models.BinaryField(blank=True, null=True, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ("-recorded_at",)
         indexes = [
-            models.Index(fields=["patient", "recorded_at"]),
+            # patient window queries, newest first (the default ordering); on
+            # Postgres `bpm` is included so aggregates can use index-only scans
+            models.Index(
+                fields=["patient", "-recorded_at"],
+                include=["bpm"],
+                name="heartrate_patient_recent_idx",
+            ),
+            # ?device_id=... with or without a time window
+            models.Index(
+                fields=["device_id", "-recorded_at"],
+                name="heartrate_device_recent_idx",
+            ),
             models.Index(fields=["recorded_at"]),
+            # analyst filters on promoted metadata; most readings carry none
+            models.Index(
+                fields=["signal_quality", "-recorded_at"],
+                condition=models.Q(signal_quality__isnull=False),
+                name="heartrate_signal_quality_idx",
+            ),
+            models.Index(
+                fields=["battery_level", "-recorded_at"],
+                condition=models.Q(battery_level__isnull=False),
+                name="heartrate_battery_level_idx",
+            ),
+        ]
+        constraints = [
+            # devices retry on timeouts; the same reading must only be stored once
+            models.UniqueConstraint(
+                fields=["patient", "device_id", "recorded_at"],
+                name="uniq_heartrate_patient_device_recorded",
+            ),
+            # NULLs never compare equal above: readings without a device need
+            # their own (partial) constraint
+            models.UniqueConstraint(
+                fields=["patient", "recorded_at"],
+                condition=models.Q(device_id__isnull=True),
+                name="uniq_heartrate_patient_recorded_no_device",
+            ),
         ]
 
     def __str__(self):
         return f"{self.patient} — {self.bpm} bpm at {self.recorded_at.isoformat()}"
+
+
+class HeartRateBlock(models.Model):
+    """
+    The readings of one patient and device in one closed UTC hour (`bucket`),
+    compacted into a single row: `data` holds the delta-encoded timestamps and
+    bpm values (see patients.compaction). Only written by `compact_heartrates`.
+    """
+
+    patient = models.ForeignKey(
+        Patient, on_delete=models.CASCADE, related_name="heart_rate_blocks"
+    )
+    device_id = models.CharField(max_length=128, blank=True, null=True)
+    bucket = models.DateTimeField()
+    count = models.PositiveIntegerField()
+    bpm_min = models.PositiveSmallIntegerField()
+    bpm_max = models.PositiveSmallIntegerField()
+    bpm_sum = models.BigIntegerField()
+    data = models.BinaryField()
+
+    compacted_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ("-bucket",)
+        indexes = [
+            models.Index(fields=["patient", "-bucket"], name="heartrate_block_recent_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["patient", "device_id", "bucket"],
+                name="uniq_block_patient_device_bucket",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.patient_id} @ {self.bucket.isoformat()}: {self.count} readings"
+
+
+class HeartRateRollup(models.Model):
+    """
+    Hourly aggregates of a patient's readings (`bucket` is the UTC hour).
+    Maintained incrementally from DirtyBucket rows, see patients.rollups.
+    """
+
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="rollups")
+    bucket = models.DateTimeField()
+    count = models.PositiveIntegerField()
+    bpm_min = models.PositiveSmallIntegerField()
+    bpm_max = models.PositiveSmallIntegerField()
+    bpm_sum = models.BigIntegerField()
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ("bucket",)
+        constraints = [
+            # also the index of per-patient range reads
+            models.UniqueConstraint(
+                fields=["patient", "bucket"], name="uniq_rollup_patient_bucket"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.patient_id} @ {self.bucket.isoformat()}: {self.count} readings"
+
+
+class DailyReport(models.Model):
+    """
+    One patient's readings summarized over one UTC day, materialized by
+    `manage.py materialize_reports` (see patients.reports). The seconds are
+    time covered by readings, each standing for at most DAILY_REPORT_MAX_GAP
+    seconds: in total, above `high_bpm` and below `low_bpm`.
+    """
+
+    patient = models.ForeignKey(
+        Patient, on_delete=models.CASCADE, related_name="daily_reports"
+    )
+    day = models.DateField()
+    count = models.PositiveIntegerField()
+    bpm_min = models.PositiveSmallIntegerField()
+    bpm_max = models.PositiveSmallIntegerField()
+    bpm_sum = models.BigIntegerField()
+    seconds_covered = models.PositiveIntegerField()
+    seconds_above = models.PositiveIntegerField()
+    seconds_below = models.PositiveIntegerField()
+    # thresholds in effect when the report was computed
+    high_bpm = models.PositiveSmallIntegerField()
+    low_bpm = models.PositiveSmallIntegerField()
+
+    generated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ("day",)
+        constraints = [
+            # also the index of per-patient range reads
+            models.UniqueConstraint(fields=["patient", "day"], name="uniq_report_patient_day"),
+        ]
+
+    def __str__(self):
+        return f"{self.patient_id} on {self.day.isoformat()}: {self.count} readings"
+
+
+class DirtyBucket(models.Model):
+    """
+    A mark of a (patient, hour) whose readings changed after its rollup was
+    computed. Ingestion appends marks; `manage.py recompute_rollups` refreshes
+    the marked buckets and clears the marks it claimed, by id (see
+    patients.rollups). A bucket may have several marks.
+    """
+
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="+")
+    bucket = models.DateTimeField()
+    marked_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=["patient", "bucket"], name="dirty_patient_bucket_idx")]
+
+    def __str__(self):
+        return f"{self.patient_id} @ {self.bucket.isoformat()}"
+
+
+class Device(models.Model):
+    """
+    Device ids seen at ingestion. A small lookup table so listing devices (e.g.
+    the admin device filter) never needs a DISTINCT over all heart rates.
+    """
+
+    device_id = models.CharField(max_length=128, unique=True)
+    first_seen = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ("device_id",)
+
+    def __str__(self):
+        return self.device_id
+
+
+class PatientPurge(models.Model):
+    """
+    Background deletion of a patient and its readings, with progress. Readings
+    go in bounded batches (PURGE_BATCH_SIZE rows per DELETE and transaction),
+    then the patient row itself.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    # not a ForeignKey: the patient row is gone once the purge is done
+    patient_id = models.BigIntegerField()
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    readings_total = models.BigIntegerField(
+        null=True, blank=True, help_text="Readings to delete, counted when the purge starts"
+    )
+    readings_deleted = models.BigIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("-created_at",)
+        indexes = [
+            models.Index(fields=["patient_id"]),
+            models.Index(fields=["status"]),
+        ]
+
+    def __str__(self):
+        return f"purge of patient {self.patient_id} ({self.status})"
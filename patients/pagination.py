@@ -0,0 +1,56 @@
+# patients/pagination.py
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max
+from django.utils.functional import cached_property
+from rest_framework.pagination import LimitOffsetPagination
+
+
+class CountHintPagination(LimitOffsetPagination):
+    """
+    LimitOffsetPagination that reuses a row count the view already computed
+    (`view.count_hint`, e.g. while building its ETag) instead of running a
+    second COUNT(*) over the same queryset.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_hint = getattr(view, "count_hint", None)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count(self, queryset):
+        if self.count_hint is not None:
+            return self.count_hint
+        return super().get_count(queryset)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Django admin paginator for very large tables. COUNT(*) over the whole table
+    is replaced by a catalog estimate, and filtered counts stop at
+    `max_count` rows (the admin then shows the last page as "max_count").
+    """
+
+    max_count = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            return estimate_row_count(queryset.model, queryset.db)
+        return queryset.order_by()[: self.max_count].count()
+
+
+def estimate_row_count(model, using):
+    connection = connections[using]
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                [model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # -1 / 0 until the table has been analyzed
+        if row and row[0] > 0:
+            return row[0]
+    # ids are sequential; MAX(pk) is read from the end of the primary key index
+    return model._default_manager.using(using).aggregate(n=Max("pk"))["n"] or 0
@@ -1,11 +1,16 @@
 # patients/permissions.py
 from rest_framework import permissions
 
+from .access import access_for
+
 
 class IsOwnerOrClinicianOrReadOnly(permissions.BasePermission):
     """
     - Read: allowed for authenticated users (you can restrict further if needed).
-    - Write: allowed if user is owner (patient.owner) OR user.is_clinician OR user.is_staff.
+    - Write: allowed if user is owner (patient.owner), shares the patient through a care
+      team, OR user.is_clinician OR user.is_staff.
+
+    Uses the view's precomputed access set (patients.access), an O(1) lookup per object.
     """
 
     def has_permission(self, request, view):
@@ -14,32 +19,9 @@ class IsOwnerOrClinicianOrReadOnly(permissions.BasePermission):
 
     def has_object_permission(self, request, view, obj):
         # obj can be Patient or HeartRate (heart_rate.patient)
-        user = request.user
         if request.method in permissions.SAFE_METHODS:
             return True
-        # Map if obj is HeartRate, check obj.patient.owner
-        patient_owner = getattr(obj, "patient", None) or getattr(obj, "owner", None)
-        # If obj is Patient, `patient_owner` is obj.owner (via getattr above)
-        if hasattr(patient_owner, "owner") and not isinstance(
-            patient_owner, (int, str)
-        ):
-            # fallback
-            pass
-        # If patient_owner is a User instance:
-        if patient_owner is None:
-            return False
-        # If patient_owner is a User model instance:
-        try:
-            owner_user = patient_owner if hasattr(patient_owner, "pk") else None
-        except Exception:
-            owner_user = None
-
-        # allow if user is staff or clinician
-        if user.is_staff or getattr(user, "is_clinician", False):
-            return True
-
-        # allow if user is owner_user
-        if owner_user and owner_user == user:
-            return True
 
-        return False
+        # ids only, so the patient/owner rows are never loaded for the check
+        access = getattr(view, "access", None) or access_for(request.user)
+        return access.allows(getattr(obj, "patient_id", obj.pk))
@@ -0,0 +1,141 @@
+# patients/purge.py
+"""
+Deleting a patient together with all of its readings, without one DELETE of
+millions of rows in a single transaction.
+
+`request_purge()` hides the patient at once (`deleted_at` is set, so
+`Patient.objects.active()` and every API endpoint stop returning it) and
+records a PatientPurge job. Once the request's transaction commits, the job
+runs in a background thread of the requesting process (PURGE_WORKERS threads,
+or inline with PURGE_IN_BACKGROUND off). `manage.py purge_patients --resume`
+finishes jobs a restart interrupted.
+
+A job deletes readings PURGE_BATCH_SIZE at a time: an indexed id lookup plus
+one `DELETE ... WHERE id IN (...)`, each batch in its own short transaction,
+optionally sleeping PURGE_PAUSE seconds in between. Progress is saved on the
+job row after every batch. With HEARTRATE_SHARDS every shard is purged in
+turn, including the patient's stub row there. The patient row goes last, when
+its cascade has nothing left to delete.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from .access import invalidate_access
+from .models import CareTeam, HeartRate, Patient, PatientPurge
+from .response_cache import invalidate_heart_rates, invalidate_patients
+from .sharding import databases
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def request_purge(patient, user=None, start=True):
+    """
+    Hide `patient` and create its purge job. With `start`, the job is started
+    when the current transaction commits. Returns the job.
+    """
+    with transaction.atomic():
+        patient.deleted_at = timezone.now()
+        Patient.objects.filter(pk=patient.pk).update(deleted_at=patient.deleted_at)
+        job = PatientPurge.objects.create(patient_id=patient.pk, requested_by=user)
+        if start:
+            transaction.on_commit(lambda: start_purge(job.pk))
+    # update() sends no post_save signal
+    invalidate_patients([patient])
+    # the cached access sets of everyone who could see the patient include it
+    members = CareTeam.members.through.objects.filter(careteam__patients=patient.pk)
+    invalidate_access([patient.owner_id, *members.values_list("customuser_id", flat=True)])
+    return job
+
+
+def start_purge(job_id):
+    if not settings.PURGE_IN_BACKGROUND:
+        run_purge(PatientPurge.objects.get(pk=job_id))
+        return
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PURGE_WORKERS, thread_name_prefix="purge"
+            )
+    _executor.submit(_run_in_thread, job_id)
+
+
+def _run_in_thread(job_id):
+    try:
+        run_purge(PatientPurge.objects.get(pk=job_id))
+    except Exception:
+        logger.exception("purge job %s failed", job_id)
+    finally:
+        # the thread's own connections
+        connections.close_all()
+
+
+def run_purge(job, batch_size=None, pause=None, stdout=None):
+    """
+    Delete the job's readings in batches, then the patient. Resumes where an
+    interrupted run stopped. Returns the job.
+    """
+    batch_size = batch_size or settings.PURGE_BATCH_SIZE
+    pause = settings.PURGE_PAUSE if pause is None else pause
+    readings = HeartRate.objects.filter(patient_id=job.patient_id).order_by()
+    # None if a previous run already deleted it
+    patient = Patient.objects.filter(pk=job.patient_id).first()
+
+    job.status = PatientPurge.RUNNING
+    job.started_at = job.started_at or timezone.now()
+    job.error = ""
+    if job.readings_total is None:
+        # every database that can hold readings (patients.sharding), so
+        # readings left behind by an interrupted rebalance go too
+        job.readings_total = sum(readings.using(alias).count() for alias in databases())
+    job.save(update_fields=["status", "started_at", "error", "readings_total"])
+    try:
+        for alias in databases():
+            while True:
+                with transaction.atomic(using=alias):
+                    ids = list(readings.using(alias).values_list("pk", flat=True)[:batch_size])
+                    if not ids:
+                        break
+                    # HeartRate has no reverse relations, so this is a single DELETE
+                    deleted, _ = HeartRate.objects.using(alias).filter(pk__in=ids).delete()
+                job.readings_deleted += deleted
+                job.save(update_fields=["readings_deleted"])
+                if patient is not None:
+                    invalidate_heart_rates([patient])
+                if stdout is not None:
+                    stdout.write(
+                        f"patient {job.patient_id}: deleted "
+                        f"{job.readings_deleted}/{job.readings_total} readings"
+                    )
+                if pause:
+                    time.sleep(pause)
+            if alias != DEFAULT_DB_ALIAS:
+                Patient.objects.using(alias).filter(pk=job.patient_id).delete()
+        if patient is not None:
+            # signals invalidate the patient's cached responses
+            patient.delete()
+    except Exception as exc:
+        job.status = PatientPurge.FAILED
+        job.error = f"{type(exc).__name__}: {exc}"
+        job.finished_at = timezone.now()
+        job.save(update_fields=["status", "error", "finished_at"])
+        raise
+    job.status = PatientPurge.DONE
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "finished_at"])
+    return job
+
+
+def unfinished_purges():
+    """Jobs that are pending, were interrupted or failed, oldest first."""
+    return PatientPurge.objects.exclude(status=PatientPurge.DONE).order_by("created_at")
@@ -0,0 +1,231 @@
+# patients/recent.py
+"""
+In-memory ring buffers of each patient's most recent readings, for
+"last N minutes" reads that never touch the database.
+
+Every buffer holds up to RECENT_READINGS_CAPACITY readings of one patient in
+two fixed-size arrays, `array("d")` timestamps and `array("H")` bpm (10 bytes
+per reading), in recorded_at order. Buffers are per process, bounded by
+RECENT_READINGS_MAX_PATIENTS (least recently used patients are dropped).
+
+Coherence across worker processes reuses the response-cache namespace version
+`heartrates:patient:{id}` (see response_cache): a buffer remembers the version
+it is consistent with, and a read that finds a different version (readings
+written, changed or deleted elsewhere) refills the buffer with one indexed
+query. Readings ingested by this process are appended in place. That only
+holds if every process sees the same versions, incremented atomically: with
+several worker processes the settings require API_CACHE_BACKEND=redis.
+
+A window that starts before the oldest buffered reading (once the buffer has
+wrapped) cannot be answered from memory; `window()` returns None and callers
+read the database instead.
+"""
+
+import datetime
+import threading
+from array import array
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+from rest_framework.fields import DateTimeField
+
+from .models import HeartRate
+from .response_cache import namespace_versions
+from .sharding import aliases_by_patient, databases, fan_out
+
+# the whole history of a patient that never filled its buffer is buffered
+EVERYTHING = float("-inf")
+
+
+def namespace(patient_id):
+    return f"heartrates:patient:{patient_id}"
+
+
+class RingBuffer:
+    """Fixed-capacity (timestamp, bpm) ring, oldest first."""
+
+    __slots__ = (
+        "capacity",
+        "timestamps",
+        "bpm",
+        "start",
+        "size",
+        "complete_since",
+        "version",
+    )
+
+    def __init__(self, capacity, version=None):
+        self.capacity = capacity
+        self.timestamps = array("d", bytes(8 * capacity))
+        self.bpm = array("H", bytes(2 * capacity))
+        self.start = 0
+        self.size = 0
+        # every reading recorded at or after this timestamp is buffered
+        self.complete_since = EVERYTHING
+        self.version = version
+
+    def __len__(self):
+        return self.size
+
+    def timestamp_at(self, i):
+        return self.timestamps[(self.start + i) % self.capacity]
+
+    def append(self, timestamp, bpm):
+        """Add a reading; False if it is older than the newest buffered one."""
+        if self.size and timestamp < self.timestamp_at(self.size - 1):
+            return False
+        if self.size < self.capacity:
+            index = (self.start + self.size) % self.capacity
+            self.size += 1
+        else:
+            # full: overwrite the oldest reading
+            index = self.start
+            self.start = (self.start + 1) % self.capacity
+            self.complete_since = self.timestamp_at(0)
+        self.timestamps[index] = timestamp
+        self.bpm[index] = bpm
+        return True
+
+    def bisect(self, timestamp):
+        """Index of the first reading recorded at or after `timestamp`."""
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamp_at(middle) < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def window(self, since, until=None):
+        """([timestamps], [bpm]) recorded in [since, until), or None if not buffered."""
+        if since < self.complete_since:
+            return None
+        first = self.bisect(since)
+        last = self.size if until is None else self.bisect(until)
+        indexes = [(self.start + i) % self.capacity for i in range(first, last)]
+        return [self.timestamps[i] for i in indexes], [self.bpm[i] for i in indexes]
+
+
+class RecentReadings:
+    def __init__(self, capacity, max_patients):
+        self.capacity = capacity
+        self.max_patients = max_patients
+        self.buffers = OrderedDict()
+        self.lock = threading.Lock()
+
+    def load(self, patient_id, version):
+        """Fill a buffer from the database (newest `capacity` readings)."""
+        alias = aliases_by_patient([patient_id]).get(patient_id, DEFAULT_DB_ALIAS)
+        rows = list(
+            HeartRate.objects.using(alias)
+            .filter(patient_id=patient_id)
+            .order_by("-recorded_at")
+            .values_list("recorded_at", "bpm")[: self.capacity]
+        )
+        buffer = RingBuffer(self.capacity, version)
+        for recorded_at, bpm in reversed(rows):
+            buffer.append(recorded_at.timestamp(), bpm)
+        if len(rows) == self.capacity:
+            buffer.complete_since = buffer.timestamp_at(0)
+        return buffer
+
+    def store(self, patient_id, buffer):
+        self.buffers[patient_id] = buffer
+        self.buffers.move_to_end(patient_id)
+        while len(self.buffers) > self.max_patients:
+            self.buffers.popitem(last=False)
+
+    def get(self, patient_id):
+        """The patient's buffer, refilled first if the data changed elsewhere."""
+        # read the version before the rows: a write racing the refill bumps it
+        # again, so the next read refills once more
+        (version,) = namespace_versions([namespace(patient_id)])
+        with self.lock:
+            buffer = self.buffers.get(patient_id)
+            if buffer is not None and buffer.version == version:
+                self.buffers.move_to_end(patient_id)
+                return buffer
+        buffer = self.load(patient_id, version)
+        with self.lock:
+            self.store(patient_id, buffer)
+        return buffer
+
+    def window(self, patient_id, since, until=None):
+        buffer = self.get(patient_id)
+        with self.lock:
+            return buffer.window(since.timestamp(), until and until.timestamp())
+
+    def add(self, readings, versions):
+        """
+        Append freshly inserted readings. `versions` maps namespaces to the
+        versions the insert bumped them to; a buffer is kept only if it was
+        current right before that bump, i.e. nothing else was written since.
+        """
+        by_patient = {}
+        for reading in sorted(readings, key=lambda r: r.recorded_at):
+            by_patient.setdefault(reading.patient_id, []).append(reading)
+        with self.lock:
+            for patient_id, rows in by_patient.items():
+                buffer = self.buffers.get(patient_id)
+                if buffer is None:
+                    continue
+                version = versions.get(namespace(patient_id))
+                appended = (
+                    version is not None
+                    and buffer.version == version - 1
+                    and all(buffer.append(r.recorded_at.timestamp(), r.bpm) for r in rows)
+                )
+                if appended:
+                    buffer.version = version
+                else:
+                    # late/out-of-order reading or a concurrent writer: refill
+                    del self.buffers[patient_id]
+
+    def clear(self):
+        with self.lock:
+            self.buffers.clear()
+
+    def warm(self, patients=None):
+        """Load the buffers of the patients with the most recent readings."""
+        patients = settings.RECENT_READINGS_WARM if patients is None else patients
+        if not patients:
+            return 0
+        since = timezone.now() - timezone.timedelta(
+            seconds=settings.RECENT_READINGS_WARM_WINDOW
+        )
+        recent = (
+            HeartRate.objects.filter(recorded_at__gte=since)
+            .order_by()
+            .values_list("patient_id", flat=True)
+            .distinct()
+        )
+        # every database holding readings, in parallel (patients.sharding)
+        found = fan_out(lambda alias: list(recent.using(alias)[:patients]), databases())
+        patient_ids = list(dict.fromkeys(pk for part in found for pk in part))[:patients]
+        for patient_id in patient_ids:
+            self.get(patient_id)
+        return len(patient_ids)
+
+
+recent_readings = RecentReadings(
+    settings.RECENT_READINGS_CAPACITY, settings.RECENT_READINGS_MAX_PATIENTS
+)
+
+
+def summarize(timestamps, bpm):
+    """Response body of a recent window: columns plus aggregates."""
+    as_text = DateTimeField().to_representation
+    return {
+        "count": len(bpm),
+        "min": min(bpm, default=None),
+        "max": max(bpm, default=None),
+        "avg": round(sum(bpm) / len(bpm), 1) if bpm else None,
+        "recorded_at": [
+            as_text(datetime.datetime.fromtimestamp(t, tz=datetime.timezone.utc))
+            for t in timestamps
+        ],
+        "bpm": bpm,
+    }
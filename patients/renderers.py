@@ -0,0 +1,33 @@
+# patients/renderers.py
+from rest_framework.renderers import JSONRenderer
+
+
+def to_columns(rows, fields=()):
+    """Transpose a list of dicts into one list per field: {"bpm": [72, 75], ...}."""
+    fields = list(rows[0]) if rows else list(fields)
+    return {field: [row[field] for row in rows] for field in fields}
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """
+    `?format=columnar`: list responses (paginated or not) are sent column-wise,
+    so each key appears once per page instead of once per row. Objects and
+    errors are rendered unchanged.
+    """
+
+    format = "columnar"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        context = renderer_context or {}
+        response = context.get("response")
+        if response is None or response.status_code < 400:
+            if isinstance(data, list):
+                data = self.columns(data, context.get("view"))
+            elif isinstance(data, dict) and isinstance(data.get("results"), list):
+                data = {**data, "results": self.columns(data["results"], context.get("view"))}
+        return super().render(data, accepted_media_type, renderer_context)
+
+    def columns(self, rows, view):
+        # an empty page still lists the columns
+        fields = view.get_serializer().fields if not rows and view is not None else ()
+        return to_columns(rows, fields)
@@ -0,0 +1,187 @@
+# patients/reports.py
+"""
+Daily per-patient reports (DailyReport), materialized ahead of the morning
+rounds by `manage.py materialize_reports` (e.g. from cron after midnight UTC).
+
+A report covers one UTC day of a patient's readings: count, min/max/mean bpm,
+and how long the heart rate was above DAILY_REPORT_HIGH_BPM, below
+DAILY_REPORT_LOW_BPM and covered by readings at all. Each reading stands for
+the time until the next one, at most DAILY_REPORT_MAX_GAP seconds, so gaps in
+the data count as uncovered instead of as time at the last value. A report is
+one row of integer columns (the mean is sum / count, as in the rollups), read
+by range over its (patient, day) unique index.
+
+Patients with readings that day are split into chunks, computed in a pool of
+worker processes (forked, so POSIX only). A worker reads one patient's day at
+a time, one indexed range query on the patient's shard plus the day's
+compacted blocks with HEARTRATE_COMPACTION, and upserts its chunk's reports
+in one statement. Recomputing a day replaces its reports; patients left
+without readings that day lose theirs.
+"""
+
+import datetime
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .compaction import decode, reaches_blocks
+from .models import DailyReport, HeartRate, HeartRateBlock
+from .sharding import aliases_by_patient, databases, fan_out
+
+DAY = datetime.timedelta(days=1)
+# patients per worker task
+CHUNK_SIZE = 50
+REPORT_FIELDS = [
+    "count",
+    "bpm_min",
+    "bpm_max",
+    "bpm_sum",
+    "seconds_covered",
+    "seconds_above",
+    "seconds_below",
+    "high_bpm",
+    "low_bpm",
+    "generated_at",
+]
+
+
+def day_window(day):
+    """[start, end) of the UTC `day`."""
+    start = datetime.datetime.combine(day, datetime.time.min, tzinfo=datetime.timezone.utc)
+    return start, start + DAY
+
+
+def day_readings(patient_id, start, end, using=DEFAULT_DB_ALIAS):
+    """(recorded_at, bpm) pairs of one patient within [start, end), oldest first."""
+    pairs = list(
+        HeartRate.objects.using(using)
+        .filter(patient_id=patient_id, recorded_at__gte=start, recorded_at__lt=end)
+        .order_by("recorded_at")
+        .values_list("recorded_at", "bpm")
+    )
+    if reaches_blocks(start):
+        blocks = HeartRateBlock.objects.filter(
+            patient_id=patient_id, bucket__gte=start, bucket__lt=end
+        ).values_list("bucket", "count", "data")
+        for block in blocks:
+            pairs.extend(decode(*block))
+        pairs.sort()
+    return pairs
+
+
+def summarize_day(pairs, end, high, low, max_gap):
+    """The DailyReport columns of `pairs` (oldest first) of a day ending at `end`."""
+    covered = above = below = 0.0
+    for i, (recorded_at, bpm) in enumerate(pairs):
+        following = pairs[i + 1][0] if i + 1 < len(pairs) else end
+        seconds = min((following - recorded_at).total_seconds(), max_gap)
+        covered += seconds
+        if bpm > high:
+            above += seconds
+        elif bpm < low:
+            below += seconds
+    bpms = [bpm for _, bpm in pairs]
+    return {
+        "count": len(bpms),
+        "bpm_min": min(bpms),
+        "bpm_max": max(bpms),
+        "bpm_sum": sum(bpms),
+        "seconds_covered": round(covered),
+        "seconds_above": round(above),
+        "seconds_below": round(below),
+        "high_bpm": high,
+        "low_bpm": low,
+    }
+
+
+def patients_with_readings(day):
+    """Ids of the patients with readings, compacted readings or a report on `day`."""
+    start, end = day_window(day)
+
+    def on_database(alias):
+        return list(
+            HeartRate.objects.using(alias)
+            .filter(recorded_at__gte=start, recorded_at__lt=end)
+            .order_by()
+            .values_list("patient_id", flat=True)
+            .distinct()
+        )
+
+    ids = set().union(*fan_out(on_database, databases()))
+    if reaches_blocks(start):
+        blocks = HeartRateBlock.objects.filter(bucket__gte=start, bucket__lt=end)
+        ids.update(blocks.order_by().values_list("patient_id", flat=True).distinct())
+    # so reports of readings deleted since are dropped
+    ids.update(DailyReport.objects.filter(day=day).values_list("patient_id", flat=True))
+    return ids
+
+
+def materialize_chunk(patient_ids, day):
+    """Compute and store the reports of `patient_ids` on `day`; returns how many."""
+    start, end = day_window(day)
+    aliases = aliases_by_patient(patient_ids)
+    reports = []
+    for patient_id in patient_ids:
+        alias = aliases.get(patient_id, DEFAULT_DB_ALIAS)
+        pairs = day_readings(patient_id, start, end, using=alias)
+        if pairs:
+            columns = summarize_day(
+                pairs,
+                end,
+                settings.DAILY_REPORT_HIGH_BPM,
+                settings.DAILY_REPORT_LOW_BPM,
+                settings.DAILY_REPORT_MAX_GAP,
+            )
+            reports.append(DailyReport(patient_id=patient_id, day=day, **columns))
+    empty = set(patient_ids) - {report.patient_id for report in reports}
+    with transaction.atomic():
+        DailyReport.objects.bulk_create(
+            reports,
+            update_conflicts=True,
+            unique_fields=["patient", "day"],
+            update_fields=REPORT_FIELDS,
+        )
+        if empty:
+            DailyReport.objects.filter(patient_id__in=empty, day=day).delete()
+    return len(reports)
+
+
+def _run_task(task):
+    try:
+        return task[1], materialize_chunk(*task)
+    finally:
+        connections.close_all()
+
+
+def materialize(days, patient_ids=None, workers=None, chunk_size=CHUNK_SIZE, stdout=None):
+    """
+    Materialize the reports of `days` for `patient_ids` (None: every patient
+    with readings on the day) in `workers` processes (None: one per CPU, 1:
+    in this process). Returns the number of reports stored.
+    """
+    tasks = []
+    for day in days:
+        ids = sorted(patients_with_readings(day) if patient_ids is None else patient_ids)
+        tasks.extend((ids[i : i + chunk_size], day) for i in range(0, len(ids), chunk_size))
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        results = ((task[1], materialize_chunk(*task)) for task in tasks)
+        return _report_progress(results, stdout)
+    # forked workers must open their own connections
+    connections.close_all()
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("fork")
+    ) as pool:
+        return _report_progress(pool.map(_run_task, tasks), stdout)
+
+
+def _report_progress(results, stdout):
+    stored = 0
+    for day, count in results:
+        stored += count
+        if stdout is not None:
+            stdout.write(f"{day.isoformat()}: stored {count} reports ({stored} in total)")
+    return stored
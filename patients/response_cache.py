@@ -0,0 +1,216 @@
+# patients/response_cache.py
+"""
+Server-side cache of list/retrieve responses for the patients API.
+
+Entries live in the "api" cache (API_CACHE_* settings) and are keyed on
+(view, action, permission scope, normalized query params). Every key also embeds
+the current version of the namespaces its data depends on; saving a Patient or
+inserting a HeartRate bumps the versions of exactly the affected namespaces, so
+stale entries are never read again and age out through TTL / LRU eviction.
+Versions live in the same cache, so invalidation reaches only the processes
+sharing it: several worker processes need a shared backend (settings refuse
+locmem then).
+"""
+
+import hashlib
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+
+# response headers stored alongside the cached body
+CACHED_HEADERS = ("ETag", "Last-Modified", "Cache-Control", "Vary")
+
+
+def get_cache():
+    return caches["api"]
+
+
+def scope_of(user):
+    # clinicians/staff all see the same data; everyone else only their own
+    if user.is_staff or getattr(user, "is_clinician", False):
+        return "all"
+    return f"user:{user.pk}"
+
+
+def namespace_versions(namespaces):
+    cache = get_cache()
+    keys = [f"ns:{ns}" for ns in namespaces]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # time-based start so a namespace evicted and re-created never
+            # matches versions used before the eviction
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump(namespaces):
+    """Move `namespaces` to new versions; returns {namespace: new version}."""
+    cache = get_cache()
+    versions = {}
+    for ns in namespaces:
+        try:
+            versions[ns] = cache.incr(f"ns:{ns}")
+        except ValueError:
+            versions[ns] = time.time_ns()
+            cache.set(f"ns:{ns}", versions[ns], timeout=None)
+    return versions
+
+
+def as_id(value):
+    """A URL kwarg or query param as the integer id it selects, None if it is not one."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def invalidate_patient(patient):
+    invalidate_patients([patient])
+
+
+def invalidate_patients(patients):
+    namespaces = {"patients:list:all"}
+    for patient in patients:
+        namespaces.add(f"patients:detail:{patient.pk}")
+        namespaces.add(f"patients:list:user:{patient.owner_id}")
+    return bump(namespaces)
+
+
+def invalidate_heart_rates(patients):
+    """Drop cached reading lists that may contain readings of `patients`."""
+    namespaces = {"heartrates:scope:all"}
+    for patient in patients:
+        namespaces.add(f"heartrates:patient:{patient.pk}")
+        namespaces.add(f"heartrates:scope:user:{patient.owner_id}")
+    return bump(namespaces)
+
+
+def record(outcome):
+    cache = get_cache()
+    key = f"stats:{outcome}"
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+def stats():
+    cache = get_cache()
+    counts = cache.get_many(["stats:hits", "stats:misses"])
+    hits = counts.get("stats:hits", 0)
+    misses = counts.get("stats:misses", 0)
+    return {
+        "backend": settings.API_CACHE_BACKEND,
+        "enabled": settings.API_CACHE_ENABLED,
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None,
+    }
+
+
+class CachedResponseMixin:
+    """
+    ViewSet mixin serving `list`/`retrieve` from the response cache.
+
+    Subclasses implement `get_cache_namespaces(request, action, kwargs)`
+    returning the namespaces a response depends on, or None to skip caching.
+    Cached entries keep their ETag/Last-Modified, so conditional GETs are
+    answered from the cache as well.
+    """
+
+    def get_cache_namespaces(self, request, action, kwargs):
+        return None
+
+    def get_response_cache_key(self, request, action, kwargs, namespaces):
+        params = sorted(
+            (name, sorted(values)) for name, values in request.query_params.lists()
+        )
+        raw = repr(
+            (
+                self.basename,
+                action,
+                scope_of(request.user),
+                sorted(kwargs.items()),
+                params,
+                namespace_versions(namespaces),
+            )
+        )
+        return "resp:" + hashlib.md5(raw.encode()).hexdigest()
+
+    def cached_response(self, request, action, kwargs, render):
+        namespaces = None
+        if settings.API_CACHE_ENABLED:
+            namespaces = self.get_cache_namespaces(request, action, kwargs)
+        if not namespaces:
+            return render()
+
+        cache = get_cache()
+        key = self.get_response_cache_key(request, action, kwargs, namespaces)
+        entry = cache.get(key)
+        if entry is not None:
+            record("hits")
+            data, headers = entry
+            response = get_conditional_response(
+                request._request,
+                etag=headers.get("ETag"),
+                last_modified=parse_http_date_safe(headers.get("Last-Modified", "")),
+            ) or Response(data)
+            for name, value in headers.items():
+                response[name] = value
+            response["X-Cache"] = "HIT"
+            return response
+
+        record("misses")
+        response = render()
+        if response.status_code == 200:
+            headers = {h: response[h] for h in CACHED_HEADERS if response.has_header(h)}
+            cache.set(key, (response.data, headers))
+        response["X-Cache"] = "MISS"
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, "list", kwargs, partial(super().list, request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request,
+            "retrieve",
+            kwargs,
+            partial(super().retrieve, request, *args, **kwargs),
+        )
+
+
+# Both mixins scope entries with the view's `access` (patients.access.AccessMixin),
+# so changes to what a user may see retire their entries too. Ids are
+# normalized ("01" selects patient 1) to the namespaces invalidation bumps.
+class PatientCacheMixin(CachedResponseMixin):
+    def get_cache_namespaces(self, request, action, kwargs):
+        if action == "retrieve":
+            pk = as_id(kwargs.get("pk"))
+            if pk is None:
+                return None
+            return [f"patients:detail:{pk}", *self.access.namespaces()]
+        return self.access.namespaces("patients:list")
+
+
+class HeartRateCacheMixin(CachedResponseMixin):
+    def get_cache_namespaces(self, request, action, kwargs):
+        if action != "list":
+            return None
+        patient_id = request.query_params.get("patient")
+        if patient_id:
+            patient_id = as_id(patient_id)
+            if patient_id is None:
+                return None
+            return [f"heartrates:patient:{patient_id}", *self.access.namespaces()]
+        return self.access.namespaces("heartrates:scope")
@@ -0,0 +1,182 @@
+# patients/rollups.py
+"""
+Hourly per-patient rollups (HeartRateRollup) kept correct under late and
+out-of-order readings without full recomputation.
+
+Every write path records the (patient, UTC hour) buckets it touched as
+DirtyBucket marks, one INSERT per ingested batch, once the write has
+committed. `recompute_dirty()` (run by `manage.py recompute_rollups`, e.g.
+`--loop`) claims the marks up to the highest mark id, takes the buckets
+marked first, re-aggregates just those hours from HeartRate with one grouped
+query per patient, upserts or drops their rollups, and deletes the claimed
+marks. Ids are assigned by the database, so a mark added after the claim
+(whose reading the pass may not have seen) always survives for the next
+pass, whichever process or clock wrote it. With HEARTRATE_COMPACTION, the
+totals of the hour's compacted readings (HeartRateBlock columns) are added
+in. With HEARTRATE_SHARDS, readings are aggregated on their patient's shard;
+rollups and dirty buckets stay in "default".
+"""
+
+import datetime
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import DirtyBucket, HeartRate, HeartRateBlock, HeartRateRollup
+from .sharding import aliases_by_patient, databases
+
+BUCKET = datetime.timedelta(hours=1)
+# dirty buckets recomputed per transaction
+RECOMPUTE_BATCH_SIZE = 200
+# rows per upsert statement
+MARK_BATCH_SIZE = 500
+
+
+def bucket_of(recorded_at):
+    """Start of the UTC hour containing `recorded_at`."""
+    return recorded_at.astimezone(datetime.timezone.utc).replace(
+        minute=0, second=0, microsecond=0
+    )
+
+
+def mark_dirty(touched, using=DEFAULT_DB_ALIAS):
+    """
+    Record (patient_id, recorded_at) pairs as dirty buckets once the current
+    transaction of database `using` (the readings') commits: a mark claimed
+    before its reading is visible would be cleared without it.
+    """
+    buckets = {(patient_id, bucket_of(recorded_at)) for patient_id, recorded_at in touched}
+    if buckets:
+        transaction.on_commit(lambda: _insert_dirty(buckets), using=using)
+    return len(buckets)
+
+
+def _insert_dirty(buckets):
+    now = timezone.now()
+    return _add_marks([DirtyBucket(patient_id=p, bucket=b, marked_at=now) for p, b in buckets])
+
+
+def mark_all_dirty(stdout=None):
+    """Mark every bucket holding readings, e.g. to build rollups for existing data."""
+    buckets = (
+        HeartRate.objects.order_by()
+        .annotate(bucket=TruncHour("recorded_at", tzinfo=datetime.timezone.utc))
+        .values_list("patient_id", "bucket")
+        .distinct()
+    )
+    # one query per database holding readings (patients.sharding)
+    querysets = [buckets.using(alias) for alias in databases()]
+    if settings.HEARTRATE_COMPACTION:
+        # never combined with shards: blocks and readings are both in "default"
+        querysets[0] = querysets[0].union(
+            HeartRateBlock.objects.order_by().values_list("patient_id", "bucket")
+        )
+    now = timezone.now()
+    batch, marked = [], 0
+    for queryset in querysets:
+        for patient_id, bucket in queryset.iterator(chunk_size=MARK_BATCH_SIZE):
+            batch.append(DirtyBucket(patient_id=patient_id, bucket=bucket, marked_at=now))
+            if len(batch) == MARK_BATCH_SIZE:
+                marked += _add_marks(batch)
+                batch = []
+    marked += _add_marks(batch)
+    if stdout is not None:
+        stdout.write(f"marked {marked} buckets dirty")
+    return marked
+
+
+def _add_marks(batch):
+    DirtyBucket.objects.bulk_create(batch, batch_size=MARK_BATCH_SIZE)
+    return len(batch)
+
+
+def refresh_buckets(patient_id, buckets, using=DEFAULT_DB_ALIAS):
+    """
+    Recompute the rollups of one patient's `buckets` from its readings, which
+    are in database `using`.
+    """
+    window = Q()
+    for bucket in buckets:
+        window |= Q(recorded_at__gte=bucket, recorded_at__lt=bucket + BUCKET)
+    rows = (
+        HeartRate.objects.using(using)
+        .filter(window, patient_id=patient_id)
+        .order_by()
+        .annotate(bucket=TruncHour("recorded_at", tzinfo=datetime.timezone.utc))
+        .values("bucket")
+        .annotate(count=Count("id"), bpm_min=Min("bpm"), bpm_max=Max("bpm"), bpm_sum=Sum("bpm"))
+    )
+    stats = {row["bucket"]: row for row in rows}
+    if settings.HEARTRATE_COMPACTION:
+        blocks = (
+            HeartRateBlock.objects.filter(patient_id=patient_id, bucket__in=buckets)
+            .order_by()
+            .values("bucket")
+            .annotate(
+                count=Sum("count"),
+                bpm_min=Min("bpm_min"),
+                bpm_max=Max("bpm_max"),
+                bpm_sum=Sum("bpm_sum"),
+            )
+        )
+        for block in blocks:
+            row = stats.setdefault(block["bucket"], block)
+            if row is not block:
+                row["count"] += block["count"]
+                row["bpm_min"] = min(row["bpm_min"], block["bpm_min"])
+                row["bpm_max"] = max(row["bpm_max"], block["bpm_max"])
+                row["bpm_sum"] += block["bpm_sum"]
+    rollups = [HeartRateRollup(patient_id=patient_id, **row) for row in stats.values()]
+    HeartRateRollup.objects.bulk_create(
+        rollups,
+        update_conflicts=True,
+        unique_fields=["patient", "bucket"],
+        update_fields=["count", "bpm_min", "bpm_max", "bpm_sum", "updated_at"],
+    )
+    # hours whose readings were all deleted
+    empty = set(buckets) - {rollup.bucket for rollup in rollups}
+    if empty:
+        HeartRateRollup.objects.filter(patient_id=patient_id, bucket__in=empty).delete()
+    return len(rollups)
+
+
+def recompute_dirty(batch_size=RECOMPUTE_BATCH_SIZE, stdout=None):
+    """
+    Refresh the rollups of every dirty bucket, first marked first, in
+    transactions of `batch_size` buckets. Returns the number of buckets refreshed.
+    """
+    refreshed = 0
+    while True:
+        claimed = DirtyBucket.objects.aggregate(last=Max("pk"))["last"]
+        if claimed is None:
+            break
+        dirty = list(
+            DirtyBucket.objects.filter(pk__lte=claimed)
+            .order_by()
+            .values_list("patient_id", "bucket")
+            .annotate(first=Min("pk"))
+            .order_by("first")[:batch_size]
+        )
+        if not dirty:
+            break
+        by_patient = {}
+        for patient_id, bucket, _ in dirty:
+            by_patient.setdefault(patient_id, []).append(bucket)
+        aliases = aliases_by_patient(by_patient)
+        marks = Q()
+        for patient_id, buckets in by_patient.items():
+            marks |= Q(patient_id=patient_id, bucket__in=buckets)
+        with transaction.atomic():
+            for patient_id, buckets in by_patient.items():
+                refresh_buckets(
+                    patient_id, buckets, aliases.get(patient_id, DEFAULT_DB_ALIAS)
+                )
+            # buckets marked again meanwhile stay dirty for the next pass
+            DirtyBucket.objects.filter(marks, pk__lte=claimed).delete()
+        refreshed += len(dirty)
+        if stdout is not None:
+            stdout.write(f"refreshed {refreshed} buckets")
+    return refreshed
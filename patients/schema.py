@@ -0,0 +1,27 @@
+# patients/schema.py
+"""
+OpenAPI-only annotations. Applied by a drf-spectacular preprocessing hook so
+that serving processes never import drf-spectacular (see settings.API_DOCS).
+"""
+
+from drf_spectacular.utils import OpenApiExample, extend_schema_serializer
+
+from .serializers import HeartRateSerializer
+
+
+def annotate_serializers(endpoints, **kwargs):
+    extend_schema_serializer(
+        examples=[
+            OpenApiExample(
+                "Normal reading",
+                value={
+                    "patient": 1,
+                    "bpm": 72,
+                    "recorded_at": "2025-09-20T10:00:00Z",
+                    "device_id": "device-abc",
+                },
+                request_only=True,
+            )
+        ]
+    )(HeartRateSerializer)
+    return endpoints
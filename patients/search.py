@@ -0,0 +1,172 @@
+# patients/search.py
+"""
+Indexed patient search (name / external id), ranked best match first.
+
+- Postgres: trigram GIN index on the searchable text (pg_trgm); matches
+  substrings and typos (`%` similarity operator) ranked by similarity().
+- SQLite: FTS5 table `patients_patient_fts` kept in sync with triggers;
+  every word of the query is matched as a prefix, ranked by bm25.
+- Anything else (SQLite without FTS5, Postgres without pg_trgm): icontains.
+
+Indexes, the FTS table and its triggers are created by migration 0006.
+"""
+
+import re
+
+from django.db import DatabaseError, connections, transaction
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+SEARCH_LIMIT = 20
+# most matches the admin changelist search considers
+FTS_CANDIDATES = 1000
+
+PG_SEARCH_EXPR = (
+    "(\"patients_patient\".\"first_name\" || ' ' || \"patients_patient\".\"last_name\""
+    " || ' ' || coalesce(\"patients_patient\".\"external_id\", ''))"
+)
+FTS_TABLE = "patients_patient_fts"
+
+
+def tokenize(query):
+    # at most 8 words, FTS/LIKE syntax characters dropped
+    return re.findall(r"\w+", query.lower())[:8]
+
+
+# alias -> whether the search structures of migration 0006 exist
+_index_available = {}
+
+
+def index_available(connection):
+    if connection.alias not in _index_available:
+        if connection.vendor == "postgresql":
+            sql = "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+        else:
+            sql = f"SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = '{FTS_TABLE}'"
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+            _index_available[connection.alias] = cursor.fetchone() is not None
+    return _index_available[connection.alias]
+
+
+def search_patients(queryset, query, limit=SEARCH_LIMIT):
+    """Return up to `limit` patients from `queryset` matching `query`, best first."""
+    words = tokenize(query)
+    if not words:
+        return []
+    connection = connections[queryset.db]
+    if connection.vendor not in ("postgresql", "sqlite") or not index_available(
+        connection
+    ):
+        return search_fallback(queryset, words, limit)
+    if connection.vendor == "postgresql":
+        return search_postgres(queryset, words, limit)
+    return search_sqlite(queryset, words, limit)
+
+
+def search_postgres(queryset, words, limit):
+    text = " ".join(words)
+    return list(
+        queryset.annotate(
+            rank=RawSQL(f"similarity({PG_SEARCH_EXPR}, %s)", [text], FloatField())
+        )
+        .filter(
+            RawSQL(
+                f"({PG_SEARCH_EXPR} %% %s OR {PG_SEARCH_EXPR} ILIKE %s)",
+                [text, f"%{text}%"],
+                BooleanField(),
+            )
+        )
+        .order_by("-rank", "pk")[:limit]
+    )
+
+
+def search_sqlite(queryset, words, limit):
+    match = " ".join(f'"{word}"*' for word in words)
+    # ranked and cut to `limit` in the same query as the queryset's permission
+    # scoping, so a user's matches never fall outside some global top N
+    hits = RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+    rank = RawSQL(
+        f"SELECT rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+        f"AND rowid = \"patients_patient\".\"id\"",
+        [match],
+        FloatField(),
+    )
+    return list(
+        queryset.filter(pk__in=hits).annotate(rank=rank).order_by("rank", "pk")[:limit]
+    )
+
+
+def search_fallback(queryset, words, limit):
+    match = Q()
+    for word in words:
+        match &= (
+            Q(first_name__icontains=word)
+            | Q(last_name__icontains=word)
+            | Q(external_id__icontains=word)
+        )
+    return list(queryset.filter(match)[:limit])
+
+
+SQLITE_FTS_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        first_name, last_name, external_id,
+        content='patients_patient', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON patients_patient BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, first_name, last_name, external_id)
+        VALUES (new.id, new.first_name, new.last_name, new.external_id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON patients_patient BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, first_name, last_name, external_id)
+        VALUES ('delete', old.id, old.first_name, old.last_name, old.external_id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON patients_patient BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, first_name, last_name, external_id)
+        VALUES ('delete', old.id, old.first_name, old.last_name, old.external_id);
+        INSERT INTO {FTS_TABLE}(rowid, first_name, last_name, external_id)
+        VALUES (new.id, new.first_name, new.last_name, new.external_id);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+
+def create_search_index(schema_editor):
+    """
+    Create the vendor specific search structures. Safe to re-run; migrations
+    that rebuild patients_patient on SQLite (which drops its triggers) must
+    call it again.
+    """
+    connection = schema_editor.connection
+    if connection.vendor == "sqlite":
+        try:
+            with transaction.atomic(using=connection.alias):
+                for statement in SQLITE_FTS_SQL:
+                    schema_editor.execute(statement)
+        except DatabaseError:
+            pass  # SQLite without FTS5: search_patients() falls back to icontains
+    elif connection.vendor == "postgresql":
+        try:
+            with transaction.atomic(using=connection.alias):
+                schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except DatabaseError:
+            pass  # no privilege: search_patients() falls back to icontains
+        try:
+            with transaction.atomic(using=connection.alias):
+                schema_editor.execute(
+                    "CREATE INDEX IF NOT EXISTS patient_search_trgm_idx "
+                    f"ON patients_patient USING gin ({PG_SEARCH_EXPR} gin_trgm_ops)"
+                )
+        except DatabaseError:
+            pass
+
+
+def drop_search_index(schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == "sqlite":
+        for suffix in ("ai", "ad", "au"):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    elif connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS patient_search_trgm_idx")
@@ -1,16 +1,175 @@
 # patients/serializers.py
 from django.utils import timezone
-from drf_spectacular.utils import OpenApiExample, extend_schema_serializer
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 
-from .models import HeartRate, Patient
+from .metadata import joined, split
+from .models import HeartRate, Patient, PatientPurge
+
+
+# rows per INSERT / UPDATE / lookup statement of bulk patient saves
+PATIENT_BULK_BATCH_SIZE = 500
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+class PatientListSerializer(serializers.ListSerializer):
+    """
+    `PatientSerializer(many=True)` for bulk provisioning.
+
+    Every row is validated with the one child serializer; invalid rows do not
+    stop the others and end up in `results` with their errors. Valid rows are
+    saved with bulk_create / bulk_update in chunks of PATIENT_BULK_BATCH_SIZE
+    (callers wrap `save()` in a transaction):
+
+    - `save(owner=...)` creates the rows; with `context["upsert_queryset"]`, a
+      row whose external_id matches exactly one patient of that queryset
+      updates it instead.
+    - `PatientListSerializer(queryset, data=rows, partial=True)` updates the
+      patients of `queryset` named by each row's "id".
+
+    `results` lists one entry per input row, in order:
+    {"index", "status": "created"|"updated"|"unchanged"|"error", "id" | "errors"}.
+    """
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            message = self.error_messages["not_a_list"].format(input_type=type(data).__name__)
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [message]}, code="not_a_list"
+            )
+        if self.max_length is not None and len(data) > self.max_length:
+            message = self.error_messages["max_length"].format(max_length=self.max_length)
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [message]}, code="max_length"
+            )
+
+        self.results = [None] * len(data)
+        # input index and target id of every returned row
+        self.row_index, self.row_ids = [], []
+        validated = []
+        for index, item in enumerate(data):
+            row_id = None
+            if self.instance is not None:
+                row_id = item.get("id") if isinstance(item, dict) else None
+                # bool is an int subclass: {"id": true} must not select patient 1
+                if isinstance(row_id, bool) or not isinstance(row_id, int):
+                    self.fail_row(index, {"id": ["A patient id is required."]})
+                    continue
+            try:
+                attrs = self.run_child_validation(item)
+            except serializers.ValidationError as exc:
+                self.fail_row(index, exc.detail)
+                continue
+            validated.append(attrs)
+            self.row_index.append(index)
+            self.row_ids.append(row_id)
+        return validated
+
+    def fail_row(self, index, errors):
+        self.results[index] = {"index": index, "status": "error", "errors": errors}
+
+    def succeed_row(self, index, status, patient):
+        self.results[index] = {"index": index, "status": status, "id": patient.pk}
+
+    def create(self, validated_data):
+        upsert_queryset = self.context.get("upsert_queryset")
+        matches = {}
+        if upsert_queryset is not None:
+            external_ids = sorted(
+                {attrs["external_id"] for attrs in validated_data if attrs.get("external_id")}
+            )
+            for chunk in chunked(external_ids, PATIENT_BULK_BATCH_SIZE):
+                for patient in upsert_queryset.filter(external_id__in=chunk):
+                    matches.setdefault(patient.external_id, []).append(patient)
+
+        created, updated, seen = [], [], set()
+        for index, attrs in zip(self.row_index, validated_data):
+            external_id = attrs.get("external_id")
+            if upsert_queryset is not None and external_id:
+                if external_id in seen:
+                    self.fail_row(index, {"external_id": ["Repeated in this request."]})
+                    continue
+                seen.add(external_id)
+                found = matches.get(external_id, [])
+                if len(found) > 1:
+                    self.fail_row(
+                        index, {"external_id": [f"Matches {len(found)} patients."]}
+                    )
+                    continue
+                if found:
+                    # an upsert never changes who owns an existing patient
+                    attrs = {k: v for k, v in attrs.items() if k != "owner"}
+                    updated.append((index, found[0], self.assign(found[0], attrs)))
+                    continue
+            created.append((index, Patient(**attrs)))
+
+        Patient.objects.bulk_create(
+            [patient for _, patient in created], batch_size=PATIENT_BULK_BATCH_SIZE
+        )
+        for index, patient in created:
+            self.succeed_row(index, "created", patient)
+        self.bulk_update(updated)
+        return [patient for _, patient in created] + [patient for _, patient, _ in updated]
+
+    def update(self, instance, validated_data):
+        ids = sorted(set(self.row_ids))
+        patients = {}
+        for chunk in chunked(ids, PATIENT_BULK_BATCH_SIZE):
+            patients.update(instance.in_bulk(chunk))
+
+        updated = []
+        for index, row_id, attrs in zip(self.row_index, self.row_ids, validated_data):
+            patient = patients.get(row_id)
+            if patient is None:
+                self.fail_row(index, {"id": ["Not found."]})
+                continue
+            updated.append((index, patient, self.assign(patient, attrs)))
+        self.bulk_update(updated)
+        return [patient for _, patient, _ in updated]
+
+    def assign(self, patient, attrs):
+        """Apply `attrs`; returns the names of the fields whose value changed."""
+        changed = []
+        for name, value in attrs.items():
+            if getattr(patient, name) != value:
+                setattr(patient, name, value)
+                changed.append(name)
+        return changed
+
+    def bulk_update(self, updated):
+        """
+        Save (index, patient, changed fields) rows: one bulk_update per set of
+        changed fields, writing only those (bulk_update builds a CASE per field
+        and row), and updated_at with a plain UPDATE. Rows without changes are
+        reported "unchanged" and not written.
+        """
+        by_fields = {}
+        for index, patient, fields in updated:
+            if not fields:
+                self.succeed_row(index, "unchanged", patient)
+                continue
+            by_fields.setdefault(tuple(sorted(fields)), []).append(patient)
+            self.succeed_row(index, "updated", patient)
+        for fields, patients in by_fields.items():
+            Patient.objects.bulk_update(patients, fields, batch_size=PATIENT_BULK_BATCH_SIZE)
+        # auto_now is not applied by bulk_update
+        now = timezone.now()
+        changed = [patient.pk for patients in by_fields.values() for patient in patients]
+        for chunk in chunked(changed, PATIENT_BULK_BATCH_SIZE):
+            Patient.objects.filter(pk__in=chunk).update(updated_at=now)
 
 
 class PatientSerializer(serializers.ModelSerializer):
-    owner = serializers.ReadOnlyField(source="owner.id")
+    # owner_id avoids loading the owner row for every serialized patient
+    owner = serializers.ReadOnlyField(source="owner_id")
 
     class Meta:
         model = Patient
+        list_serializer_class = PatientListSerializer
         fields = [
             "id",
             "owner",
@@ -26,26 +185,34 @@ class PatientSerializer(serializers.ModelSerializer):
         read_only_fields = ("created_at", "updated_at")
 
 
-@extend_schema_serializer(
-    examples=[
-        OpenApiExample(
-            "Normal reading",
-            value={
-                "patient": 1,
-                "bpm": 72,
-                "recorded_at": "2025-09-20T10:00:00Z",
-                "device_id": "device-abc",
-            },
-            request_only=True,
-        )
-    ]
-)
+class PatientPrimaryKeyField(serializers.PrimaryKeyRelatedField):
+    """
+    Patient reference that resolves against patients preloaded into the
+    serializer context (`context["patients"]`, keyed by id) before querying,
+    so batch uploads do not fetch the same patient once per reading.
+    """
+
+    def to_internal_value(self, data):
+        patients = self.context.get("patients")
+        if patients:
+            try:
+                return patients[int(data)]
+            except (KeyError, TypeError, ValueError):
+                pass
+        return super().to_internal_value(data)
+
+
 class HeartRateSerializer(serializers.ModelSerializer):
     """
     Serializer for HeartRate reading. Validation enforces sensible `bpm` range
     and that `recorded_at` is a timezone-aware datetime (or naive treated as UTC).
+    `metadata` is split into its storage columns on input and reassembled on
+    output (see patients.metadata).
     """
 
+    # readings cannot be added to a patient that is being purged
+    patient = PatientPrimaryKeyField(queryset=Patient.objects.active())
+
     class Meta:
         model = HeartRate
         fields = [
@@ -58,6 +225,9 @@ class HeartRateSerializer(serializers.ModelSerializer):
             "created_at",
         ]
         read_only_fields = ("created_at",)
+        # duplicates of (patient, device_id, recorded_at) are resolved by the
+        # view as idempotent retries instead of being rejected with a 400
+        validators = []
 
     def validate_bpm(self, value):
         # reasonable human heart rate bounds
@@ -74,4 +244,28 @@ class HeartRateSerializer(serializers.ModelSerializer):
 
     def validate(self, attrs):
         # ensure patient exists (ForeignKey enforces it) and other validations could go here
+        if "metadata" in attrs:
+            attrs.update(split(attrs.pop("metadata")))
         return attrs
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data["metadata"] = joined(instance)
+        return data
+
+
+class PatientPurgeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PatientPurge
+        fields = [
+            "id",
+            "patient_id",
+            "status",
+            "readings_total",
+            "readings_deleted",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+        ]
+        read_only_fields = fields
@@ -0,0 +1,121 @@
+# patients/series.py
+"""
+Reading series of many patients at once, each fetched with a single query,
+for central monitoring stations (GET /api/patients/heartrates/multi/).
+
+- `latest_readings()`: the newest `limit` readings per patient within a window,
+  via ROW_NUMBER() OVER (PARTITION BY patient_id ORDER BY recorded_at DESC)
+  over the indexed (patient, recorded_at) range, filtered in an outer query.
+- `downsampled()`: per-minute or per-hour count/min/max/avg per patient, one
+  GROUP BY over the same range.
+
+Both return {patient_id: {column: [values...]}} in chronological order, with
+an entry (possibly empty) for every requested patient. With HEARTRATE_SHARDS
+the query runs on each shard holding some of the patients, in parallel.
+Windows reaching past the compaction horizon also read the compacted readings
+(patients.compaction, one or two more queries) and merge them in.
+"""
+
+import datetime
+import heapq
+
+from django.db.models import Count, F, Max, Min, Sum, Window
+from django.db.models.functions import RowNumber, Trunc
+from rest_framework.fields import DateTimeField
+
+from .compaction import block_buckets, newest_block_readings, reaches_blocks
+from .models import HeartRate
+from .sharding import fan_out, shards_of
+
+RESOLUTIONS = {
+    "minute": datetime.timedelta(minutes=1),
+    "hour": datetime.timedelta(hours=1),
+}
+
+
+def window_readings(patient_ids, start, end):
+    return HeartRate.objects.filter(
+        patient_id__in=patient_ids, recorded_at__gte=start, recorded_at__lte=end
+    ).order_by()
+
+
+def window_rows(patient_ids, start, end, query):
+    """
+    The rows of `query(window readings)`, run on every database holding
+    readings of `patient_ids` (in parallel with HEARTRATE_SHARDS).
+    """
+
+    def on_database(item):
+        alias, ids = item
+        return list(query(window_readings(ids, start, end).using(alias)))
+
+    parts = fan_out(on_database, shards_of(patient_ids).items())
+    return [row for part in parts for row in part]
+
+
+def latest_readings(patient_ids, start, end, limit):
+    def query(readings):
+        return (
+            readings.annotate(
+                rank=Window(
+                    RowNumber(),
+                    partition_by=[F("patient_id")],
+                    order_by=F("recorded_at").desc(),
+                )
+            )
+            .filter(rank__lte=limit)
+            .order_by("patient_id", "recorded_at")
+            .values_list("patient_id", "recorded_at", "bpm")
+        )
+
+    readings = {pk: [] for pk in patient_ids}
+    for patient_id, recorded_at, bpm in window_rows(patient_ids, start, end, query):
+        readings[patient_id].append((recorded_at, bpm))
+    if reaches_blocks(start):
+        compacted = newest_block_readings(patient_ids, start, end, limit)
+        for pk, pairs in compacted.items():
+            readings[pk] = list(heapq.merge(readings[pk], pairs))[-limit:]
+    as_text = DateTimeField().to_representation
+    series = {pk: {"recorded_at": [], "bpm": []} for pk in patient_ids}
+    for patient_id, pairs in readings.items():
+        for recorded_at, bpm in pairs:
+            series[patient_id]["recorded_at"].append(as_text(recorded_at))
+            series[patient_id]["bpm"].append(bpm)
+    return series
+
+
+def downsampled(patient_ids, start, end, resolution):
+    def query(readings):
+        return (
+            readings.annotate(
+                bucket=Trunc("recorded_at", resolution, tzinfo=datetime.timezone.utc)
+            )
+            .values("patient_id", "bucket")
+            .annotate(count=Count("id"), min=Min("bpm"), max=Max("bpm"), sum=Sum("bpm"))
+            .values_list("patient_id", "bucket", "count", "min", "max", "sum")
+        )
+
+    rows = window_rows(patient_ids, start, end, query)
+    stats = {
+        (pk, bucket): [count, low, high, total] for pk, bucket, count, low, high, total in rows
+    }
+    if reaches_blocks(start):
+        for key, (count, low, high, total) in block_buckets(
+            patient_ids, start, end, RESOLUTIONS[resolution]
+        ).items():
+            current = stats.setdefault(key, [0, low, high, 0])
+            current[0] += count
+            current[1] = min(current[1], low)
+            current[2] = max(current[2], high)
+            current[3] += total
+    as_text = DateTimeField().to_representation
+    columns = ("bucket", "count", "min", "max", "avg")
+    series = {pk: {column: [] for column in columns} for pk in patient_ids}
+    for (patient_id, bucket), (count, low, high, total) in sorted(stats.items()):
+        target = series[patient_id]
+        target["bucket"].append(as_text(bucket))
+        target["count"].append(count)
+        target["min"].append(low)
+        target["max"].append(high)
+        target["avg"].append(round(total / count, 1))
+    return series
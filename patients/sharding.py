@@ -0,0 +1,438 @@
+# patients/sharding.py
+"""
+Heart-rate readings spread over several databases (HEARTRATE_SHARDS).
+
+Patients, rollups and every other table stay in "default"; only HeartRate
+rows live in the shards. `Patient.shard` names the database holding a
+patient's readings ("" = "default"). It is set just before the patient's
+first reading is stored, from HEARTRATE_SHARD_BY:
+
+- "patient": rendezvous hash of the patient id, spreading patients evenly;
+- "place": hash of `Patient.place`, keeping a hospital/ward on one shard.
+
+After that only `manage.py rebalance_shards` changes it, moving the readings
+first: adding a shard or changing HEARTRATE_SHARD_BY moves nothing by itself.
+Patients that had readings in "default" before sharding was enabled keep
+them there until rebalanced.
+
+Every shard carries the full schema (`migrate --database shardN`); its only
+Patient rows are id-only stubs that satisfy the readings' foreign key. Each
+shard hands out reading ids from its own SHARD_ID_SPAN range, so ids stay
+unique across databases; a reading that moves gets a new id in its new
+database.
+
+Reads of one patient go to that patient's database. Other reads (clinician
+lists, detail lookups by id, several patients) run on every database involved
+in parallel, on a pool of HEARTRATE_SHARD_WORKERS threads, and are merged:
+`readings()` returns a plain queryset or a ShardedReadings. Without
+HEARTRATE_SHARDS every helper here falls back to "default" at no cost.
+"""
+
+import hashlib
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+from django.db.models import Count, Max, Min, Sum
+
+from .models import HeartRate, Patient
+from .response_cache import invalidate_heart_rates
+
+# reading ids of shard n (the n-th HEARTRATE_SHARDS alias) start at (n + 1) * SHARD_ID_SPAN
+SHARD_ID_SPAN = 2**40
+
+# (alias, patient id) pairs whose stub this process already created
+_stubbed = set()
+# unassigned patients known to have readings in "default" (see assign())
+_in_default = set()
+KNOWN_MAX = 10000
+# readings copied per INSERT by move()
+MOVE_BATCH_SIZE = 1000
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def databases():
+    """Every database that can hold readings."""
+    return [DEFAULT_DB_ALIAS, *settings.HEARTRATE_SHARDS]
+
+
+def alias_of(patient):
+    """The database holding the readings of `patient`."""
+    return patient.shard or DEFAULT_DB_ALIAS
+
+
+def placement(patient):
+    """The shard `patient`'s readings belong on under the current settings."""
+    shards = settings.HEARTRATE_SHARDS
+    if not shards:
+        return DEFAULT_DB_ALIAS
+    key = str(patient.pk)
+    if settings.HEARTRATE_SHARD_BY == "place" and patient.place.strip():
+        key = "place:" + patient.place.strip().lower()
+
+    def weight(alias):
+        return hashlib.blake2b(f"{alias}|{key}".encode(), digest_size=8).digest()
+
+    return max(shards, key=weight)
+
+
+def aliases_by_patient(patient_ids):
+    """{patient id: database of its readings}, one query; unknown ids are left out."""
+    if not settings.HEARTRATE_SHARDS:
+        return dict.fromkeys(patient_ids, DEFAULT_DB_ALIAS)
+    rows = Patient.objects.filter(pk__in=list(patient_ids)).values_list("pk", "shard")
+    return {pk: shard or DEFAULT_DB_ALIAS for pk, shard in rows}
+
+
+def shards_of(patient_ids):
+    """{database: [patient ids]} of the readings of `patient_ids`."""
+    groups = defaultdict(list)
+    for pk, alias in aliases_by_patient(patient_ids).items():
+        groups[alias].append(pk)
+    return dict(groups)
+
+
+def _remember(known, items):
+    if len(known) + len(items) > KNOWN_MAX:
+        known.clear()
+    known.update(items)
+
+
+def assign(patients):
+    """
+    Give `patients` without a shard their placement(), before their first
+    reading is stored. Patients with readings in "default" are left there.
+    """
+    if not settings.HEARTRATE_SHARDS:
+        return
+    pending = [p for p in patients if not p.shard and p.pk not in _in_default]
+    if not pending:
+        return
+    ids = [p.pk for p in pending]
+    legacy = set(
+        HeartRate.objects.using(DEFAULT_DB_ALIAS)
+        .filter(patient_id__in=ids)
+        .order_by()
+        .values_list("patient_id", flat=True)
+        .distinct()
+    )
+    _remember(_in_default, legacy)
+    groups = defaultdict(list)
+    for patient in pending:
+        if patient.pk not in legacy:
+            groups[placement(patient)].append(patient.pk)
+    for alias, group in groups.items():
+        Patient.objects.filter(pk__in=group, shard="").update(shard=alias)
+    # a concurrent request may have assigned some of them first
+    assigned = dict(Patient.objects.filter(pk__in=ids).values_list("pk", "shard"))
+    for patient in pending:
+        patient.shard = assigned.get(patient.pk, patient.shard)
+
+
+def ensure_stubs(alias, patient_ids):
+    """Create the stub Patient rows of `patient_ids` in shard `alias` (one INSERT)."""
+    if alias == DEFAULT_DB_ALIAS:
+        return
+    missing = {pk for pk in patient_ids if (alias, pk) not in _stubbed}
+    if not missing:
+        return
+    Patient.objects.using(alias).bulk_create(
+        [Patient(pk=pk, first_name="", shard=alias) for pk in missing],
+        ignore_conflicts=True,
+    )
+    _remember(_stubbed, {(alias, pk) for pk in missing})
+
+
+def prepare_writes(patients):
+    """Assign shards and create stubs so readings of `patients` can be stored."""
+    assign(patients)
+    groups = defaultdict(set)
+    for patient in patients:
+        groups[alias_of(patient)].add(patient.pk)
+    for alias, ids in groups.items():
+        ensure_stubs(alias, ids)
+
+
+@contextmanager
+def relocating(reading, patient):
+    """
+    Around saving `reading` for `patient`: if that patient's readings live in
+    another database, the save inserts the reading there (under a new id from
+    that database's range) and the old row is deleted afterwards.
+    """
+    prepare_writes([patient])
+    source, target = reading._state.db, alias_of(patient)
+    if source is None or source == target:
+        yield
+        return
+    old_pk = reading.pk
+    reading.pk = None
+    reading._state.adding, reading._state.db = True, target
+    try:
+        yield
+    except BaseException:
+        reading.pk = old_pk
+        reading._state.adding, reading._state.db = False, source
+        raise
+    HeartRate.objects.using(source).filter(pk=old_pk).delete()
+
+
+def reserve_ids(alias):
+    """Start the reading ids of shard `alias` at its SHARD_ID_SPAN range (idempotent)."""
+    if alias not in settings.HEARTRATE_SHARDS:
+        return
+    start = (settings.HEARTRATE_SHARDS.index(alias) + 1) * SHARD_ID_SPAN
+    table = HeartRate._meta.db_table
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [table])
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)", [table, start]
+                )
+            elif row[0] < start:
+                cursor.execute(
+                    "UPDATE sqlite_sequence SET seq = %s WHERE name = %s", [start, table]
+                )
+        elif connection.vendor == "postgresql":
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+            (sequence,) = cursor.fetchone()
+            cursor.execute(f"SELECT last_value FROM {sequence}")
+            if cursor.fetchone()[0] < start:
+                cursor.execute("SELECT setval(%s, %s, false)", [sequence, start])
+
+
+def move(patient_ids, source, target, batch_size=MOVE_BATCH_SIZE):
+    """
+    Move the readings of `patient_ids` from database `source` to `target`.
+    Rows are copied in batches, then the patients point to `target`, then
+    rows stored meanwhile in `source` are copied too before `source`'s rows
+    and stubs are deleted. Copies get new ids; the unique constraint on
+    (patient, device_id, recorded_at) skips readings copied twice. Returns
+    the number of readings moved.
+    """
+    patient_ids = list(patient_ids)
+    ensure_stubs(target, patient_ids)
+    rows = HeartRate.objects.using(source).filter(patient_id__in=patient_ids).order_by("pk")
+    last_pk = 0
+
+    def copy():
+        nonlocal last_pk
+        while True:
+            batch = list(rows.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                return
+            last_pk = batch[-1].pk
+            for reading in batch:
+                reading.pk = None
+            HeartRate.objects.using(target).bulk_create(batch, ignore_conflicts=True)
+
+    copy()
+    shard = "" if target == DEFAULT_DB_ALIAS else target
+    Patient.objects.filter(pk__in=patient_ids).update(shard=shard)
+    # writers that loaded a patient before the update still write to `source`
+    copy()
+    moved, _ = rows.delete()
+    if source != DEFAULT_DB_ALIAS:
+        Patient.objects.using(source).filter(pk__in=patient_ids).delete()
+        _stubbed.difference_update((source, pk) for pk in patient_ids)
+    _in_default.difference_update(patient_ids)
+    # the copies have new ids
+    invalidate_heart_rates(Patient.objects.filter(pk__in=patient_ids).only("pk", "owner_id"))
+    return moved
+
+
+def _run(fn, item):
+    try:
+        return fn(item)
+    finally:
+        # pool threads outlive requests: drop their expired connections like
+        # request_finished does
+        close_old_connections()
+
+
+def fan_out(fn, items):
+    """[fn(item) for item in items], run in parallel on the shard pool."""
+    items = list(items)
+    if len(items) < 2:
+        return [fn(item) for item in items]
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.HEARTRATE_SHARD_WORKERS, thread_name_prefix="shard"
+            )
+    return list(_executor.map(_run, [fn] * len(items), items))
+
+
+def readings(queryset, patient_ids=None):
+    """
+    `queryset` (of HeartRate) on the databases holding the readings of
+    `patient_ids` (None: all of them): a plain queryset when that is a single
+    database, else a ShardedReadings.
+    """
+    if not settings.HEARTRATE_SHARDS:
+        return queryset
+    if patient_ids is None:
+        aliases = databases()
+    else:
+        aliases = list(shards_of(patient_ids)) or [DEFAULT_DB_ALIAS]
+    if len(aliases) == 1:
+        return queryset.using(aliases[0])
+    return ShardedReadings(queryset, aliases)
+
+
+def sort_by_ordering(objs, model, ordering):
+    """Sort model instances in place like ORDER BY `ordering` (field names)."""
+    for field in reversed(ordering):
+        if not isinstance(field, str):
+            raise TypeError("Only field names can be merged across shards.")
+        name = field.lstrip("-")
+        name = model._meta.pk.attname if name == "pk" else model._meta.get_field(name).attname
+        objs.sort(key=attrgetter(name), reverse=field.startswith("-"))
+
+
+class ShardedReadings:
+    """
+    One HeartRate queryset evaluated on several databases as if they were
+    one, each database queried in parallel. Supports what the list, its
+    validators and get_object() need: filter/exclude/order_by, count(),
+    aggregate() of Count/Sum/Min/Max, get(), slicing and iteration. A slice
+    [a:b] reads the first b rows of every database and merges them by the
+    queryset's ordering.
+    """
+
+    def __init__(self, queryset, aliases):
+        self.queryset = queryset
+        self.aliases = list(aliases)
+
+    @property
+    def model(self):
+        return self.queryset.model
+
+    def _chain(self, method, *args, **kwargs):
+        return ShardedReadings(getattr(self.queryset, method)(*args, **kwargs), self.aliases)
+
+    def filter(self, *args, **kwargs):
+        return self._chain("filter", *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self._chain("exclude", *args, **kwargs)
+
+    def order_by(self, *fields):
+        return self._chain("order_by", *fields)
+
+    def select_related(self, *fields):
+        return self._chain("select_related", *fields)
+
+    def on_each(self, fn):
+        """[fn(queryset on database) for every database], in parallel."""
+        return fan_out(lambda alias: fn(self.queryset.using(alias)), self.aliases)
+
+    def count(self):
+        return sum(self.on_each(lambda qs: qs.count()))
+
+    def __len__(self):
+        return self.count()
+
+    def exists(self):
+        return any(self.on_each(lambda qs: qs.exists()))
+
+    def aggregate(self, **aggregates):
+        results = self.on_each(lambda qs: qs.aggregate(**aggregates))
+        combined = {}
+        for name, aggregate in aggregates.items():
+            values = [result[name] for result in results if result[name] is not None]
+            if isinstance(aggregate, Count):
+                combined[name] = sum(values)
+            elif isinstance(aggregate, Sum):
+                combined[name] = sum(values) if values else None
+            elif isinstance(aggregate, Max):
+                combined[name] = max(values, default=None)
+            elif isinstance(aggregate, Min):
+                combined[name] = min(values, default=None)
+            else:
+                raise TypeError(f"{type(aggregate).__name__} cannot be combined across shards.")
+        return combined
+
+    def get(self, *args, **kwargs):
+        found = [
+            obj
+            for objs in self.on_each(lambda qs: list(qs.filter(*args, **kwargs)[:2]))
+            for obj in objs
+        ]
+        if not found:
+            raise self.model.DoesNotExist(
+                f"{self.model._meta.object_name} matching query does not exist."
+            )
+        if len(found) > 1:
+            raise self.model.MultipleObjectsReturned(
+                f"get() returned more than one {self.model._meta.object_name}."
+            )
+        return found[0]
+
+    def ordering(self):
+        query = self.queryset.query
+        if query.order_by:
+            return list(query.order_by)
+        return list(self.model._meta.ordering) if query.default_ordering else []
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step is not None:
+            raise TypeError("ShardedReadings only supports slicing.")
+        start, stop = key.start or 0, key.stop
+        parts = self.on_each(lambda qs: list(qs if stop is None else qs[:stop]))
+        objs = [obj for part in parts for obj in part]
+        sort_by_ordering(objs, self.model, self.ordering())
+        return objs[start:stop]
+
+    def __iter__(self):
+        return iter(self[:])
+
+
+class ShardRouter:
+    """
+    Database router for HEARTRATE_SHARDS. HeartRate rows are read and written
+    where their patient's readings live; every other model lives in "default"
+    (including Patient when reached from a reading on a shard). Querysets
+    without an instance (HeartRate.objects.filter(...)) go to "default":
+    code reading readings picks databases with `readings()` / `alias_of()`.
+    """
+
+    def _reading_db(self, instance):
+        if isinstance(instance, Patient):
+            return alias_of(instance)
+        if isinstance(instance, HeartRate):
+            if instance._state.db:
+                return instance._state.db
+            if instance.patient_id is None:
+                return None
+            if "patient" in instance._state.fields_cache:
+                return alias_of(instance.patient)
+            return aliases_by_patient([instance.patient_id]).get(
+                instance.patient_id, DEFAULT_DB_ALIAS
+            )
+        return None
+
+    def db_for_read(self, model, **hints):
+        if model is HeartRate:
+            return self._reading_db(hints.get("instance"))
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if model is HeartRate:
+            return self._reading_db(hints.get("instance"))
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if isinstance(obj1, HeartRate) or isinstance(obj2, HeartRate):
+            return True
+        return None
@@ -0,0 +1,77 @@
+# patients/signals.py
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .access import invalidate_access
+from .ingestion import register_devices
+from .models import CareTeam, HeartRate, Patient
+from .recent import recent_readings
+from .response_cache import invalidate_heart_rates, invalidate_patient
+from .rollups import mark_dirty
+
+
+@receiver(post_save, sender=Patient)
+def patient_saved(sender, instance, created, **kwargs):
+    invalidate_patient(instance)
+    loaded_owner_id = getattr(instance, "_loaded_owner_id", None)
+    if created or instance.owner_id != loaded_owner_id:
+        invalidate_access([instance.owner_id, loaded_owner_id])
+        instance._loaded_owner_id = instance.owner_id
+
+
+@receiver(post_delete, sender=Patient)
+def patient_deleted(sender, instance, **kwargs):
+    invalidate_patient(instance)
+    invalidate_heart_rates([instance])
+
+
+@receiver(m2m_changed, sender=CareTeam.members.through)
+def care_team_members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("pre_clear", "post_add", "post_remove"):
+        return
+    if reverse:
+        # user.care_teams.add(...): only that user's access changes
+        invalidate_access([instance.pk])
+    elif action == "pre_clear":
+        invalidate_access(instance.members.values_list("pk", flat=True))
+    else:
+        invalidate_access(pk_set)
+
+
+@receiver(m2m_changed, sender=CareTeam.patients.through)
+def care_team_patients_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("pre_clear", "post_add", "post_remove"):
+        return
+    if not reverse:
+        teams = [instance.pk]
+    elif action == "pre_clear":
+        teams = instance.care_teams.values_list("pk", flat=True)
+    else:
+        teams = pk_set
+    members = CareTeam.members.through.objects.filter(careteam_id__in=teams)
+    invalidate_access(members.values_list("customuser_id", flat=True))
+
+
+@receiver(pre_delete, sender=CareTeam)
+def care_team_deleted(sender, instance, **kwargs):
+    invalidate_access(instance.members.values_list("pk", flat=True))
+
+
+# No post_delete receiver for HeartRate on purpose: it would stop Django from
+# deleting readings with a single DELETE (cascades, purges). Views that delete
+# readings invalidate explicitly, as does bulk ingestion (no post_save there).
+@receiver(post_save, sender=HeartRate)
+def heart_rate_saved(sender, instance, created, using, **kwargs):
+    def invalidate():
+        versions = invalidate_heart_rates([instance.patient])
+        if created and settings.RECENT_READINGS_ENABLED:
+            # updates only bump the version: buffers refill on their next read
+            recent_readings.add([instance], versions)
+
+    # get_or_create saves inside atomic(): a version bumped before the commit
+    # could be cached with the old rows by a concurrent read
+    transaction.on_commit(invalidate, using=using)
+    mark_dirty([(instance.patient_id, instance.recorded_at)], using=using)
+    register_devices([instance.device_id])
@@ -2,12 +2,25 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import HeartRateViewSet, PatientViewSet
+from . import async_views
+from .views import (
+    HeartRateViewSet,
+    PatientPurgeViewSet,
+    PatientViewSet,
+    ResponseCacheStatsView,
+)
 
 router = DefaultRouter()
 router.register(r"patients", PatientViewSet, basename="patient")
 router.register(r"heartrates", HeartRateViewSet, basename="heartrate")
+router.register(r"purges", PatientPurgeViewSet, basename="patient-purge")
 
 urlpatterns = [
+    path("cache-stats/", ResponseCacheStatsView.as_view(), name="cache-stats"),
+    # async-native variants of the hot endpoints (best served via ASGI)
+    path("async/patients/", async_views.patient_list, name="async-patient-list"),
+    path(
+        "async/heartrates/", async_views.heart_rate_list, name="async-heartrate-list"
+    ),
     path("", include(router.urls)),
 ]
@@ -1,119 +1,573 @@
 # patients/views.py
+import datetime
+import hashlib
+import json
+
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
-from django.utils.dateparse import parse_date, parse_datetime
-from rest_framework import permissions, viewsets
-from rest_framework.exceptions import PermissionDenied
+from rest_framework import permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 
-from .models import HeartRate, Patient
+from .access import AccessMixin, invalidate_access
+from .compaction import CompactedReadings, compacted_reading, reaches_blocks
+from .conditional import HeartRateConditionalMixin, PatientConditionalMixin
+from .filters import (
+    filter_heart_rate_blocks,
+    filter_heart_rates,
+    filter_patients,
+    parse_bound,
+)
+from .ingestion import ingest_readings, preload_patients
+from .metadata import stored
+from .models import (
+    DailyReport,
+    DirtyBucket,
+    HeartRate,
+    HeartRateBlock,
+    HeartRateRollup,
+    Patient,
+    PatientPurge,
+)
+from .pagination import CountHintPagination
 from .permissions import IsOwnerOrClinicianOrReadOnly
-from .serializers import HeartRateSerializer, PatientSerializer
+from .purge import request_purge
+from .recent import recent_readings, summarize
+from .renderers import ColumnarJSONRenderer
+from .response_cache import (
+    HeartRateCacheMixin,
+    PatientCacheMixin,
+    get_cache,
+    invalidate_heart_rates,
+    invalidate_patients,
+    stats as response_cache_stats,
+)
+from .rollups import bucket_of, mark_dirty
+from .search import SEARCH_LIMIT, search_patients
+from .series import RESOLUTIONS, downsampled, latest_readings
+from .serializers import HeartRateSerializer, PatientPurgeSerializer, PatientSerializer
+from .sharding import alias_of, prepare_writes, readings, relocating
 
 
-class PatientViewSet(viewsets.ModelViewSet):
+class PatientViewSet(
+    AccessMixin, PatientCacheMixin, PatientConditionalMixin, viewsets.ModelViewSet
+):
     """
     /api/patients/patients/
-    - list: returns patients owned by curr user, unless user.is_clinician or is_staff -> returns all
+    - list: returns patients owned by curr user or shared with them through a
+      care team, unless user.is_clinician or is_staff -> returns all
     - create: sets owner=request.user
     - retrieve/update/destroy: permission enforced (owner/staff/clinician)
+    - destroy/purge: hide the patient at once and delete it with its readings
+      in the background (see patients.purge)
+    - list sends an ETag, retrieve ETag/Last-Modified; both answer conditional
+      GETs with 304
+    - list/retrieve responses are cached server-side (see response_cache)
+    - search: ranked name/external_id search backed by a search index
+    - bulk: batch create/upsert (POST) and partial update (PATCH) of patients
+    - recent: last minutes of readings, from in-memory ring buffers when possible
+    - hourly: hourly aggregates from the incrementally maintained rollups
+    - daily-reports: per-day summaries materialized by materialize_reports
     """
 
     serializer_class = PatientSerializer
-    queryset = Patient.objects.all()
+    queryset = Patient.objects.active()
+    pagination_class = CountHintPagination
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrClinicianOrReadOnly]
 
     def get_queryset(self):
-        user = self.request.user
-        qs = super().get_queryset()
-        if user.is_staff or getattr(user, "is_clinician", False):
-            # clinician/staff can see all patients; allow optional filtering
-            qs = qs
-        else:
-            qs = qs.filter(owner=user)
-        # optional filtering by external_id or place via query params
-        external_id = self.request.query_params.get("external_id")
-        place = self.request.query_params.get("place")
-        if external_id:
-            qs = qs.filter(external_id=external_id)
-        if place:
-            qs = qs.filter(place__icontains=place)
-        return qs
+        # clinician/staff can see all patients; others their accessible ones
+        qs = self.access.filter(super().get_queryset())
+        return filter_patients(qs, self.request.query_params)
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
+    def perform_destroy(self, instance):
+        # the patient is gone for API clients right away; its readings follow
+        request_purge(instance, self.request.user)
+
+    @action(detail=True, methods=["post"])
+    def purge(self, request, pk=None):
+        """
+        POST /api/patients/patients/{id}/purge/
+        Like DELETE, but answers 202 with the purge job; follow `Location`
+        (/api/patients/purges/{job id}/) for its progress.
+        """
+        job = request_purge(self.get_object(), request.user)
+        location = reverse("patient-purge-detail", args=[job.pk], request=request)
+        return Response(
+            PatientPurgeSerializer(job).data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": location},
+        )
+
+    @action(detail=False, methods=["get"])
+    def search(self, request):
+        """
+        GET /api/patients/patients/search/?q=<text>&limit=20
+        Indexed prefix/fuzzy search over names and external_id, best match first.
+        """
+        try:
+            limit = min(int(request.query_params.get("limit", SEARCH_LIMIT)), 100)
+        except ValueError:
+            limit = SEARCH_LIMIT
+        patients = search_patients(
+            self.get_queryset(), request.query_params.get("q", ""), limit
+        )
+        serializer = self.get_serializer(patients, many=True)
+        return Response({"count": len(patients), "results": serializer.data})
+
+    @action(detail=False, methods=["post", "patch"])
+    def bulk(self, request):
+        """
+        POST  /api/patients/patients/bulk/[?upsert=true]  list of patients to create;
+              with upsert, a row whose external_id matches one of the patients you
+              can edit updates that patient instead
+        PATCH /api/patients/patients/bulk/                list of {"id": ..., <fields>}
+
+        At most PATIENT_BULK_MAX_ROWS rows per request. Valid rows are saved in one
+        transaction with bulk INSERT/UPDATE statements, invalid rows are reported:
+        {"created", "updated", "unchanged", "errors", "results": [{"index", "status", ...}]}
+        with 201/200 if every row was saved, 207 if some were not, 400 if none was.
+        """
+        scope = self.get_queryset().order_by()
+        context = self.get_serializer_context()
+        if request.method == "PATCH":
+            serializer = PatientSerializer(
+                scope,
+                data=request.data,
+                many=True,
+                partial=True,
+                max_length=settings.PATIENT_BULK_MAX_ROWS,
+                context=context,
+            )
+        else:
+            if request.query_params.get("upsert", "").lower() in ("1", "true", "yes"):
+                context["upsert_queryset"] = scope
+            serializer = PatientSerializer(
+                data=request.data,
+                many=True,
+                max_length=settings.PATIENT_BULK_MAX_ROWS,
+                context=context,
+            )
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            patients = serializer.save(
+                **({} if request.method == "PATCH" else {"owner": request.user})
+            )
+        # bulk saves send no post_save signals
+        invalidate_patients(patients)
+
+        results = serializer.results
+        counts = {"created": 0, "updated": 0, "unchanged": 0, "error": 0}
+        for result in results:
+            counts[result["status"]] += 1
+        if counts["created"]:
+            # new patients of the caller
+            invalidate_access([request.user.pk])
+        if not counts["error"]:
+            code = status.HTTP_200_OK if request.method == "PATCH" else status.HTTP_201_CREATED
+        elif counts["error"] == len(results):
+            code = status.HTTP_400_BAD_REQUEST
+        else:
+            code = status.HTTP_207_MULTI_STATUS
+        return Response(
+            {
+                "created": counts["created"],
+                "updated": counts["updated"],
+                "unchanged": counts["unchanged"],
+                "errors": counts["error"],
+                "results": results,
+            },
+            status=code,
+        )
+
+    @action(detail=True, methods=["get"])
+    def recent(self, request, pk=None):
+        """
+        GET /api/patients/patients/{id}/recent/?minutes=10
+        Readings of the last `minutes` (at most a day), column-wise, with
+        count/min/max/avg. Served from the in-memory ring buffer when it covers
+        the window (`X-Readings-Source: memory`), else from the database.
+        """
+        patient = self.get_object()
+        try:
+            minutes = min(max(float(request.query_params.get("minutes", 10)), 0), 24 * 60)
+        except ValueError:
+            minutes = 10
+        since = timezone.now() - timezone.timedelta(minutes=minutes)
 
-class HeartRateViewSet(viewsets.ModelViewSet):
+        window = None
+        if settings.RECENT_READINGS_ENABLED:
+            window = recent_readings.window(patient.pk, since)
+        source = "memory"
+        if window is None:
+            source = "database"
+            rows = (
+                HeartRate.objects.using(alias_of(patient))
+                .filter(patient=patient, recorded_at__gte=since)
+                .order_by("recorded_at")
+                .values_list("recorded_at", "bpm")
+            )
+            window = [r[0].timestamp() for r in rows], [r[1] for r in rows]
+        return Response(
+            {"patient": patient.pk, **summarize(*window)},
+            headers={"X-Readings-Source": source},
+        )
+
+    @action(detail=True, methods=["get"])
+    def hourly(self, request, pk=None):
+        """
+        GET /api/patients/patients/{id}/hourly/?start=...&end=...
+        Hourly count/min/max/avg of a window (default the last 24 hours, at
+        most ROLLUP_MAX_WINDOW_DAYS) read from the rollup table. `pending` is
+        the number of those hours still waiting for recomputation after late
+        or changed readings.
+        """
+        patient = self.get_object()
+        end = parse_bound(request.query_params.get("end"), end=True) or timezone.now()
+        start = parse_bound(request.query_params.get("start")) or end - timezone.timedelta(
+            hours=24
+        )
+        start = max(start, end - timezone.timedelta(days=settings.ROLLUP_MAX_WINDOW_DAYS))
+        window = {"patient": patient, "bucket__gte": bucket_of(start), "bucket__lte": end}
+        rollups = HeartRateRollup.objects.filter(**window).values_list(
+            "bucket", "count", "bpm_min", "bpm_max", "bpm_sum"
+        )
+        return Response(
+            {
+                "patient": patient.pk,
+                "pending": DirtyBucket.objects.filter(**window)
+                .values("bucket")
+                .distinct()
+                .count(),
+                "results": [
+                    {
+                        "bucket": bucket,
+                        "count": count,
+                        "min": bpm_min,
+                        "max": bpm_max,
+                        "avg": round(bpm_sum / count, 1),
+                    }
+                    for bucket, count, bpm_min, bpm_max, bpm_sum in rollups
+                ],
+            }
+        )
+
+    @action(detail=True, methods=["get"], url_path="daily-reports")
+    def daily_reports(self, request, pk=None):
+        """
+        GET /api/patients/patients/{id}/daily-reports/?start=YYYY-MM-DD&end=YYYY-MM-DD
+        The materialized daily reports (patients.reports) of a range of UTC
+        days (default the last 7, at most DAILY_REPORT_MAX_DAYS), oldest
+        first, in one query over the (patient, day) index. Days without
+        readings, or not materialized yet, are absent.
+        """
+        patient = self.get_object()
+        end = parse_bound(request.query_params.get("end"), end=True) or timezone.now()
+        start = parse_bound(request.query_params.get("start"))
+        last = end.astimezone(datetime.timezone.utc).date()
+        if start is None:
+            first = last - datetime.timedelta(days=6)
+        else:
+            first = start.astimezone(datetime.timezone.utc).date()
+        first = max(first, last - datetime.timedelta(days=settings.DAILY_REPORT_MAX_DAYS - 1))
+        reports = DailyReport.objects.filter(patient=patient, day__gte=first, day__lte=last)
+        return Response(
+            {
+                "patient": patient.pk,
+                "results": [
+                    {
+                        "day": report.day,
+                        "count": report.count,
+                        "min": report.bpm_min,
+                        "max": report.bpm_max,
+                        "avg": round(report.bpm_sum / report.count, 1),
+                        "coverage": round(report.seconds_covered / 86400, 4),
+                        "seconds_covered": report.seconds_covered,
+                        "seconds_above": report.seconds_above,
+                        "seconds_below": report.seconds_below,
+                        "high_bpm": report.high_bpm,
+                        "low_bpm": report.low_bpm,
+                    }
+                    for report in reports
+                ],
+            }
+        )
+
+
+class HeartRateViewSet(
+    AccessMixin, HeartRateCacheMixin, HeartRateConditionalMixin, viewsets.ModelViewSet
+):
     """
     /api/patients/heartrates/
     - list: supports filtering by patient (id), start_date, end_date, device_id
-    - create: enforces that only owner / clinician / staff can create for a patient
+    - create: enforces that only owner / clinician / staff can create for a patient;
+      accepts a single reading or a list, duplicates are skipped (idempotent)
     - retrieve: available
+    - list sends an ETag (304 on match); windows ending in the past
+      are cacheable (Cache-Control max-age); list responses are cached server-side
+    - `?format=columnar` sends lists column-wise ({"bpm": [...], ...})
+    - multi: windows of many patients in one request (monitoring stations)
+    - with HEARTRATE_COMPACTION, list and multi also return compacted readings
+      (no id/created_at/metadata) of windows reaching past the compaction horizon
     """
 
     serializer_class = HeartRateSerializer
-    queryset = HeartRate.objects.select_related("patient").all()
+    queryset = HeartRate.objects.all()
+    pagination_class = CountHintPagination
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, ColumnarJSONRenderer]
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrClinicianOrReadOnly]
 
     def get_queryset(self):
-        qs = self.queryset
+        qs = filter_heart_rates(self.queryset, self.request.query_params)
+        if self.action != "list":
+            # cache invalidation after writes reads obj.patient.owner; the list
+            # only serializes patient_id, so it skips the join
+            qs = qs.select_related("patient")
+
+        # If user is not clinician/staff, restrict to readings of accessible
+        # patients: `patient_id IN (...)` on the reading table, no join
+        qs = self.access.filter(qs, "patient_id")
+        # with HEARTRATE_SHARDS, on the databases holding them (patients.sharding)
+        return readings(qs, self.get_patient_scope())
+
+    def get_patient_scope(self):
+        """Ids of the patients the queryset can reach, None for all."""
+        patient_id = self.request.query_params.get("patient", "")
+        if self.action == "list" and patient_id.isdigit():
+            return [int(patient_id)]
+        return self.access.patient_ids
+
+    def get_blocks(self):
+        """Compacted readings within the list filters, or None if the window cannot reach any."""
         params = self.request.query_params
+        if self.action != "list" or not reaches_blocks(parse_bound(params.get("start"))):
+            return None
+        blocks = filter_heart_rate_blocks(HeartRateBlock.objects.all(), params)
+        return self.access.filter(blocks, "patient_id")
 
-        patient_id = params.get("patient")
-        device_id = params.get("device_id")
-        start = params.get("start")  # ISO date or datetime
-        end = params.get("end")
-
-        if patient_id:
-            qs = qs.filter(patient_id=patient_id)
-        if device_id:
-            qs = qs.filter(device_id=device_id)
-
-        # parse start/end as datetime or date
-        if start:
-            dt = parse_datetime(start) or parse_date(start)
-            if dt:
-                # normalize date -> start of day, datetime -> direct
-                if isinstance(dt, timezone.datetime) and dt.tzinfo is None:
-                    dt = timezone.make_aware(dt, timezone.utc)
-                if isinstance(dt, timezone.date) and not isinstance(
-                    dt, timezone.datetime
-                ):
-                    dt = timezone.make_aware(
-                        timezone.datetime.combine(dt, timezone.datetime.min.time()),
-                        timezone.utc,
-                    )
-                qs = qs.filter(recorded_at__gte=dt)
-        if end:
-            dt = parse_datetime(end) or parse_date(end)
-            if dt:
-                if isinstance(dt, timezone.datetime) and dt.tzinfo is None:
-                    dt = timezone.make_aware(dt, timezone.utc)
-                if isinstance(dt, timezone.date) and not isinstance(
-                    dt, timezone.datetime
-                ):
-                    dt = timezone.make_aware(
-                        timezone.datetime.combine(dt, timezone.datetime.max.time()),
-                        timezone.utc,
+    def paginate_queryset(self, queryset):
+        blocks = self.get_blocks()
+        if blocks is not None:
+            params = self.request.query_params
+            queryset = CompactedReadings(
+                queryset,
+                blocks,
+                parse_bound(params.get("start")),
+                parse_bound(params.get("end"), end=True),
+            )
+        return super().paginate_queryset(queryset)
+
+    @action(detail=False, methods=["get"])
+    def multi(self, request):
+        """
+        GET /api/patients/heartrates/multi/?patients=1,2,3&start=...&end=...
+            [&limit=N | &resolution=minute|hour]
+        Readings of up to MULTI_PATIENT_MAX_IDS patients in one response and one
+        query, column-wise per patient: the newest `limit` readings of each
+        (at most MULTI_PATIENT_MAX_READINGS), or per-minute/hour
+        count/min/max/avg with `resolution`. The window defaults to the last
+        10 minutes. Ids you cannot access are listed in "denied".
+        """
+        params = request.query_params
+        try:
+            patient_ids = list(
+                dict.fromkeys(int(pk) for pk in params.get("patients", "").split(",") if pk)
+            )
+            limit = int(params.get("limit", settings.MULTI_PATIENT_MAX_READINGS))
+        except ValueError:
+            raise ValidationError({"detail": "patients and limit must be integers."})
+        if not patient_ids or len(patient_ids) > settings.MULTI_PATIENT_MAX_IDS:
+            raise ValidationError(
+                {"patients": f"Give 1 to {settings.MULTI_PATIENT_MAX_IDS} patient ids."}
+            )
+        resolution = params.get("resolution")
+        if resolution and resolution not in RESOLUTIONS:
+            raise ValidationError({"resolution": f"One of {', '.join(RESOLUTIONS)}."})
+        limit = min(max(limit, 1), settings.MULTI_PATIENT_MAX_READINGS)
+        end = parse_bound(params.get("end"), end=True) or timezone.now()
+        start = parse_bound(params.get("start")) or end - timezone.timedelta(minutes=10)
+
+        allowed = self.access.allowed(patient_ids)
+        if resolution:
+            # at most `limit` buckets per patient
+            start = max(start, end - RESOLUTIONS[resolution] * limit)
+            series = downsampled(allowed, start, end, resolution)
+        else:
+            series = latest_readings(allowed, start, end, limit)
+        return Response(
+            {
+                "start": start,
+                "end": end,
+                "resolution": resolution,
+                "patients": series,
+                "denied": [pk for pk in patient_ids if pk not in series],
+            }
+        )
+
+    def create(self, request, *args, **kwargs):
+        """
+        Accepts a single reading or a list of readings (batch upload).
+        Readings already stored for the same (patient, device_id, recorded_at)
+        are not inserted again, so device retries are safe. An optional
+        `Idempotency-Key` header replays the original response for that key,
+        or answers 422 if the key comes back with a different body.
+        """
+        cache_key = self.get_idempotency_cache_key(request)
+        if cache_key:
+            # the "api" cache is shared by every worker (see settings)
+            cache = get_cache()
+            digest = hashlib.sha256(
+                json.dumps(request.data, sort_keys=True, default=str).encode()
+            ).hexdigest()
+            cached = cache.get(cache_key)
+            if cached is not None:
+                status_code, data, body = cached
+                if body != digest:
+                    return Response(
+                        {"detail": "Idempotency-Key reused with a different request body."},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY,
                     )
-                qs = qs.filter(recorded_at__lte=dt)
+                return Response(
+                    data, status=status_code, headers={"Idempotent-Replayed": "true"}
+                )
 
-        # If user is not clinician/staff, restrict to heart rates of patients they own
-        user = self.request.user
-        if not (user.is_staff or getattr(user, "is_clinician", False)):
-            qs = qs.filter(patient__owner=user)
+        if isinstance(request.data, list):
+            response = self.create_many(request)
+        else:
+            response = self.create_one(request)
 
-        return qs
+        if cache_key and status.is_success(response.status_code):
+            cache.set(
+                cache_key,
+                (response.status_code, response.data, digest),
+                settings.IDEMPOTENCY_KEY_TTL,
+            )
+        return response
+
+    def create_one(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        created = self.perform_create(serializer)
+        headers = self.get_success_headers(serializer.data)
+        # a retried reading returns the stored row with 200 instead of 201
+        return Response(
+            serializer.data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+            headers=headers,
+        )
+
+    def create_many(self, request):
+        # resolve every referenced patient with one query instead of one per row
+        context = self.get_serializer_context()
+        context["patients"] = preload_patients(request.data)
+        serializer = self.get_serializer(
+            data=request.data, many=True, context=context
+        )
+        serializer.is_valid(raise_exception=True)
+        rows = serializer.validated_data
+        for patient in {row["patient"] for row in rows}:
+            self.check_can_add_readings(patient)
+        created, duplicates = ingest_readings(rows)
+        return Response(
+            {"created": created, "duplicates": duplicates},
+            status=status.HTTP_201_CREATED,
+        )
 
     def perform_create(self, serializer):
-        patient = serializer.validated_data.get("patient")
-        user = self.request.user
-        # If patient has an owner and it's not the user and user not clinician/staff -> deny
-        if (
-            patient.owner
-            and patient.owner != user
-            and not (user.is_staff or getattr(user, "is_clinician", False))
-        ):
+        data = serializer.validated_data
+        self.check_can_add_readings(data["patient"])
+        packed = compacted_reading(
+            data["patient"].pk, data.get("device_id"), data["recorded_at"]
+        )
+        if packed is not None:
+            serializer.instance = packed
+            return False
+        prepare_writes([data["patient"]])
+        shard = HeartRate.objects.using(alias_of(data["patient"]))
+        serializer.instance, created = shard.get_or_create(
+            patient=data["patient"],
+            device_id=data.get("device_id"),
+            recorded_at=data["recorded_at"],
+            defaults={"bpm": data["bpm"], **stored(data)},
+        )
+        return created
+
+    def perform_update(self, serializer):
+        old = serializer.instance.patient_id, serializer.instance.recorded_at
+        if "patient" in serializer.validated_data:
+            # the object check covered the current patient, not the new one
+            self.check_can_add_readings(serializer.validated_data["patient"])
+        previous = serializer.instance.patient
+        patient = serializer.validated_data.get("patient", previous)
+        # a reading moved to a patient on another shard follows it
+        with relocating(serializer.instance, patient):
+            super().perform_update(serializer)
+        if patient.pk != previous.pk:
+            # post_save only reaches the new patient's lists
+            invalidate_heart_rates([previous])
+        new = serializer.instance.patient_id, serializer.instance.recorded_at
+        if (old[0], bucket_of(old[1])) != (new[0], bucket_of(new[1])):
+            # post_save marked the new bucket; the old one lost a reading
+            mark_dirty([old])
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        # HeartRate deliberately has no post_delete signal receiver
+        invalidate_heart_rates([instance.patient])
+        mark_dirty([(instance.patient_id, instance.recorded_at)])
+
+    def check_can_add_readings(self, patient):
+        # patients without an owner accept readings from anyone; otherwise the
+        # patient must be accessible (own, shared via a care team, or clinician/staff)
+        if patient.owner_id and not self.access.allows(patient.pk):
             raise PermissionDenied(
                 "You are not allowed to add readings for this patient."
             )
-        serializer.save()
+
+    def get_idempotency_cache_key(self, request):
+        key = request.headers.get("Idempotency-Key")
+        if not key:
+            return None
+        # scoped per user so keys chosen by different devices/users never collide
+        return f"idempotency:{request.user.pk}:{key[:128]}"
+
+
+class PatientPurgeViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    /api/patients/purges/
+    Patient purge jobs and their progress. Clinicians and staff see every job,
+    other users the jobs they requested.
+    """
+
+    serializer_class = PatientPurgeSerializer
+    queryset = PatientPurge.objects.all()
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        user = self.request.user
+        qs = super().get_queryset()
+        if not (user.is_staff or getattr(user, "is_clinician", False)):
+            qs = qs.filter(requested_by=user)
+        return qs
+
+
+class ResponseCacheStatsView(APIView):
+    """
+    GET /api/patients/cache-stats/ (staff only)
+    Hit/miss counters of the server-side response cache.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+    # operator tooling, not part of the documented API
+    schema = None
+
+    def get(self, request):
+        return Response(response_cache_stats())